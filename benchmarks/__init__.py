@@ -0,0 +1,33 @@
+"""
+Benchmarks for the framing, matching, timing and I/O layers.
+
+Each module can be run on its own (`python -m benchmarks.framing`) and has a
+`suite(quick=False)` returning a list of result dicts; `python -m benchmarks`
+runs every suite and writes the results as JSON for comparison across
+commits.
+"""
+
+import time
+
+
+def percentiles(samples, points=(50, 90, 99)):
+    # Nearest-rank percentiles of a list of durations, in microseconds.
+    ordered = sorted(samples)
+    last = len(ordered) - 1
+
+    return {
+        f'p{point}_us': ordered[round(last * point / 100)] * 1e6
+        for point in points}
+
+
+def time_calls(func, count):
+    # Durations of `count` calls of `func()`.
+    clock = time.perf_counter
+    samples = []
+
+    for _ in range(count):
+        start = clock()
+        func()
+        samples.append(clock() - start)
+
+    return samples
@@ -0,0 +1,104 @@
+"""
+Runs every benchmark suite and writes the results as JSON.
+
+    python -m benchmarks [--quick] [--only framing latency ...]
+                         [--output results.json] [--compare baseline.json]
+
+`--compare` prints each measurement next to the same one in an earlier
+results file.  Measurements are the keys named as rates or times
+(`frames_per_sec`, `bytes_per_request`, `p99_us`, ...); every other key of a
+result describes its configuration.
+"""
+
+import argparse
+import datetime
+import importlib
+import json
+import platform
+import subprocess
+import sys
+
+SUITES = (
+    'framing', 'matching', 'timers', 'memory', 'latency', 'pipelining',
+    'threaded', 'simulated', 'priority', 'replay', 'bulk')
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+            text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(names, quick=False):
+    results = {}
+
+    for name in names:
+        print(f'running {name}...', file=sys.stderr)
+        module = importlib.import_module(f'benchmarks.{name}')
+        results[name] = module.suite(quick=quick)
+
+    return {
+        'commit': _commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'quick': quick,
+        'results': results,
+    }
+
+
+def _is_measurement(key):
+    return '_per_' in key or key.endswith(('_ns', '_us', '_ms'))
+
+
+def compare(baseline, current):
+    # Results of a suite are lists in a fixed order of configurations, so
+    # they are compared position by position.
+    for name, rows in current['results'].items():
+        for old, new in zip(baseline['results'].get(name, ()), rows):
+            config = ' '.join(
+                f'{key}={value}' for key, value in new.items()
+                if not _is_measurement(key))
+
+            for key, value in new.items():
+                if _is_measurement(key) and isinstance(value, float) and \
+                        isinstance(old.get(key), float) and old[key]:
+                    print(
+                        f'{name:>10} {config:<48} {key:>18} '
+                        f'{old[key]:>12.1f} {value:>12.1f} '
+                        f'{value / old[key]:>7.2f}x')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    parser.add_argument(
+        '--quick', action='store_true', help='run smaller workloads')
+    parser.add_argument(
+        '--only', nargs='+', choices=SUITES, default=SUITES,
+        metavar='SUITE', help=f'suites to run, from: {", ".join(SUITES)}')
+    parser.add_argument(
+        '--output', help='write the results to this file instead of stdout')
+    parser.add_argument(
+        '--compare', metavar='BASELINE',
+        help='compare with the results in this file')
+    args = parser.parse_args(argv)
+
+    current = run(args.only, quick=args.quick)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2)
+    elif not args.compare:
+        json.dump(current, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), current)
+
+
+if __name__ == '__main__':
+    main()
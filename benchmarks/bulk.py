@@ -0,0 +1,95 @@
+"""
+Splitting a large capture into frames in one pass with `frame_ends`, against
+pushing it through `EventMachine.receive_data` a chunk at a time.  The
+vectorized rows need NumPy.
+
+    python -m benchmarks.bulk
+"""
+
+import time
+from unittest.mock import MagicMock
+
+from serial_protocol import framing
+from serial_protocol.framing import frame_ends, iter_frames
+from serial_protocol.machine import EventMachine
+from tests.example_machine import registry
+
+
+class NullDelegate:
+
+    def event_for_data(self, data, requests):
+        return None, None
+
+
+def _capture(terminator, total_bytes):
+    frames = [b'OK A Q', b'NO B A', b'NOW A B B C', b'BAD']
+    block = b''.join(frame + terminator for frame in frames)
+    return block * (total_bytes // len(block))
+
+
+def _timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def _machine(data, terminator, chunk_size=4096):
+    machine = EventMachine(MagicMock(), NullDelegate(), terminator)
+    view = memoryview(data)
+    frames = 0
+
+    for i in range(0, len(data), chunk_size):
+        frames += len(machine.receive_data(bytes(view[i:i + chunk_size])))
+
+    return frames
+
+
+def _parse(data, terminator):
+    parse = registry.parse
+    return sum(1 for frame in iter_frames(data, terminator) if parse(frame))
+
+
+def run(method, terminator, total_bytes):
+    data = _capture(terminator, total_bytes)
+    methods = {
+        'machine': lambda: _machine(data, terminator),
+        'search': lambda: len(frame_ends(
+            data, terminator, vectorized=False)),
+        'vectorized': lambda: len(frame_ends(
+            data, terminator, vectorized=True)),
+        'frame_ends': lambda: len(frame_ends(data, terminator)),
+        'iter_frames+parse': lambda: _parse(data, terminator),
+    }
+    frames, elapsed = _timed(methods[method])
+
+    return {
+        'method': method,
+        'terminator': terminator.hex(),
+        'frames_per_sec': frames / elapsed,
+        'bytes_per_sec': len(data) / elapsed,
+    }
+
+
+def suite(quick=False):
+    total_bytes = 4 * 1024 * 1024 if quick else 64 * 1024 * 1024
+    methods = ['machine', 'search', 'frame_ends', 'iter_frames+parse']
+
+    if framing.numpy is not None:
+        methods.insert(2, 'vectorized')
+
+    return [
+        run(method, terminator, total_bytes)
+        for terminator in (b'\r', b'\r\n')
+        for method in methods]
+
+
+def main():
+    print(f'{"method":>18} {"term":>5} {"frames/s":>12} {"MB/s":>8}')
+    for r in suite():
+        print(
+            f'{r["method"]:>18} {r["terminator"]:>5} '
+            f'{r["frames_per_sec"]:>12.0f} {r["bytes_per_sec"] / 1e6:>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,10 @@
+from serial_protocol.timing import EventMinder
+
+
+class IdleEventMinder(EventMinder):
+    # Keeps timeouts queued but never fires them.  It still looks up the
+    # next deadline as a real minder would to rearm its timer, so the queue
+    # costs are counted.
+
+    def reset_timer(self):
+        self._sched.next_time()
@@ -0,0 +1,63 @@
+"""
+Frame scanning throughput of `EventMachine.receive_data`.
+
+Each frame is delivered in small chunks, the way a serial port hands over a
+long reply.  With incremental scanning the time per frame grows with the frame
+size (each byte is looked at once), so bytes/sec stays flat and frames/sec
+falls off linearly rather than quadratically.
+
+    python -m benchmarks.framing
+"""
+
+import time
+from unittest.mock import MagicMock
+
+from serial_protocol.machine import EventMachine
+
+
+class NullDelegate:
+
+    def event_for_data(self, data, requests):
+        return None, None
+
+
+def run(frame_size, chunk_size=16, total_bytes=4 * 1024 * 1024):
+    machine = EventMachine(MagicMock(), NullDelegate(), terminator=b'\r')
+    frame = b'x' * (frame_size - 1) + b'\r'
+    chunks = [
+        frame[i:i + chunk_size] for i in range(0, len(frame), chunk_size)]
+    count = max(1, total_bytes // frame_size)
+    receive = machine.receive_data
+
+    start = time.perf_counter()
+    for _ in range(count):
+        for chunk in chunks:
+            receive(chunk)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'frame_size': frame_size,
+        'chunk_size': chunk_size,
+        'frames_per_sec': count / elapsed,
+        'bytes_per_sec': count * frame_size / elapsed,
+    }
+
+
+def suite(quick=False):
+    total_bytes = 512 * 1024 if quick else 4 * 1024 * 1024
+
+    return [
+        run(frame_size, total_bytes=total_bytes)
+        for frame_size in (64, 1024, 16 * 1024, 256 * 1024)]
+
+
+def main():
+    print(f'{"frame":>8} {"chunk":>6} {"frames/s":>12} {"MB/s":>8}')
+    for r in suite():
+        print(
+            f'{r["frame_size"]:>8} {r["chunk_size"]:>6} '
+            f'{r["frames_per_sec"]:>12.0f} {r["bytes_per_sec"] / 1e6:>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
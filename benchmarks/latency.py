@@ -0,0 +1,144 @@
+"""
+Request round-trip latency through each wrapper against the ASCIIKVS
+simulator, which answers without delay, so the numbers are the wrappers' own
+overhead.
+
+- `sansio`: an EventMachine whose write feeds the simulator directly, with
+  and without `Metrics`.
+- `rx`: RxSerialProtocol on a HistoricalScheduler, fed the same way.
+- `asyncio`: AsyncIOEventMachineProtocol over a local TCP connection.
+- `threaded`: a SelectorLoop port on a pty.
+
+    python -m benchmarks.latency
+"""
+
+import asyncio
+import os
+import time
+
+from rx.concurrency.historicalscheduler import HistoricalScheduler
+
+from serial_protocol.asyncio import AsyncIOEventMachineProtocol
+from serial_protocol.machine import EventMachine
+from serial_protocol.metrics import Metrics
+from serial_protocol.protocol import ProtocolDelegate
+from serial_protocol.rx import RxSerialProtocol
+from serial_protocol.threaded import SelectorLoop
+from tests.example_machine import ASCIIKVS, event_from_data, GET
+
+from . import percentiles, time_calls
+from .common import IdleEventMinder
+from .pipelining import PipelinedSimulatorProtocol
+from .threaded import SimulatedDevices
+
+
+class LoopbackDelegate(ProtocolDelegate):
+
+    def __init__(self, **options):
+        self.simulator = ASCIIKVS()
+        self.machine = EventMachine(IdleEventMinder(), self, b'\r', **options)
+
+    def write(self, data):
+        self.machine.receive_data(self.simulator.feed(data))
+
+    def event_for_data(self, data, requests):
+        return event_from_data(data, requests)
+
+
+def _result(backend, samples):
+    return dict(
+        backend=backend,
+        requests=len(samples),
+        requests_per_sec=len(samples) / sum(samples),
+        **percentiles(samples))
+
+
+def run_sansio(count, metrics=None):
+    delegate = LoopbackDelegate(metrics=metrics)
+    send = delegate.machine.send
+    write = delegate.write
+    samples = time_calls(lambda: send(GET(b'A'), write), count)
+
+    return _result('sansio+metrics' if metrics else 'sansio', samples)
+
+
+def run_rx(count):
+    simulator = ASCIIKVS()
+    protocol = RxSerialProtocol(event_from_data, HistoricalScheduler(), b'\r')
+
+    def write(data):
+        protocol.received_data(simulator.feed(data))
+
+    def request():
+        protocol.send_request(GET(b'A'), write).subscribe(lambda _: None)
+
+    return _result('rx', time_calls(request, count))
+
+
+async def _run_asyncio(count):
+    loop = asyncio.get_event_loop()
+    server = await loop.create_server(
+        lambda: PipelinedSimulatorProtocol(0), 'localhost', 0)
+    port = server.sockets[0].getsockname()[1]
+    transport, client = await loop.create_connection(
+        AsyncIOEventMachineProtocol.factory(event_from_data, b'\r'),
+        'localhost', port)
+
+    clock = time.perf_counter
+    samples = []
+
+    for _ in range(count):
+        start = clock()
+        await client.send_request(GET(b'A'))
+        samples.append(clock() - start)
+
+    transport.close()
+    server.close()
+    await server.wait_closed()
+    return samples
+
+
+def run_asyncio(count):
+    return _result('asyncio', asyncio.run(_run_asyncio(count)))
+
+
+def run_threaded(count):
+    devices = SimulatedDevices()
+    slave = devices.open()
+    devices.thread.start()
+    loop = SelectorLoop()
+    protocol = loop.open(slave, event_from_data, b'\r')
+
+    samples = time_calls(
+        lambda: protocol.send_request(GET(b'A')).result(), count)
+
+    loop.close()
+    os.close(slave)
+    os.close(devices.masters[0])
+    return _result('threaded', samples)
+
+
+def suite(quick=False):
+    count = 1000 if quick else 10000
+
+    return [
+        run_sansio(count * 10),
+        run_sansio(count * 10, Metrics()),
+        run_rx(count * 10),
+        run_asyncio(count),
+        run_threaded(count),
+    ]
+
+
+def main():
+    print(
+        f'{"backend":>14} {"req/s":>10} {"p50 us":>8} {"p90 us":>8} '
+        f'{"p99 us":>8}')
+    for r in suite():
+        print(
+            f'{r["backend"]:>14} {r["requests_per_sec"]:>10.0f} '
+            f'{r["p50_us"]:>8.1f} {r["p90_us"]:>8.1f} {r["p99_us"]:>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
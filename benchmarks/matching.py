@@ -0,0 +1,70 @@
+"""
+Parsing and request pairing throughput of an EventRegistry, against the
+hand-written parser it replaces: trying each event class's `from_bytes` in
+turn and catching the ValueError of those that do not match.
+
+    python -m benchmarks.matching
+"""
+
+import time
+
+from tests.example_machine import registry, GET, \
+    NOWResponse, OKResponse, NOResponse, BADResponse
+
+
+FRAMES = [b'OK A Q\r', b'NO B A\r', b'NOW A B B C\r', b'BAD\r', b'junk\r']
+
+
+def baseline(data, requests):
+    # The example parser as it was written before the registry.
+    request = None
+
+    for klass in (NOWResponse, OKResponse, NOResponse, BADResponse):
+        try:
+            instance = klass.from_bytes(data)
+        except ValueError:
+            continue
+
+        if not isinstance(instance, NOWResponse) and len(requests):
+            request = list(requests)[0]
+
+        return instance, request
+    else:
+        raise ValueError()
+
+
+def run(parser, name, count=200000):
+    requests = [GET(b'A')]
+    frames = FRAMES * (count // len(FRAMES))
+
+    start = time.perf_counter()
+    for frame in frames:
+        try:
+            parser(frame, requests)
+        except ValueError:
+            pass  # The baseline's answer to an unknown frame.
+    elapsed = time.perf_counter() - start
+
+    return {
+        'parser': name,
+        'frames_per_sec': len(frames) / elapsed,
+    }
+
+
+def suite(quick=False):
+    count = 20000 if quick else 200000
+
+    return [
+        run(baseline, 'baseline', count),
+        run(registry, 'registry', count),
+    ]
+
+
+def main():
+    print(f'{"parser":>12} {"frames/s":>12}')
+    for r in suite():
+        print(f'{r["parser"]:>12} {r["frames_per_sec"]:>12.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""
+Memory per outstanding request, as allocated while sending requests that are
+never answered: the request itself, the machine's bookkeeping, its timeout
+and, for the asyncio wrapper, its future.  Requests are the example GET, an
+`Event` with a `__dict__`, or the same request as a `SlottedEvent`.
+
+The `baseline` rows keep the machine's original bookkeeping for comparison:
+waiting requests in an `OrderedDict`, and a timer per request holding its own
+bound method and keyword arguments.
+
+    python -m benchmarks.memory
+"""
+
+import asyncio
+from collections import OrderedDict
+import tracemalloc
+
+from serial_protocol.asyncio import AsyncIOEventMachineProtocol
+from serial_protocol.events import SlottedEvent
+from serial_protocol.machine import EventMachine
+from serial_protocol.protocol import ProtocolDelegate
+from serial_protocol.timing import Scheduler, TimerHeap
+from tests.example_machine import GET
+
+from .common import IdleEventMinder
+
+
+class SlottedGET(SlottedEvent):
+    fields = ('slot',)
+
+    def to_bytes(self):
+        return b'GET %b\r' % self.slot
+
+
+def slotted_get(slot):
+    request = SlottedGET(slot)
+    request.timeout = 0.1
+    return request
+
+
+class BaselineMachine(EventMachine):
+
+    def __init__(self, *args, **options):
+        super().__init__(*args, **options)
+        self.waiting_requests = OrderedDict()
+
+    def _track(self, request):
+        handle = None
+
+        if request.timeout is not None:
+            handle = self.event_minder.notify_after(
+                delay=request.timeout,
+                callable=self._timed_out,
+                request=request)
+
+        self.waiting_requests[request] = handle
+
+
+class NullTransport:
+
+    def write(self, data):
+        pass
+
+
+def _measure(send, count, make_request=GET):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+
+    for _ in range(count):
+        send(make_request(b'A'))
+
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / count
+
+
+def run_machine(queue_class, in_flight, count, make_request=GET,
+                machine_class=EventMachine):
+    # `in_flight` requests wait for a response; the rest are pending.
+    machine = machine_class(
+        IdleEventMinder(queue_class=queue_class), ProtocolDelegate(), b'\r',
+        max_in_flight=in_flight)
+    write = NullTransport().write
+
+    return {
+        'wrapper': 'baseline' if machine_class is BaselineMachine
+        else 'sansio',
+        'request': 'Event' if make_request is GET else 'SlottedEvent',
+        'queue': queue_class.__name__,
+        'state': 'waiting' if in_flight >= count else 'pending',
+        'bytes_per_request': _measure(
+            lambda request: machine.send(request, write), count,
+            make_request),
+    }
+
+
+def run_asyncio(count, make_request=GET):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    protocol = AsyncIOEventMachineProtocol(
+        None, b'\r', loop=loop, max_in_flight=count)
+    protocol.connection_made(NullTransport())
+
+    result = {
+        'wrapper': 'asyncio',
+        'request': 'Event' if make_request is GET else 'SlottedEvent',
+        'queue': 'Scheduler',
+        'state': 'waiting',
+        'bytes_per_request': _measure(
+            protocol.send_request, count, make_request),
+    }
+
+    asyncio.set_event_loop(None)
+    loop.close()
+    return result
+
+
+def suite(quick=False):
+    count = 10000 if quick else 100000
+
+    return [
+        run_machine(Scheduler, count, count, machine_class=BaselineMachine),
+        run_machine(Scheduler, count, count),
+        run_machine(TimerHeap, count, count),
+        run_machine(TimerHeap, 1, count),
+        run_asyncio(count),
+        run_machine(TimerHeap, count, count, slotted_get),
+        run_machine(TimerHeap, 1, count, slotted_get),
+        run_asyncio(count, slotted_get),
+    ]
+
+
+def main():
+    print(
+        f'{"wrapper":>8} {"request":>12} {"queue":>10} {"state":>8} '
+        f'{"bytes/req":>10}')
+    for r in suite():
+        print(
+            f'{r["wrapper"]:>8} {r["request"]:>12} {r["queue"]:>10} '
+            f'{r["state"]:>8} {r["bytes_per_request"]:>10.0f}')
+
+
+if __name__ == '__main__':
+    main()
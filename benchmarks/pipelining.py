@@ -0,0 +1,90 @@
+"""
+Request throughput against the ASCIIKVS simulator with `max_in_flight`.
+
+The simulator answers every command after a fixed latency and accepts queued
+commands, so throughput should scale with the in-flight window until the
+window covers the latency.
+
+    python -m benchmarks.pipelining
+"""
+
+import asyncio
+import time
+
+from serial_protocol.asyncio import AsyncIOEventMachineProtocol
+from tests.example_machine import ASCIIKVS, event_from_data, GET
+
+
+class PipelinedSimulatorProtocol(asyncio.Protocol):
+    # Unlike the simulator in the tests, several commands may arrive in one
+    # read when requests are pipelined.
+
+    def __init__(self, latency):
+        self.simulator = ASCIIKVS()
+        self.latency = latency
+        self.buffer = b''
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        *commands, self.buffer = (self.buffer + data).split(b'\r')
+        loop = asyncio.get_event_loop()
+
+        for command in commands:
+            loop.call_later(
+                self.latency,
+                self.transport.write,
+                self.simulator.feed(command + b'\r'))
+
+
+async def _run(latency, max_in_flight, count):
+    loop = asyncio.get_event_loop()
+    server = await loop.create_server(
+        lambda: PipelinedSimulatorProtocol(latency), 'localhost', 0)
+    port = server.sockets[0].getsockname()[1]
+    factory = AsyncIOEventMachineProtocol.factory(
+        event_from_data, b'\r', max_in_flight=max_in_flight)
+    transport, client = await loop.create_connection(
+        factory, 'localhost', port)
+
+    start = time.perf_counter()
+    futures = [client.send_request(GET(b'A')) for _ in range(count)]
+    await asyncio.gather(*futures)
+    elapsed = time.perf_counter() - start
+
+    transport.close()
+    server.close()
+    await server.wait_closed()
+    return elapsed
+
+
+def run(latency, max_in_flight, count=200):
+    elapsed = asyncio.run(_run(latency, max_in_flight, count))
+
+    return {
+        'latency': latency,
+        'max_in_flight': max_in_flight,
+        'requests_per_sec': count / elapsed,
+    }
+
+
+def suite(quick=False):
+    count = 50 if quick else 200
+
+    return [
+        run(latency, max_in_flight, count)
+        for latency in (0.0, 0.001, 0.005)
+        for max_in_flight in (1, 4, 16)]
+
+
+def main():
+    print(f'{"latency":>8} {"window":>6} {"req/s":>10}')
+    for r in suite():
+        print(
+                f'{r["latency"] * 1000:>6.1f}ms {r["max_in_flight"]:>6} '
+                f'{r["requests_per_sec"]:>10.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+Time from send to response for urgent commands queued behind a backlog of
+background polls, with and without a higher priority for the urgent ones.
+
+Runs in virtual time: the device answers one request per millisecond, a
+backlog of polls is queued up front, and an urgent command is sent every
+10ms.
+
+    python -m benchmarks.priority
+"""
+
+from serial_protocol.machine import EventMachine
+from serial_protocol.metrics import Metrics
+from serial_protocol.protocol import ProtocolDelegate
+from tests.example_machine import ASCIIKVS, event_from_data, GET, SET
+
+from . import percentiles
+from .common import IdleEventMinder
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class Urgent(SET):
+    priority = -1
+
+
+class Device(ProtocolDelegate):
+
+    def __init__(self, clock, metrics):
+        self.simulator = ASCIIKVS()
+        self.clock = clock
+        self.machine = EventMachine(
+            IdleEventMinder(timefunc=clock), self, b'\r', metrics=metrics)
+        self.written = []
+        self.sent = {}
+        self.turnaround = {'urgent': [], 'background': []}
+
+    def send(self, request):
+        self.sent[request] = self.clock()
+        self.machine.send(request, self.written.append)
+
+    def respond(self):
+        self.machine.receive_data(self.simulator.feed(self.written.pop(0)))
+
+    def event_for_data(self, data, requests):
+        return event_from_data(data, requests)
+
+    def request_completed(self, request, response):
+        kind = 'urgent' if isinstance(request, SET) else 'background'
+        self.turnaround[kind].append(
+            self.clock() - self.sent.pop(request))
+
+
+def run(prioritized, backlog=1000, urgent_every=10):
+    clock = Clock()
+    metrics = Metrics(timefunc=clock)
+    device = Device(clock, metrics)
+    urgent_class = Urgent if prioritized else SET
+
+    for _ in range(backlog):
+        device.send(GET(b'A'))
+
+    step = 0
+
+    while device.written:
+        if step % urgent_every == 0 and step < backlog:
+            device.send(urgent_class(b'A', b'U'))
+
+        clock.now += 0.001
+        device.respond()
+        step += 1
+
+    urgent = percentiles(device.turnaround['urgent'])
+
+    return {
+        'prioritized': prioritized,
+        'urgent_p50_ms': urgent['p50_us'] / 1000,
+        'urgent_p99_ms': urgent['p99_us'] / 1000,
+        'background_p50_ms': percentiles(
+            device.turnaround['background'])['p50_us'] / 1000,
+        'queue_wait_p99_ms': {
+            priority: snapshot['p99'] * 1000
+            for priority, snapshot in metrics.snapshot()['queue_wait'].items()
+        },
+    }
+
+
+def suite(quick=False):
+    backlog = 200 if quick else 1000
+
+    return [run(False, backlog), run(True, backlog)]
+
+
+def main():
+    print(
+        f'{"prioritized":>11} {"urgent p50":>10} {"urgent p99":>10} '
+        f'{"polls p50":>10}')
+    for r in suite():
+        print(
+            f'{str(r["prioritized"]):>11} {r["urgent_p50_ms"]:>8.1f}ms '
+            f'{r["urgent_p99_ms"]:>8.1f}ms {r["background_p50_ms"]:>8.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Parser throughput on recorded traffic: a capture of a polled device is
+replayed as fast as possible into an EventMachine parsing with the example
+registry.  Replies arrive in the uneven chunks a serial port delivers.
+
+    python -m benchmarks.replay [capture-file]
+
+With a capture file, replays that instead of the synthetic one.
+"""
+
+import os
+import random
+import sys
+import tempfile
+
+from serial_protocol.capture import CaptureRecorder, CaptureReplay, RX, TX
+from serial_protocol.machine import EventMachine
+from tests.example_machine import ASCIIKVS, registry
+
+
+class ParsingDelegate:
+
+    def event_for_data(self, data, requests):
+        return registry(data, requests)
+
+    def event_received(self, event):
+        pass
+
+
+class ReplayEventMinder:
+
+    def notify_after(self, delay, callable, *args):
+        pass
+
+    def remove(self, event):
+        pass
+
+
+def record(path, exchanges, max_chunk, seed=0):
+    # A command every millisecond, with a broadcast after every tenth reply.
+    device = ASCIIKVS()
+    rand = random.Random(seed)
+    now = [0.0]
+
+    with CaptureRecorder(path, timefunc=lambda: now[0]) as recorder:
+        for i in range(exchanges):
+            now[0] = i / 1000
+            slot = rand.choice((b'A', b'B'))
+            command = b'SET %b %c\r' % (slot, rand.randint(65, 90))
+            reply = device.feed(command)
+
+            if i % 10 == 0:
+                reply += device.broadcast()
+
+            recorder.record(TX, command)
+            offset = 0
+
+            while offset < len(reply):
+                size = rand.randint(1, max_chunk)
+                recorder.record(RX, reply[offset:offset + size])
+                offset += size
+
+
+def run(path, label):
+    machine = EventMachine(ReplayEventMinder(), ParsingDelegate(), b'\r')
+
+    with CaptureReplay(path) as replay:
+        result = replay.replay(machine)
+
+    elapsed = result['elapsed']
+
+    return {
+        'capture': label,
+        'chunks': result['chunks'],
+        'frames_per_sec': result['frames'] / elapsed,
+        'bytes_per_sec': result['bytes'] / elapsed,
+    }
+
+
+def suite(quick=False):
+    exchanges = 10000 if quick else 100000
+    results = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        for max_chunk in (4, 64):
+            path = os.path.join(directory, f'chunks-{max_chunk}.cap')
+            record(path, exchanges, max_chunk)
+            results.append(run(path, f'chunks<={max_chunk}'))
+
+    return results
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    results = [run(argv[0], argv[0])] if argv else suite()
+
+    print(f'{"capture":>16} {"chunks":>8} {"frames/s":>12} {"MB/s":>8}')
+    for r in results:
+        print(
+            f'{r["capture"]:>16} {r["chunks"]:>8} '
+            f'{r["frames_per_sec"]:>12.0f} {r["bytes_per_sec"] / 1e6:>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Many simulated devices on one DeviceManager, with realistic line timing and
+byte loss, to see throughput and timeouts at scale without hardware.
+
+Each device is an ASCIIKVS behind a 115200 baud line with 2ms +-1ms
+response latency and fragmented replies.  Every device is polled
+continuously, one request at a time, for `duration` seconds.
+
+    python -m benchmarks.simulated
+"""
+
+import asyncio
+import functools
+import time
+
+from serial_protocol.asyncio import RequestTimeout
+from serial_protocol.manager import DeviceManager
+from serial_protocol.simulation import SimulatedDevice, \
+    create_simulated_connection
+from tests.example_machine import ASCIIKVS, GET, registry
+
+
+async def _poll(manager, device_id, stop, counts):
+    while time.perf_counter() < stop:
+        try:
+            await manager.send(device_id, GET(b'A'))
+        except RequestTimeout:
+            counts['timeouts'] += 1
+        else:
+            counts['responses'] += 1
+
+
+async def _run(devices, drop_rate, duration):
+    # Lost bytes garble frames; the registry skips those.
+    manager = DeviceManager(registry, b'\r')
+
+    for device_id in range(devices):
+        device = SimulatedDevice(
+            ASCIIKVS(), latency=0.002, jitter=0.001, baud=115200,
+            max_chunk=4, drop_rate=drop_rate, seed=device_id)
+        manager.add_device(device_id, functools.partial(
+            create_simulated_connection, device=device))
+
+    await manager.wait_connected()
+    counts = {'responses': 0, 'timeouts': 0}
+    stop = time.perf_counter() + duration
+    await asyncio.gather(*(
+        _poll(manager, device_id, stop, counts)
+        for device_id in range(devices)))
+    manager.close()
+    return counts
+
+
+def run(devices, drop_rate, duration=1.0):
+    counts = asyncio.run(_run(devices, drop_rate, duration))
+
+    return {
+        'devices': devices,
+        'drop_rate': drop_rate,
+        'responses_per_sec': counts['responses'] / duration,
+        'timeouts_per_sec': counts['timeouts'] / duration,
+    }
+
+
+def suite(quick=False):
+    duration = 0.25 if quick else 1.0
+
+    return [
+        run(devices, drop_rate, duration)
+        for devices in (1, 100, 1000)
+        for drop_rate in (0.0, 0.001)]
+
+
+def main():
+    print(f'{"devices":>7} {"drop":>6} {"resp/s":>10} {"timeouts/s":>10}')
+    for r in suite():
+        print(
+            f'{r["devices"]:>7} {r["drop_rate"]:>6} '
+            f'{r["responses_per_sec"]:>10.0f} '
+            f'{r["timeouts_per_sec"]:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
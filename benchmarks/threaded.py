@@ -0,0 +1,96 @@
+"""
+Request throughput of one SelectorLoop driving 1, 10 and 100 ports.
+
+Each port is a pseudo-terminal; the ASCIIKVS simulator answers on the master
+side from a single thread, and the client opens the slave side in raw mode.
+
+    python -m benchmarks.threaded
+"""
+
+import os
+import pty
+import selectors
+import threading
+import time
+import tty
+
+from serial_protocol.threaded import SelectorLoop
+from tests.example_machine import ASCIIKVS, event_from_data, GET
+
+
+class SimulatedDevices:
+    # Serves every pty master from one thread.
+
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.masters = []
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def open(self):
+        master, slave = pty.openpty()
+        tty.setraw(slave)
+        self.masters.append(master)
+        self.selector.register(master, selectors.EVENT_READ, [ASCIIKVS(), b''])
+        return slave
+
+    def run(self):
+        while self.selector.get_map():
+            for key, _ in self.selector.select():
+                try:
+                    data = os.read(key.fd, 4096)
+                except OSError:
+                    self.selector.unregister(key.fd)
+                    continue
+
+                simulator, buffer = key.data
+                *commands, key.data[1] = (buffer + data).split(b'\r')
+                os.write(key.fd, b''.join(
+                    simulator.feed(command + b'\r') for command in commands))
+
+
+def run(ports, count=200):
+    devices = SimulatedDevices()
+    slaves = [devices.open() for _ in range(ports)]
+    devices.thread.start()
+    loop = SelectorLoop()
+    protocols = [loop.open(slave, event_from_data, b'\r') for slave in slaves]
+
+    start = time.perf_counter()
+    futures = [
+        protocol.send_request(GET(b'A'))
+        for _ in range(count)
+        for protocol in protocols]
+
+    for f in futures:
+        f.result()
+
+    elapsed = time.perf_counter() - start
+
+    loop.close()
+
+    for fd in slaves + devices.masters:
+        os.close(fd)
+
+    return {
+        'ports': ports,
+        'requests': len(futures),
+        'requests_per_sec': len(futures) / elapsed,
+    }
+
+
+def suite(quick=False):
+    count = 20 if quick else 200
+
+    return [run(ports, count) for ports in (1, 10, 100)]
+
+
+def main():
+    print(f'{"ports":>5} {"requests":>8} {"req/s":>10}')
+    for r in suite():
+        print(
+            f'{r["ports"]:>5} {r["requests"]:>8} '
+            f'{r["requests_per_sec"]:>10.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Timer churn: the cost of arming and cancelling one timeout per request with
+many timeouts outstanding, for each EventMinder queue.
+
+    python -m benchmarks.timers
+"""
+
+import time
+
+from serial_protocol.timing import Scheduler, TimerHeap
+
+from .common import IdleEventMinder
+
+
+def _noop():
+    pass
+
+
+def run(queue_class, outstanding, count=100000):
+    minder = IdleEventMinder(queue_class=queue_class)
+    # Scheduler.cancel is linear in the queue length; keep big runs short.
+    count = max(1000, count // (1 + outstanding // 1000))
+    backlog = [
+        minder.notify_after(10.0 + i, _noop) for i in range(outstanding)]
+
+    start = time.perf_counter()
+    for _ in range(count):
+        minder.remove(minder.notify_after(1.0, _noop))
+    elapsed = time.perf_counter() - start
+
+    for event in backlog:
+        minder.remove(event)
+
+    return {
+        'queue': queue_class.__name__,
+        'outstanding': outstanding,
+        'ns_per_cycle': elapsed / count * 1e9,
+    }
+
+
+def suite(quick=False):
+    count = 10000 if quick else 100000
+
+    return [
+        run(queue_class, outstanding, count)
+        for queue_class in (Scheduler, TimerHeap)
+        for outstanding in (0, 1000, 10000)]
+
+
+def main():
+    print(f'{"queue":>10} {"outstanding":>11} {"ns/cycle":>10}')
+    for r in suite():
+        print(
+            f'{r["queue"]:>10} {r["outstanding"]:>11} '
+            f'{r["ns_per_cycle"]:>10.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,19 @@
 import asyncio
+from collections import deque
 import logging
 
 from .timing import EventMinder
 from .machine import EventMachine
 from .protocol import ProtocolDelegate
+from .subscriptions import Subscription, SubscriptionRouter
 
 logger = logging.getLogger(__name__)
 
+# Event queue overflow policies.
+BLOCK = 'block'
+DROP_OLDEST = 'drop_oldest'
+DROP_NEWEST = 'drop_newest'
+
 
 class RequestTimeout(asyncio.TimeoutError):
     
@@ -16,49 +23,195 @@ class RequestTimeout(asyncio.TimeoutError):
 
 class AsyncIOEventMinder(EventMinder):
     
-    def __init__(self, loop=None):
+    def __init__(self, loop=None, **options):
         if loop is None:
             loop = asyncio.get_event_loop()
 
-        super().__init__()
+        super().__init__(**options)
         self.loop = loop
         self._timer_handle = None
+        self._timer_deadline = None
+        self.timers_created = 0
 
     def reset_timer(self):
+        # Only rearm when the earliest deadline moves earlier.  A timer that
+        # fires early, or for an event that has since been removed, finds
+        # nothing to run and rearms for whatever is next.
+        deadline = self._sched.next_time()
+
+        if deadline is None:
+            return
+
         if self._timer_handle is not None:
+            if self._timer_deadline <= deadline:
+                return
             self._timer_handle.cancel()
-            self._timer_handle = None
-        
-        delay = self._next_event_delay()
 
-        if delay is not None:
-            self._timer_handle = self.loop.call_later(
-                delay, self.run)
+        self._timer_deadline = deadline
+        self._timer_handle = self.loop.call_later(
+            deadline - self._sched.timefunc(), self._timer_fired)
+        self.timers_created += 1
+
+    def _timer_fired(self):
+        self._timer_handle = None
+        self.run()
+        self.reset_timer()
+
+
+class AsyncIOSubscription(Subscription):
+    """An async iterator over a subscription's events."""
+
+    def __init__(self, router, classes, maxsize=256):
+        super().__init__(router, classes, maxsize)
+        self._waiter = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self._events:
+            if self.closed:
+                raise StopAsyncIteration
+
+            self._waiter = asyncio.get_event_loop().create_future()
+
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+
+        return self._events.popleft()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def _wake(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+
+class _EventQueue(asyncio.Queue):
+    # Calls `taken()` after each event is taken, however it is taken.
+
+    def __init__(self, taken):
+        super().__init__()
+        self._taken = taken
+
+    def get_nowait(self):
+        event = super().get_nowait()
+        self._taken()
+        return event
 
 
 class AsyncIOEventMachineProtocol(asyncio.Protocol):
 
     @classmethod
-    def factory(cls, event_parser, terminator, *, loop=None):
-        return lambda: cls(event_parser, terminator, loop=loop)
+    def factory(cls, event_parser, terminator, *, loop=None, **options):
+        return lambda: cls(event_parser, terminator, loop=loop, **options)
 
-    def __init__(self, event_parser, terminator, *, loop=None):
+    def __init__(self, event_parser, terminator, *, loop=None,
+                 event_minder=None, max_events=None, overflow=BLOCK,
+                 cache=None, **options):
+        if loop is None:
+            loop = asyncio.get_event_loop()
+
+        if event_minder is None:
+            event_minder = AsyncIOEventMinder(loop=loop)
+
+        if overflow not in (BLOCK, DROP_OLDEST, DROP_NEWEST):
+            raise ValueError(f'unknown overflow policy {overflow!r}')
+
+        self._loop = loop
         self._transport = None
         self.futures = {}
-        self.event_queue = asyncio.Queue()
+        self.event_queue = _EventQueue(self._event_taken)
+        self.max_events = max_events
+        self.overflow = overflow
+        self.dropped_events = 0
+        self.cache = cache
+        self._subscriptions = SubscriptionRouter()
+        self._reading_paused = False
+        self._writing_paused = False
+        self._held_requests = deque()
+        self._held_keys = set()
+        self._flush_handle = None
+        self._drain_waiters = []
         self.event_parser = event_parser
         self.machine = EventMachine(
-            AsyncIOEventMinder(loop=loop),
+            event_minder,
             self,
-            terminator)
+            terminator,
+            **options)
+        self.metrics = self.machine.metrics
 
     # - asyncio.Protocol methods -
     
     def connection_made(self, transport):
         self._transport = transport
 
+    def connection_lost(self, exc):
+        if exc is None:
+            exc = ConnectionResetError('Connection lost')
+
+        waiters, self._drain_waiters = self._drain_waiters, []
+
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_exception(exc)
+
+        # Nothing waiting, pending or held back will be answered now.
+        self.machine.abandon_requests()
+        self._held_requests.clear()
+        self._held_keys.clear()
+
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        futures, self.futures = self.futures, {}
+
+        for f in futures.values():
+            if not f.done():
+                f.set_exception(exc)
+
+        # Subscribers finish their buffered events, then stop.
+        self._subscriptions.close_all()
+
     def data_received(self, data):
         self.machine.receive_data(data)
+
+    def pause_writing(self):
+        self._writing_paused = True
+
+    def resume_writing(self):
+        self._writing_paused = False
+        self._flush_held()
+
+    def _flush_held(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        if self._writing_paused:
+            return
+
+        if self._held_requests:
+            # Queued together, so they are coalesced and batched as if sent
+            # with send_requests.
+            held = list(self._held_requests)
+            self._held_requests.clear()
+            self._held_keys.clear()
+            self.machine.send_many(held, self._transport.write)
+
+        if not (self._writing_paused or self._held_requests):
+            waiters, self._drain_waiters = self._drain_waiters, []
+
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
     
     # - ProtocolDelegate methods -
 
@@ -71,9 +224,41 @@ class AsyncIOEventMachineProtocol(asyncio.Protocol):
             f.set_exception(RequestTimeout(request))
 
     def event_received(self, event):
-        self.event_queue.put_nowait(event)
+        if self.cache is not None:
+            self.cache.event_received(event)
+
+        if self._subscriptions.route(event):
+            return
+
+        self._queue_event(event)
+
+    def _queue_event(self, item):
+        queue = self.event_queue
+
+        if self.max_events is not None and \
+                queue.qsize() >= self.max_events:
+            if self.overflow == DROP_NEWEST:
+                self.dropped_events += 1
+                return
+
+            if self.overflow == DROP_OLDEST:
+                queue.get_nowait()
+                self.dropped_events += 1
+
+        queue.put_nowait(item)
+
+        if self.overflow == BLOCK and self.max_events is not None and \
+                queue.qsize() >= self.max_events and \
+                not self._reading_paused:
+            # Events already read still get queued; stop reading more until
+            # the consumer catches up.
+            self._reading_paused = True
+            self._transport.pause_reading()
 
     def request_completed(self, request, response):
+        if self.cache is not None:
+            self.cache.response_received(request, response)
+
         try:
             f = self.futures.pop(request)
         except KeyError:  # pragma: no cover
@@ -87,8 +272,158 @@ class AsyncIOEventMachineProtocol(asyncio.Protocol):
     # - asyncio interface -
 
     def send_request(self, request):
-        self.machine.send(request, self._transport.write)
+        cached = self._cached_response(request)
+
+        if cached is not None:
+            return cached
+
+        if self._writing_paused or self._held_requests or \
+                self.machine.coalesce_writes:
+            self._hold([request])
+        else:
+            self.machine.send(request, self._transport.write)
         return self.futures.setdefault(request, asyncio.Future())
 
-    def get_latest_event(self):
-        return self.event_queue.get()
+    def send_requests(self, requests):
+        requests = list(requests)
+        futures = {}
+
+        if self.cache is not None:
+            for request in requests:
+                cached = self._cached_response(request)
+                if cached is not None:
+                    futures[request] = cached
+
+        to_send = [r for r in requests if r not in futures]
+
+        if self._writing_paused or self._held_requests or \
+                self.machine.coalesce_writes:
+            self._hold(to_send)
+        else:
+            self.machine.send_many(to_send, self._transport.write)
+
+        for request in to_send:
+            futures[request] = self.futures.setdefault(
+                request, asyncio.Future())
+
+        return [futures[request] for request in requests]
+
+    def _hold(self, requests):
+        # Keys are checked now, as an unpaused send would, so one clash
+        # cannot sink the whole held batch in resume_writing.
+        keys = set()
+
+        for request in requests:
+            key = self.machine._check_key(request)
+
+            if key is not None:
+                if key in keys or key in self._held_keys:
+                    raise ValueError(
+                        f'correlation key {key!r} is already in use')
+                keys.add(key)
+
+        self._held_keys.update(keys)
+        self._held_requests.extend(requests)
+
+        # With coalesce_writes, everything sent in this iteration of the
+        # loop goes out in one write.
+        if self._flush_handle is None and not self._writing_paused:
+            self._flush_handle = self._loop.call_soon(self._flush_held)
+
+    def _cached_response(self, request):
+        # A completed future for a request answered from the cache.
+        if self.cache is None:
+            return None
+
+        response = self.cache.lookup(request)
+
+        if response is None:
+            return None
+
+        f = asyncio.Future()
+        f.set_result(response)
+        return f
+
+    async def drain(self):
+        if not (self._writing_paused or self._held_requests):
+            return
+
+        waiter = asyncio.Future()
+        self._drain_waiters.append(waiter)
+        await waiter
+
+    def subscribe(self, *event_classes, maxsize=256):
+        """
+        Iterate with `async for` over received events of `event_classes`
+        (all events when none are given).  Events taken by a subscription
+        are not put on `event_queue`.
+        """
+        return self._subscriptions.add(AsyncIOSubscription(
+            self._subscriptions, event_classes, maxsize))
+
+    async def get_latest_event(self):
+        return await self.event_queue.get()
+
+    def _event_taken(self):
+        # Reading resumes once the queue is down to half of `max_events`.
+        if self._reading_paused and \
+                self.event_queue.qsize() <= self.max_events // 2:
+            self._reading_paused = False
+            self._transport.resume_reading()
+
+
+class AsyncIOBufferedEventMachineProtocol(
+        AsyncIOEventMachineProtocol, asyncio.BufferedProtocol):
+
+    # - asyncio.BufferedProtocol methods -
+
+    def get_buffer(self, sizehint):
+        return self.machine.get_buffer(sizehint)
+
+    def buffer_updated(self, nbytes):
+        self.machine.buffer_updated(nbytes)
+
+
+class AsyncIOPooledEventMachineProtocol(AsyncIOEventMachineProtocol):
+    """
+    Decodes frames in an executor, keeping the loop free for CPU-heavy
+    parsers.
+
+    `decoder(frame)` runs in `executor` (the loop's default executor when
+    None; it must be picklable for a process pool) and `event_parser` is
+    called on the loop with its result in place of the frame's bytes, e.g.
+    `decoder=registry.parse` with `event_parser=registry.pair`.  Results are
+    handed to the machine in wire order, so requests are paired against the
+    requests outstanding when each frame is delivered, as without a pool.
+    """
+
+    def __init__(self, event_parser, terminator, *, decoder, executor=None,
+                 loop=None, **options):
+        super().__init__(event_parser, terminator, loop=loop, **options)
+        self.decoder = decoder
+        self.executor = executor
+        self._loop = loop if loop is not None else asyncio.get_event_loop()
+        self._decoding = deque()
+
+    def data_received(self, data):
+        for frame in self.machine.split_frames(data):
+            future = self._loop.run_in_executor(
+                self.executor, self.decoder, frame)
+            future.add_done_callback(self._decoded)
+            self._decoding.append(future)
+
+    def _decoded(self, _):
+        decoding = self._decoding
+
+        while decoding and decoding[0].done():
+            future = decoding.popleft()
+
+            try:
+                decoded = future.result()
+            except asyncio.CancelledError:
+                continue
+            except Exception:
+                logger.exception('Decoding a frame failed.')
+                continue
+
+            self.machine.process_incoming_data(decoded)
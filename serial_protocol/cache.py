@@ -0,0 +1,104 @@
+from collections import OrderedDict
+import time
+
+
+class ResponseCache:
+    """
+    A bounded LRU cache of responses with a time to live, for requests that
+    declare a `cache_key`.
+
+    Rules added with `on(event_class, rule)` are called as
+    `rule(cache, event)` for every event the protocol receives, responses
+    included, and can `put` or `invalidate` entries, e.g. when the device
+    announces a new value.  Rules apply to subclasses of `event_class` too.
+
+    Only responses for which `cacheable(response)` is true are cached, so
+    error replies are not served for the whole `ttl`; without it every
+    response is.
+    """
+
+    def __init__(self, *, ttl=1.0, max_size=1024, timefunc=time.monotonic,
+                 cacheable=None):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.timefunc = timefunc
+        self.cacheable = cacheable
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._rules = {}
+        self._dispatch = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        try:
+            expires, response = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+
+        if expires <= self.timefunc():
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return response
+
+    def lookup(self, request):
+        # The cached response to a request, or None.
+        key = getattr(request, 'cache_key', None)
+
+        if key is None:
+            return None
+
+        return self.get(key)
+
+    def put(self, key, response, ttl=None):
+        if ttl is None:
+            ttl = self.ttl
+
+        self._entries[key] = (self.timefunc() + ttl, response)
+        self._entries.move_to_end(key)
+
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def on(self, event_class, rule):
+        self._rules.setdefault(event_class, []).append(rule)
+        self._dispatch.clear()
+
+    def event_received(self, event):
+        klass = type(event)
+
+        try:
+            rules = self._dispatch[klass]
+        except KeyError:
+            rules = self._dispatch[klass] = [
+                rule
+                for base in klass.__mro__
+                for rule in self._rules.get(base, ())]
+
+        for rule in rules:
+            rule(self, event)
+
+    def response_received(self, request, response):
+        # Rules run first, so a rule invalidating entries on this kind of
+        # response does not discard the response just received.
+        self.event_received(response)
+        key = getattr(request, 'cache_key', None)
+
+        if key is None or response is None:
+            return
+
+        if self.cacheable is None or self.cacheable(response):
+            self.put(key, response)
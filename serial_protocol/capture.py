@@ -0,0 +1,193 @@
+import mmap
+import struct
+from threading import Lock
+import time
+
+MAGIC = b'SPCAP\x00\x01\x00'
+
+# Sent by the device to us, and written by us to the device.
+RX = 0
+TX = 1
+
+# Timestamp in seconds, direction, length of the chunk that follows.
+_RECORD = struct.Struct('<dBI')
+
+
+class CaptureRecorder:
+    """
+    Logs the raw bytes of a connection to an append-only capture file: each
+    chunk received or written is stored with its `timefunc()` timestamp and
+    direction.
+
+    `attach(machine)` records what a machine receives and writes;
+    `wrap_write(write)` and `wrap_receive(receive)` wrap other callables.
+    Records are written whole under a lock, so reading and writing threads
+    may share a recorder.
+    """
+
+    def __init__(self, path, *, timefunc=time.time):
+        self.timefunc = timefunc
+        self._lock = Lock()
+        self._file = open(path, 'ab')
+
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+        else:
+            with open(path, 'rb') as f:
+                if f.read(len(MAGIC)) != MAGIC:
+                    self._file.close()
+                    raise ValueError(f'{path} is not a capture file')
+
+    def record(self, direction, data):
+        header = _RECORD.pack(self.timefunc(), direction, len(data))
+
+        with self._lock:
+            self._file.write(header)
+            self._file.write(data)
+
+    def wrap_receive(self, receive):
+        def recorded_receive(data):
+            self.record(RX, data)
+            return receive(data)
+
+        return recorded_receive
+
+    def wrap_write(self, write):
+        def recorded_write(data):
+            self.record(TX, data)
+            return write(data)
+
+        return recorded_write
+
+    def attach(self, machine):
+        # Covers every way data reaches a machine (`receive_data`,
+        # `split_frames` and the `get_buffer`/`buffer_updated` pair) and the
+        # write callables requests are sent with.
+        buffer_updated = machine.buffer_updated
+        write_request = machine._write_request
+        write_batch = machine._write_batch
+
+        def recorded_buffer_updated(nbytes):
+            self.record(RX, machine._read_view[:nbytes])
+            return buffer_updated(nbytes)
+
+        def recorded_write_request(request, write):
+            return write_request(request, self.wrap_write(write))
+
+        def recorded_write_batch(requests, write):
+            return write_batch(requests, self.wrap_write(write))
+
+        machine.receive_data = self.wrap_receive(machine.receive_data)
+        machine.split_frames = self.wrap_receive(machine.split_frames)
+        machine.buffer_updated = recorded_buffer_updated
+        machine._write_request = recorded_write_request
+        machine._write_batch = recorded_write_batch
+        return machine
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class CaptureReplay:
+    """
+    Reads a capture file through a memory map.  `records()` yields
+    `(timestamp, direction, data)` with `data` a view into the map; a
+    record cut short by a crash while capturing ends the iteration.  Views
+    kept past `close()` stay valid, and the map is unmapped once the last
+    one is dropped.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._map[:len(MAGIC)] != MAGIC:
+            self._map.close()
+            raise ValueError(f'{path} is not a capture file')
+
+        self._view = memoryview(self._map)
+
+    def records(self):
+        view = self._view
+        unpack_from = _RECORD.unpack_from
+        header_size = _RECORD.size
+        size = len(view)
+        offset = len(MAGIC)
+
+        while offset + header_size <= size:
+            timestamp, direction, length = unpack_from(view, offset)
+            start = offset + header_size
+            offset = start + length
+
+            if offset > size:
+                return
+
+            yield timestamp, direction, view[start:offset]
+
+    def replay(self, machine, *, realtime=False, speed=1.0,
+               transmitted=None, timefunc=time.monotonic, sleep=time.sleep):
+        """
+        Feeds the received chunks to `machine.receive_data` as views into
+        the map, as fast as possible or, with `realtime`, at their original
+        spacing divided by `speed`.  Written chunks are passed to
+        `transmitted(data)` if given, e.g. to send the requests that were
+        pending at the time.
+
+        Returns the chunks, bytes and frames replayed and the time taken.
+        """
+        receive = machine.receive_data
+        chunks = 0
+        nbytes = 0
+        frames = 0
+        first = None
+        started = timefunc()
+
+        for timestamp, direction, data in self.records():
+            if realtime:
+                if first is None:
+                    first = timestamp
+
+                delay = started + (timestamp - first) / speed - timefunc()
+
+                if delay > 0:
+                    sleep(delay)
+
+            if direction == RX:
+                chunks += 1
+                nbytes += len(data)
+                frames += len(receive(data))
+            elif transmitted is not None:
+                transmitted(bytes(data))
+
+        return {
+            'chunks': chunks,
+            'bytes': nbytes,
+            'frames': frames,
+            'elapsed': timefunc() - started,
+        }
+
+    def close(self):
+        self._view.release()
+
+        try:
+            self._map.close()
+        except BufferError:
+            # Record views are still held; the map goes with the last one.
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -1,7 +1,321 @@
-class Event:
+import re
+from types import MemberDescriptorType
+
+
+_INLINE_FLAGS = (
+    ('a', re.ASCII), ('i', re.IGNORECASE), ('L', re.LOCALE),
+    ('m', re.MULTILINE), ('s', re.DOTALL), ('x', re.VERBOSE))
+
+# Global flags opening a pattern, which may not appear mid-expression; they
+# are in the compiled pattern's flags and re-added as a scoped group.
+_GLOBAL_FLAGS = re.compile(rb'\A(?:\(\?[aiLmsux]+\))+')
+
+# Group references by number, which would point at the wrong group once a
+# pattern is wrapped into a combined expression.
+_NUMBERED_REFERENCE = re.compile(rb'\\[1-9]|\\g<\d+>|\(\?\(\d+\)')
+
+# The attributes the machines read from every request, with their defaults.
+_REQUEST_DEFAULTS = (
+    ('correlation_key', None), ('idempotency_key', None),
+    ('cache_key', None), ('priority', 0), ('deadline', None))
+
+
+class EventMeta(type):
+    """
+    Turns a class's `fields` into `__slots__` and, unless the class defines
+    its own, an `__init__` taking the fields in order (inherited fields
+    first).  Fields not given are None.
+
+    The generated `__init__` sets every field itself, after only the
+    nearest `__init__` that was not generated.
+    """
+
+    def __new__(mcls, name, bases, namespace, **kwargs):
+        fields = namespace.get('fields')
+
+        if fields is not None and '__slots__' not in namespace:
+            namespace['__slots__'] = tuple(fields)
+
+        cls = super().__new__(mcls, name, bases, namespace, **kwargs)
+        cls._all_fields = tuple(
+            field
+            for klass in reversed(cls.__mro__)
+            for field in klass.__dict__.get('fields', ()))
+        # Request attributes still stored in the base slots, rather than
+        # overridden by a class attribute or property.
+        cls._slot_defaults = tuple(
+            (name, value) for name, value in _REQUEST_DEFAULTS
+            if isinstance(_lookup(cls, name), MemberDescriptorType))
+
+        if fields is not None and '__init__' not in namespace:
+            cls.__init__ = mcls._make_init(cls)
+
+        return cls
+
+    @staticmethod
+    def _make_init(cls):
+        base_init = next(
+            init for init in (
+                klass.__dict__.get('__init__') for klass in cls.__mro__[1:])
+            if init is not None and not getattr(init, '_generated', False))
+        fields = cls._all_fields
+        missing = (None,) * len(fields)
+
+        def __init__(self, *values, **named):
+            base_init(self)
+
+            for field, value in zip(fields, values + missing):
+                setattr(self, field, value)
+
+            for field, value in named.items():
+                setattr(self, field, value)
+
+        __init__._generated = True
+        return __init__
+
+
+def _lookup(cls, name):
+    # The attribute as found on the class, before any descriptor binding.
+    for klass in cls.__mro__:
+        if name in klass.__dict__:
+            return klass.__dict__[name]
+
+    return None
+
+
+class _EventBase:
+    # Parsing and serialization shared by Event and SlottedEvent.
+    __slots__ = ()
+    pattern = None
 
-    def __init__(self):
-        self.timeout = None
-    
     def to_bytes(self):  # pragma: no cover
         return b''
+
+    @classmethod
+    def from_match(cls, match):
+        return cls()
+
+    @classmethod
+    def from_bytes(cls, data):
+        m = cls.pattern.match(data)
+
+        if m is None:
+            raise ValueError()
+
+        return cls.from_match(m)
+
+
+class Event(_EventBase):
+    """An event that can take any attribute."""
+    correlation_key = None
+    idempotency_key = None
+    cache_key = None
+    priority = 0
+    deadline = None
+
+    def __init__(self):
+        self.timeout = None
+
+
+class SlottedEvent(_EventBase, metaclass=EventMeta):
+    """
+    An event without a per-instance `__dict__`, for keeping many events or
+    requests in memory.  Subclasses declare their attributes as `fields`:
+
+        class OKResponse(SlottedEvent):
+            pattern = re.compile(br'^OK (A|B) ([A-Z])\r$')
+            fields = ('slot', 'value')
+
+    `from_match` builds an instance from the match's groups, one per field.
+    The request attributes the machines read (`correlation_key`,
+    `idempotency_key`, `cache_key`, `priority` and `deadline`) are slots
+    too, so they can be set per instance; a subclass may still override
+    them with a class attribute or property.
+    """
+    __slots__ = ('timeout',) + tuple(name for name, _ in _REQUEST_DEFAULTS)
+
+    def __init__(self):
+        self.timeout = None
+
+        for name, value in self._slot_defaults:
+            setattr(self, name, value)
+
+    @classmethod
+    def from_match(cls, match):
+        if cls._all_fields:
+            return cls(*match.groups())
+
+        return cls()
+
+
+class EventRegistry:
+    """
+    Parses frames into registered Event classes without trying each class in
+    turn.
+
+    Each class is registered with a regular expression (its `pattern` by
+    default) and optionally a literal `prefix`.  Classes with a prefix are
+    found by a dictionary lookup on the start of the frame; the rest share a
+    combined regular expression, tried in registration order.  Patterns that
+    refer to groups by number, or reuse a group name already in the combined
+    expression, are matched on their own instead.  The matching class is
+    built with `from_match(match)`.
+
+    An instance is a valid `event_parser`/`event_for_data`: responses are
+    paired with the request named by their `correlation_key`, or else the
+    oldest outstanding request; classes registered with `unsolicited=True`
+    are never paired with a request.
+    """
+
+    def __init__(self):
+        self._entries = []
+        self._prefixes = None
+        self._unprefixed = []
+        self._unsolicited = set()
+
+    def register(self, klass=None, *, pattern=None, prefix=None,
+                 unsolicited=False):
+        if klass is None:
+            return lambda klass: self.register(
+                klass, pattern=pattern, prefix=prefix,
+                unsolicited=unsolicited)
+
+        if pattern is None:
+            pattern = klass.pattern
+
+        if pattern is None:
+            raise ValueError(f'{klass.__name__} has no pattern to register')
+
+        pattern = re.compile(pattern)
+
+        if prefix is None and not _NUMBERED_REFERENCE.search(pattern.pattern):
+            # Fail now, not on the first parse, if it cannot be combined.
+            re.compile(_alternative('_', pattern))
+
+        self._entries.append((klass, pattern, prefix, unsolicited))
+        self._prefixes = None
+        return klass
+
+    def compile(self):
+        prefixes = {}
+        unprefixed = []
+        alternatives = []
+        groups = {}
+        names = set()
+
+        def combine():
+            if alternatives:
+                unprefixed.append(
+                    (re.compile(b'|'.join(alternatives)), dict(groups)))
+                alternatives.clear()
+                groups.clear()
+                names.clear()
+
+        for index, entry in enumerate(self._entries):
+            klass, pattern, prefix, unsolicited = entry
+
+            if prefix is not None:
+                prefixes.setdefault(len(prefix), {}) \
+                    .setdefault(prefix, []).append(entry)
+            elif _NUMBERED_REFERENCE.search(pattern.pattern):
+                combine()
+                unprefixed.append((pattern, entry))
+            else:
+                # Group names must be unique within one expression.
+                if not names.isdisjoint(pattern.groupindex):
+                    combine()
+
+                names.update(pattern.groupindex)
+
+                name = f'_{index}'
+                alternatives.append(_alternative(name, pattern))
+                groups[name] = entry
+
+        combine()
+
+        # Longest prefixes first, so b'OKAY' wins over b'OK'.
+        self._prefixes = sorted(prefixes.items(), reverse=True)
+        self._unprefixed = unprefixed
+        self._unsolicited = {
+            entry[0] for entry in self._entries if entry[3]}
+
+    def parse(self, data):
+        entry, match = self._match(data)
+
+        if entry is None:
+            return None
+
+        return entry[0].from_match(match)
+
+    def _match(self, data):
+        if self._prefixes is None:
+            self.compile()
+
+        for length, table in self._prefixes:
+            # bytes() so frame views, which are unhashable, work as keys.
+            for entry in table.get(bytes(data[:length]), ()):
+                match = entry[1].match(data)
+
+                if match is not None:
+                    return entry, match
+
+        for regex, entries in self._unprefixed:
+            match = regex.match(data)
+
+            if match is None:
+                continue
+
+            if isinstance(entries, dict):
+                # A combined expression: rematch for the class's own groups.
+                entry = entries[match.lastgroup]
+                return entry, entry[1].match(data)
+
+            return entries, match
+
+        return None, None
+
+    def pair(self, event, requests):
+        # The request half of `__call__`, for events parsed elsewhere.
+        if event is None:
+            return None, None
+
+        if self._prefixes is None:
+            self.compile()
+
+        if type(event) in self._unsolicited:
+            return event, None
+
+        return self._pair(event, requests)
+
+    def __call__(self, data, requests):
+        entry, match = self._match(data)
+
+        if entry is None:
+            return None, None
+
+        klass, _, _, unsolicited = entry
+        event = klass.from_match(match)
+
+        if unsolicited:
+            return event, None
+
+        return self._pair(event, requests)
+
+    def _pair(self, event, requests):
+        key = getattr(event, 'correlation_key', None)
+
+        if key is not None:
+            return event, key
+
+        return event, next(iter(requests), None)
+
+
+def _alternative(name, pattern):
+    # `pattern` as a named group of a combined expression, its flags scoped
+    # to the group.
+    flags = ''.join(
+        letter for letter, flag in _INLINE_FLAGS if pattern.flags & flag)
+    return (
+        f'(?P<{name}>'.encode() +
+        (f'(?{flags}:'.encode() if flags else b'(?:') +
+        _GLOBAL_FLAGS.sub(b'', pattern.pattern) + b'))')
@@ -0,0 +1,346 @@
+from array import array
+import re
+import struct
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+
+class FramingError(ValueError):
+    """
+    The receive buffer holds something a framer cannot frame.
+
+    `spans` are the complete frames found before it, and `consumed` the
+    number of leading bytes to discard to get past it.  The machine delivers
+    those frames and discards those bytes before raising, so the next
+    `receive_data` (even with `b''`) carries on with the bytes after them.
+    """
+
+    def __init__(self, message, consumed, spans=()):
+        super().__init__(message)
+        self.consumed = consumed
+        self.spans = list(spans)
+
+
+class Framer:  # pragma: no cover
+    """
+    Finds frame boundaries in an EventMachine's receive buffer.
+
+    `scan(buffer, end)` looks at `buffer[:end]` and returns a list of
+    `(start, stop)` spans of complete frames, and the number of leading bytes
+    the machine may discard.  The machine discards them before the next scan,
+    so a framer can remember how far it got.  `decode(frame)` turns the bytes
+    of a span into what is handed to `event_for_data`.
+
+    A framer keeps scanning state, so each machine needs its own instance.
+    """
+
+    def scan(self, buffer, end):
+        raise NotImplementedError(
+            f'{self.__class__.__name__} must implement scan(buffer, end)')
+
+    def decode(self, frame):
+        return frame
+
+
+class DelimiterFramer(Framer):
+    """Frames end with `terminator`, which is kept on the frame."""
+
+    def __init__(self, terminator=b'\n'):
+        if not terminator:
+            raise ValueError('terminator must not be empty')
+
+        self.terminator = terminator
+        self._offset = 0
+
+    def scan(self, buffer, end):
+        # Only scan the bytes that arrived since the last call, backing up
+        # far enough to catch a terminator split across two chunks.
+        terminator = self.terminator
+        size = len(terminator)
+        start = 0
+        position = buffer.find(
+            terminator, max(0, self._offset - size + 1), end)
+        spans = []
+
+        while position != -1:
+            stop = position + size
+            spans.append((start, stop))
+            start = stop
+            position = buffer.find(terminator, start, end)
+
+        self._offset = end - start
+        return spans, start
+
+
+class MultiDelimiterFramer(Framer):
+    """
+    Frames end with any of `terminators`, which is kept on the frame.
+
+    Where one terminator is a prefix of another (b'\\r' and b'\\r\\n'), the
+    longer one wins when both have arrived together.
+    """
+
+    def __init__(self, *terminators):
+        if not terminators or not all(terminators):
+            raise ValueError('terminators must not be empty')
+
+        self.terminators = terminators
+        self._longest = max(len(t) for t in terminators)
+        self._pattern = re.compile(b'|'.join(
+            re.escape(t)
+            for t in sorted(terminators, key=len, reverse=True)))
+        self._offset = 0
+
+    def scan(self, buffer, end):
+        search = self._pattern.search
+        start = 0
+        match = search(buffer, max(0, self._offset - self._longest + 1), end)
+        spans = []
+
+        while match is not None:
+            stop = match.end()
+            spans.append((start, stop))
+            start = stop
+            match = search(buffer, start, end)
+
+        self._offset = end - start
+        return spans, start
+
+
+class LengthPrefixedFramer(Framer):
+    """
+    Frames start with a header holding the length of the rest of the frame.
+
+    The length field is unpacked with the `struct` format `length_format`,
+    found `length_offset` bytes into the frame.  The frame is the header plus
+    `length + length_adjustment` bytes (use the adjustment for trailers such as
+    checksums that the length does not count).  Frames are delivered whole,
+    header included.  A length that would leave a frame empty or ending
+    before it starts (a signed format, or a negative adjustment) raises
+    FramingError once the frames before it have been delivered; the header
+    is dropped, so framing resumes with the bytes after it.
+    """
+
+    def __init__(self, length_format='>H', *, length_offset=0,
+                 length_adjustment=0):
+        self._length = struct.Struct(length_format)
+        self.length_offset = length_offset
+        self.length_adjustment = length_adjustment
+        self.header_size = length_offset + self._length.size
+
+    def scan(self, buffer, end):
+        unpack_from = self._length.unpack_from
+        header_size = self.header_size
+        extra = header_size + self.length_adjustment
+        start = 0
+        spans = []
+
+        while end - start >= header_size:
+            length, = unpack_from(buffer, start + self.length_offset)
+            stop = start + length + extra
+
+            if stop <= start:
+                raise FramingError(
+                    f'frame length {length} at offset {start} does not '
+                    f'advance', start + header_size, spans)
+
+            if stop > end:
+                break
+
+            spans.append((start, stop))
+            start = stop
+
+        return spans, start
+
+
+class _DelimitedFramer(Framer):
+    # Frames separated by a single delimiter byte that is dropped; empty
+    # frames (repeated delimiters) are skipped.
+
+    delimiter = None
+
+    def __init__(self):
+        self._offset = 0
+
+    def scan(self, buffer, end):
+        delimiter = self.delimiter
+        start = 0
+        position = buffer.find(delimiter, self._offset, end)
+        spans = []
+
+        while position != -1:
+            if position > start:
+                spans.append((start, position))
+            start = position + 1
+            position = buffer.find(delimiter, start, end)
+
+        self._offset = end - start
+        return spans, start
+
+
+class SLIPFramer(_DelimitedFramer):
+    """RFC 1055 SLIP framing.  Frames are delivered unescaped."""
+
+    END = b'\xc0'
+    ESC = b'\xdb'
+    ESC_END = b'\xdb\xdc'
+    ESC_ESC = b'\xdb\xdd'
+
+    delimiter = END
+    _escaped = re.compile(re.escape(ESC))
+
+    def decode(self, frame):
+        if self._escaped.search(frame) is None:
+            return frame
+
+        return bytes(frame) \
+            .replace(self.ESC_END, self.END) \
+            .replace(self.ESC_ESC, self.ESC)
+
+    @classmethod
+    def encode(cls, payload):
+        escaped = payload \
+            .replace(cls.ESC, cls.ESC_ESC) \
+            .replace(cls.END, cls.ESC_END)
+        return cls.END + escaped + cls.END
+
+
+class COBSFramer(_DelimitedFramer):
+    """
+    Consistent Overhead Byte Stuffing, with frames separated by zero bytes.
+    Frames are delivered decoded.
+    """
+
+    delimiter = b'\x00'
+
+    def decode(self, frame):
+        frame = bytes(frame)
+        size = len(frame)
+        blocks = []
+        position = 0
+
+        while position < size:
+            code = frame[position]
+            stop = position + code
+
+            if code == 0 or stop > size:
+                raise ValueError('invalid COBS frame')
+
+            blocks.append(frame[position + 1:stop])
+
+            if code < 0xff and stop < size:
+                blocks.append(b'\x00')
+
+            position = stop
+
+        return b''.join(blocks)
+
+    @staticmethod
+    def encode(payload):
+        chunks = payload.split(b'\x00')
+        last = len(chunks) - 1
+        blocks = []
+
+        for index, chunk in enumerate(chunks):
+            full = False
+
+            while len(chunk) >= 0xfe:
+                blocks.append(b'\xff' + chunk[:0xfe])
+                chunk = chunk[0xfe:]
+                full = True
+
+            if chunk or not (full and index == last):
+                blocks.append(bytes((len(chunk) + 1,)) + chunk)
+
+        return b''.join(blocks) + b'\x00'
+
+
+def frame_ends(buffer, terminator=b'\n', *, block_size=1 << 24,
+               vectorized=None):
+    """
+    The end offsets of every complete frame in `buffer`, for splitting a
+    large capture in one pass the way a DelimiterFramer would: frame `i`
+    is `buffer[ends[i - 1]:ends[i]]` (from 0 for the first), terminator
+    included.  Bytes after the last end are an incomplete frame.
+
+    `buffer` is anything supporting the buffer protocol, including an
+    `mmap`.  With NumPy installed the offsets are found vectorized, a
+    `block_size` bytes at a time, and returned as an int64 `numpy.ndarray`;
+    otherwise as an `array.array('q')`.
+
+    `vectorized` picks the search instead: True requires NumPy and a
+    terminator that cannot overlap itself (such as b'\r\r'), and False
+    always uses the regular expression search.
+    """
+    if not terminator:
+        raise ValueError('terminator must not be empty')
+
+    if vectorized is None:
+        vectorized = numpy is not None and not _overlaps(terminator)
+    elif vectorized:
+        if numpy is None:
+            raise ImportError('vectorized frame_ends requires numpy')
+
+        if _overlaps(terminator):
+            raise ValueError(
+                f'{terminator!r} can overlap itself; search it instead')
+
+    if vectorized:
+        return _vectorized_ends(buffer, terminator, block_size)
+
+    return _searched_ends(buffer, terminator)
+
+
+def iter_frames(buffer, terminator=b'\n'):
+    """
+    Zero-copy `memoryview`s of the complete frames in `buffer`, found by
+    `frame_ends`.  Views of an `mmap` must be released (or dropped) before
+    it is closed.
+    """
+    view = memoryview(buffer).cast('B')
+    start = 0
+
+    for end in frame_ends(view, terminator).tolist():
+        yield view[start:end]
+        start = end
+
+
+def _overlaps(terminator):
+    # Whether two occurrences can overlap (b'\r\r' in b'\r\r\r'); the
+    # vectorized search would then report both.
+    return any(
+        terminator[:size] == terminator[-size:]
+        for size in range(1, len(terminator)))
+
+
+def _searched_ends(buffer, terminator):
+    return array('q', (
+        match.end()
+        for match in re.finditer(re.escape(terminator), buffer)))
+
+
+def _vectorized_ends(buffer, terminator, block_size):
+    data = numpy.frombuffer(buffer, dtype=numpy.uint8)
+    size = len(terminator)
+    last_start = len(data) - size + 1
+    first = terminator[0]
+    ends = []
+
+    # The comparisons allocate a byte per byte compared, so gigabyte
+    # buffers are done in blocks.
+    for start in range(0, max(last_start, 0), block_size):
+        stop = min(start + block_size, last_start)
+        found = numpy.flatnonzero(data[start:stop] == first) + start
+
+        for index in range(1, size):
+            found = found[data[found + index] == terminator[index]]
+
+        ends.append(found + size)
+
+    if not ends:
+        return numpy.empty(0, dtype=numpy.int64)
+
+    return numpy.concatenate(ends).astype(numpy.int64, copy=False)
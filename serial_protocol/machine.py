@@ -1,76 +1,567 @@
-from collections import OrderedDict
+from heapq import heapify, heappop, heappush
+from itertools import count
+
+from .framing import DelimiterFramer, FramingError
+
+_NO_DEADLINE = float('inf')
+
+
+def _queue_order(request):
+    deadline = getattr(request, 'deadline', None)
+    return (
+        getattr(request, 'priority', 0),
+        _NO_DEADLINE if deadline is None else deadline)
+
+
+class PendingQueue:
+    """
+    Requests waiting to be written, ordered by their `priority` (lower
+    first), then `deadline` (earlier first, none last), then arrival.
+
+    Used like the OrderedDict it replaces: `queue[request] = write` and
+    `popitem(last=False)`.
+    """
+
+    def __init__(self, timefunc=None):
+        # With a timefunc, entries remember when they were queued.
+        self.timefunc = timefunc
+        self._heap = []
+        self._sequence = count()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __iter__(self):
+        return (entry[3] for entry in sorted(self._heap))
+
+    def __setitem__(self, request, write):
+        priority, deadline = _queue_order(request)
+        heappush(self._heap, (
+            priority,
+            deadline,
+            next(self._sequence),
+            request,
+            write,
+            self.timefunc() if self.timefunc is not None else None))
+
+    def popitem(self, last=False):
+        if last:
+            raise NotImplementedError('PendingQueue only pops the first item')
+
+        return heappop(self._heap)[3:5]
+
+    def popentry(self):
+        # (request, write, queued time)
+        return heappop(self._heap)[3:]
+
+    def peek(self):
+        return self._heap[0][3]
+
+    def remove(self, request):
+        # Linear, for the rare request taken out before its turn.
+        for index, entry in enumerate(self._heap):
+            if entry[3] is request:
+                del self._heap[index]
+                heapify(self._heap)
+                return entry[3:]
+
+        raise KeyError(request)
 
 
 class EventMachine:
 
-    def __init__(self, event_minder, delegate, terminator=b'\n'):
+    def __init__(self, event_minder, delegate, terminator=b'\n', *,
+                 framer=None, frame_views=False, read_size=65536,
+                 max_in_flight=1, coalesce_writes=False, metrics=None):
         self.event_minder = event_minder
         self.delegate = delegate
+        self.framer = framer if framer is not None else \
+            DelimiterFramer(terminator)
+        self.frame_views = frame_views
+        self.read_size = read_size
         self._input_buffer = bytearray()
-        self._terminator = terminator
-        self.waiting_requests = OrderedDict()
-        self.pending_requests = OrderedDict()
+        self._input_end = 0
+        self._read_view = None
+        self._consumed = 0
+        self._framing_error = None
+        self._delivering = False
+        self._deferred = []
+        self.max_in_flight = max_in_flight
+        self.coalesce_writes = coalesce_writes
+        # Insertion-ordered, oldest first; a plain dict is half the size of
+        # an OrderedDict per entry.
+        self.waiting_requests = {}
+        # One bound method shared by every timeout, not one per request.
+        self._timeout_callback = self._timed_out
+        self.pending_requests = PendingQueue(
+            metrics.timefunc if metrics is not None else None)
+        self._keyed_requests = {}
+        self._idempotent_requests = {}
+        self._followers = {}
+        # Timers failing queued requests when their deadline passes.
+        self._deadline_timers = {}
+        self.coalesced_requests = 0
+        self.coalesced_bytes = 0
+        self.metrics = metrics
 
     def process_incoming_data(self, data):
         event, request = self.delegate.event_for_data(
             data, self.waiting_requests.keys())
 
-        if request:
-            self._completed(request)
+        if request is not None and request not in self.waiting_requests:
+            # The parser may return a request's correlation key in its place.
+            # A reply for a key (or request) no longer waiting, say one that
+            # timed out, is delivered as an unsolicited event.
+            request = self._keyed_requests.get(request)
+
+            if request not in self.waiting_requests:
+                request = None
+
+        if request is not None:
+            followers = self._completed(request)
             self.delegate.request_completed(request, event)
-        elif event:
+
+            for follower in followers:
+                self.delegate.request_completed(follower, event)
+        elif event is not None:
+            if self.metrics is not None:
+                self.metrics.events_received += 1
             self.delegate.event_received(event)
+        elif self.metrics is not None:
+            self.metrics.unmatched_frames += 1
         
         return event
 
     def receive_data(self, data):
-        assert isinstance(data, bytes)
+        # Any bytes-like object; it is copied into the input buffer.
+        assert isinstance(data, (bytes, bytearray, memoryview))
         # print('received: %r' % data)
-        self._input_buffer += data
-        completes = []
+        if self._delivering:
+            # A delegate callback wrote a request that was answered
+            # synchronously; the buffer is exported to a frame view, so park
+            # the reply until the current frames have been delivered.
+            self._deferred.append(bytes(data))
+            return []
 
-        if self._terminator in self._input_buffer:
-            *completes, self._input_buffer = self._input_buffer.split(
-                self._terminator)
-        
-        events = [
-            self.process_incoming_data(bytes(complete + self._terminator))
-            for complete in completes]
+        if self.metrics is not None:
+            self.metrics.bytes_in += len(data)
+
+        self._append(data)
+
+        return self._process_input()
+
+    def get_buffer(self, sizehint=-1):
+        # Hand out the unused tail of the receive buffer so a transport can
+        # read straight into it, growing the tail only when it is too small.
+        buffer = self._input_buffer
+        size = max(sizehint, self.read_size)
+        spare = len(buffer) - self._input_end
+
+        if spare < size:
+            buffer.extend(bytes(size - spare))
+
+        self._read_view = memoryview(buffer)[self._input_end:]
+        return self._read_view
+
+    def buffer_updated(self, nbytes):
+        self._read_view.release()
+        self._read_view = None
+        self._input_end += nbytes
+
+        if self.metrics is not None:
+            self.metrics.bytes_in += nbytes
+
+        return self._process_input()
+
+    def _append(self, data):
+        end = self._input_end
+        self._input_buffer[end:end + len(data)] = data
+        self._input_end = end + len(data)
+
+    def split_frames(self, data):
+        # Frame `data` without processing the frames, for callers that parse
+        # them elsewhere and hand the results to `process_incoming_data` in
+        # order.
+        if self.metrics is not None:
+            self.metrics.bytes_in += len(data)
+
+        self._append(data)
+        frames = self._take_frames()
+        self._raise_framing_error()
+
+        return frames
+
+    def _process_input(self):
+        if self.frame_views:
+            events = self._deliver_views()
+        else:
+            events = [
+                self.process_incoming_data(frame)
+                for frame in self._take_frames()]
+
+        self._raise_framing_error()
 
         return events
 
+    def _take_frames(self):
+        with memoryview(self._input_buffer) as view:
+            decode = self.framer.decode
+            frames = [
+                decode(bytes(view[start:end]))
+                for start, end in self._scan()]
+
+        self._compact()
+
+        return frames
+
+    def _deliver_views(self):
+        events = []
+        self._delivering = True
+
+        try:
+            while True:
+                spans = self._scan()
+
+                if spans:
+                    decode = self.framer.decode
+
+                    with memoryview(self._input_buffer).toreadonly() as view:
+                        for start, end in spans:
+                            with view[start:end] as frame:
+                                events.append(
+                                    self.process_incoming_data(decode(frame)))
+
+                # Even with no frames: skipped delimiters are consumed too.
+                self._compact()
+
+                if not self._deferred:
+                    break
+
+                self._append(b''.join(self._deferred))
+                self._deferred.clear()
+        finally:
+            self._delivering = False
+
+        return events
+
+    def _scan(self):
+        try:
+            spans, self._consumed = self.framer.scan(
+                self._input_buffer, self._input_end)
+        except FramingError as error:
+            # Deliver the frames before the bad bytes and drop those, then
+            # raise, so the caller can carry on after handling the error.
+            spans = error.spans
+            self._consumed = error.consumed
+            self._framing_error = error
+
+        return spans
+
+    def _raise_framing_error(self):
+        error = self._framing_error
+
+        if error is not None:
+            self._framing_error = None
+            raise error
+
+    def _compact(self):
+        consumed = self._consumed
+
+        if consumed:
+            try:
+                del self._input_buffer[:consumed]
+            except BufferError:
+                # A delegate kept a view of a delivered frame; leave that
+                # buffer to it and carry on with a fresh one.
+                self._input_buffer = self._input_buffer[
+                    consumed:self._input_end]
+            self._input_end -= consumed
+            self._consumed = 0
+
     def send(self, request, write=None):
-        if self.waiting_requests:
-            self.pending_requests[request] = write
+        self._check_key(request)
+
+        if self._coalesce(request):
+            return
+
+        self._add_key(request)
+
+        if self.pending_requests or \
+                len(self.waiting_requests) >= self.max_in_flight:
+            self._queue(request, write)
         else:
+            if self.metrics is not None:
+                self.metrics.request_dequeued(request)
             self._write_request(request, write)
+
+        if self.metrics is not None:
+            self.metrics.queues_changed(
+                len(self.pending_requests), len(self.waiting_requests))
+
+    def send_many(self, requests, write=None):
+        requests = list(requests)
+        keys = set()
+
+        # Nothing is queued if any key is taken.
+        for request in requests:
+            key = self._check_key(request)
+
+            if key is not None:
+                if key in keys:
+                    raise ValueError(
+                        f'correlation key {key!r} is already in use')
+                keys.add(key)
+
+        for request in requests:
+            if not self._coalesce(request):
+                self._add_key(request)
+                self._queue(request, write)
+
+        self._send_next_request(coalesce=True)
     
+    def _queue(self, request, write):
+        self.pending_requests[request] = write
+        deadline = getattr(request, 'deadline', None)
+
+        if deadline is not None:
+            self._deadline_timers[request] = self.event_minder.notify_at(
+                deadline, self._deadline_passed, request)
+
+    def _deadline_passed(self, request):
+        self._deadline_timers.pop(request, None)
+
+        try:
+            self.pending_requests.remove(request)
+        except KeyError:
+            return
+
+        self._expired(request)
+
+        if self.metrics is not None:
+            self.metrics.queues_changed(
+                len(self.pending_requests), len(self.waiting_requests))
+
+    def _expired(self, request):
+        # A queued request whose deadline passed before it was written.
+        followers = self._forget_key(request)
+        if self.metrics is not None:
+            self.metrics.request_timed_out(request)
+        self.delegate.request_timed_out(request)
+        for follower in followers:
+            self.delegate.request_timed_out(follower)
+
+    def _check_key(self, request):
+        key = getattr(request, 'correlation_key', None)
+
+        if key is not None and key in self._keyed_requests:
+            raise ValueError(f'correlation key {key!r} is already in use')
+
+        return key
+
+    def _add_key(self, request):
+        # Keys are taken from sending until the request is done with.
+        key = getattr(request, 'correlation_key', None)
+
+        if key is not None:
+            self._keyed_requests[key] = request
+
+    def _coalesce(self, request):
+        # Idempotent requests with the key of one already pending or waiting
+        # follow it instead of going on the wire, and share its outcome.
+        key = getattr(request, 'idempotency_key', None)
+
+        if key is None:
+            # Later requests must not share a response from before this one.
+            self._idempotent_requests.clear()
+            return False
+
+        leader = self._idempotent_requests.get(key)
+
+        if leader is None or not self._can_follow(request, leader):
+            self._idempotent_requests[key] = request
+            return False
+
+        self._followers.setdefault(leader, []).append(request)
+        self.coalesced_requests += 1
+        self.coalesced_bytes += len(request.to_bytes())
+
+        if self.metrics is not None:
+            self.metrics.requests_coalesced += 1
+
+        return True
+
+    def _can_follow(self, request, leader):
+        # A leader still queued must not be written later than the follower
+        # would have been.
+        if leader in self.waiting_requests:
+            return True
+
+        return _queue_order(leader) <= _queue_order(request)
+
     def _write_request(self, request, write):
+        self._track(request)
+        data = request.to_bytes()
+
+        if self.metrics is not None:
+            self.metrics.bytes_out += len(data)
+
+        write(data)
+
+    def _write_batch(self, requests, write):
+        for request in requests:
+            self._track(request)
+
+        if len(requests) == 1:
+            data = requests[0].to_bytes()
+        else:
+            data = b''.join([request.to_bytes() for request in requests])
+
+        if self.metrics is not None:
+            self.metrics.bytes_out += len(data)
+
+        write(data)
+
+    def _track(self, request):
         handle = None
         
         if request.timeout is not None:
             handle = self.event_minder.notify_after(
-                delay=request.timeout,
-                callable=self._timed_out,
-                request=request)
+                request.timeout, self._timeout_callback, request)
         
         self.waiting_requests[request] = handle
-        write(request.to_bytes())
 
-    def _send_next_request(self):
-        if self.pending_requests:
-            request, write = self.pending_requests.popitem(last=False)
-            self._write_request(request, write)
+        if self.metrics is not None:
+            self.metrics.request_written(request)
+
+    def _send_next_request(self, coalesce=False):
+        if not (coalesce or self.coalesce_writes):
+            while len(self.waiting_requests) < self.max_in_flight:
+                request, write = self._pop_pending()
+                if request is None:
+                    break
+                self._write_request(request, write)
+        else:
+            self._send_batches()
+
+        if self.metrics is not None:
+            self.metrics.queues_changed(
+                len(self.pending_requests), len(self.waiting_requests))
+
+    def _send_batches(self):
+        # Gather every request the window allows into one write per
+        # consecutive run of requests sharing a write callable.
+        batch = []
+        batch_write = None
+
+        while len(self.waiting_requests) + len(batch) < self.max_in_flight:
+            request, write = self._pop_pending()
+
+            if request is None:
+                break
+
+            if batch and write != batch_write:
+                self._write_batch(batch, batch_write)
+                batch = []
+
+            batch.append(request)
+            batch_write = write
+
+        if batch:
+            self._write_batch(batch, batch_write)
     
+    def _pop_pending(self):
+        # The next request to write, timing out those whose deadline passed
+        # while they were queued.
+        while self.pending_requests:
+            request, write, queued = self.pending_requests.popentry()
+            handle = self._deadline_timers.pop(request, None)
+
+            if handle:
+                self.event_minder.remove(handle)
+
+            deadline = getattr(request, 'deadline', None)
+
+            if deadline is not None and deadline < self.event_minder.now():
+                self._expired(request)
+                continue
+
+            if self.metrics is not None:
+                self.metrics.request_dequeued(request, queued)
+
+            return request, write
+
+        return None, None
+
     def _completed(self, request):
         if request in self.waiting_requests:
             handle = self.waiting_requests.pop(request)
             if handle:
                 self.event_minder.remove(handle)
+            followers = self._forget_key(request)
+            if self.metrics is not None:
+                self.metrics.request_completed(request)
             self._send_next_request()
+            return followers
+
+        return ()
     
     def _timed_out(self, request):
         if request in self.waiting_requests:
             self.waiting_requests.pop(request)
+            followers = self._forget_key(request)
+            if self.metrics is not None:
+                self.metrics.request_timed_out(request)
             self.delegate.request_timed_out(request)
+            for follower in followers:
+                self.delegate.request_timed_out(follower)
             self._send_next_request()
+
+    def abandon_requests(self):
+        # Forgets every waiting and pending request, and those coalesced
+        # into them, cancelling their timeouts; for when the connection is
+        # lost.  Returns them, oldest first.
+        requests = []
+
+        for request, handle in self.waiting_requests.items():
+            if handle:
+                self.event_minder.remove(handle)
+            requests.append(request)
+
+        self.waiting_requests.clear()
+
+        while self.pending_requests:
+            requests.append(self.pending_requests.popentry()[0])
+
+        for handle in self._deadline_timers.values():
+            if handle:
+                self.event_minder.remove(handle)
+
+        self._deadline_timers.clear()
+
+        for request in list(requests):
+            requests.extend(self._followers.get(request, ()))
+
+        self._keyed_requests.clear()
+        self._idempotent_requests.clear()
+        self._followers.clear()
+
+        if self.metrics is not None:
+            self.metrics.requests_abandoned(requests)
+            self.metrics.queues_changed(0, 0)
+
+        return requests
+
+    def _forget_key(self, request):
+        # Returns the requests that were coalesced into this one.
+        key = getattr(request, 'correlation_key', None)
+
+        if key is not None and self._keyed_requests.get(key) is request:
+            del self._keyed_requests[key]
+
+        key = getattr(request, 'idempotency_key', None)
+
+        if key is not None and \
+                self._idempotent_requests.get(key) is request:
+            del self._idempotent_requests[key]
+
+        return self._followers.pop(request, ())
@@ -0,0 +1,191 @@
+import asyncio
+import logging
+
+from .asyncio import \
+    AsyncIOEventMachineProtocol, AsyncIOBufferedEventMachineProtocol, \
+    AsyncIOEventMinder, _EventQueue
+from .timing import TimerHeap
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceNotConnected(ConnectionError):
+
+    def __init__(self, device_id):
+        super().__init__(f'device {device_id!r} is not connected')
+        self.device_id = device_id
+
+
+class _Managed:
+    # Queues a protocol's unsolicited events on its DeviceManager's shared
+    # queue, after its cache and subscriptions, and reports connection loss.
+
+    def __init__(self, endpoint, *args, **kwargs):
+        self.endpoint = endpoint
+        super().__init__(*args, **kwargs)
+        self.event_queue = endpoint.manager.events
+
+    def _queue_event(self, event):
+        super()._queue_event((self.endpoint.device_id, event))
+
+    def connection_lost(self, exc):
+        super().connection_lost(exc)
+        self.endpoint.connection_lost(self, exc)
+
+
+class ManagedProtocol(_Managed, AsyncIOEventMachineProtocol):
+    pass
+
+
+class ManagedBufferedProtocol(_Managed, AsyncIOBufferedEventMachineProtocol):
+    pass
+
+
+class Endpoint:
+
+    def __init__(self, manager, device_id, connect):
+        self.manager = manager
+        self.device_id = device_id
+        self.connect = connect
+        self.transport = None
+        self.protocol = None
+        self.connected = asyncio.Event()
+        self.connections = 0
+        self._lost = None
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+        if self.transport is not None:
+            self.transport.close()
+
+    def protocol_factory(self):
+        manager = self.manager
+        self.protocol = manager.protocol_class(
+            self,
+            manager.event_parser,
+            manager.terminator,
+            loop=manager.loop,
+            event_minder=manager.event_minder,
+            **manager.options)
+        self._lost = asyncio.Future()
+        return self.protocol
+
+    def connection_lost(self, protocol, exc):
+        if protocol is self.protocol and not self._lost.done():
+            self._lost.set_result(exc)
+
+    async def _run(self):
+        manager = self.manager
+        delay = manager.reconnect_delay
+
+        try:
+            while True:
+                try:
+                    transport, _ = await self.connect(
+                        self.protocol_factory)
+                except OSError as e:
+                    logger.warning(
+                        'Connecting to %r failed (%s); retrying in %.3gs',
+                        self.device_id, e, delay)
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, manager.max_reconnect_delay)
+                    continue
+
+                delay = manager.reconnect_delay
+                self.transport = transport
+                self.connections += 1
+                self.connected.set()
+
+                exc = await self._lost
+
+                self.connected.clear()
+                self.transport = None
+                logger.warning(
+                    'Lost connection to %r (%s); reconnecting',
+                    self.device_id, exc)
+                await asyncio.sleep(delay)
+        finally:
+            self.connected.clear()
+
+
+class DeviceManager:
+    """
+    Runs many devices on one event loop with one shared EventMinder.
+
+    Each device is added with a `connect` coroutine function that takes a
+    protocol factory and returns `(transport, protocol)`, e.g.
+    `functools.partial(loop.create_connection, host=..., port=...)` or a
+    serial-port equivalent.  Lost or failed connections are retried with
+    exponential backoff.
+    """
+
+    def __init__(self, event_parser, terminator, *, loop=None,
+                 event_minder=None, buffered=False, reconnect_delay=0.1,
+                 max_reconnect_delay=30.0, **options):
+        if loop is None:
+            loop = asyncio.get_event_loop()
+
+        if event_minder is None:
+            event_minder = AsyncIOEventMinder(loop=loop, queue_class=TimerHeap)
+
+        self.loop = loop
+        self.event_parser = event_parser
+        self.terminator = terminator
+        self.event_minder = event_minder
+        self.protocol_class = \
+            ManagedBufferedProtocol if buffered else ManagedProtocol
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.options = options
+        self.devices = {}
+        self.events = _EventQueue(self._event_taken)
+
+    def add_device(self, device_id, connect):
+        if device_id in self.devices:
+            raise ValueError(f'device {device_id!r} already added')
+
+        endpoint = Endpoint(self, device_id, connect)
+        self.devices[device_id] = endpoint
+        endpoint.start()
+        return endpoint
+
+    def remove_device(self, device_id):
+        self.devices.pop(device_id).stop()
+
+    async def wait_connected(self, device_id=None):
+        if device_id is not None:
+            await self.devices[device_id].connected.wait()
+        else:
+            await asyncio.gather(*(
+                endpoint.connected.wait()
+                for endpoint in self.devices.values()))
+
+    def send(self, device_id, request):
+        endpoint = self.devices[device_id]
+
+        if not endpoint.connected.is_set():
+            raise DeviceNotConnected(device_id)
+
+        return endpoint.protocol.send_request(request)
+
+    async def get_event(self):
+        return await self.events.get()
+
+    def _event_taken(self):
+        # Devices paused by a full queue resume reading as it drains.
+        for endpoint in self.devices.values():
+            if endpoint.protocol is not None:
+                endpoint.protocol._event_taken()
+
+    def close(self):
+        for endpoint in self.devices.values():
+            endpoint.stop()
+
+        self.devices.clear()
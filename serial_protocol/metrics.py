@@ -0,0 +1,179 @@
+from bisect import bisect_left
+import time
+
+
+class LatencyHistogram:
+    """
+    A fixed-memory histogram of durations in seconds.
+
+    Bucket bounds grow by a factor of two from `smallest` seconds; the last
+    bucket counts everything longer.
+    """
+
+    def __init__(self, smallest=1e-6, buckets=28):
+        self.bounds = [smallest * 2 ** i for i in range(buckets - 1)]
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, duration):
+        self.counts[bisect_left(self.bounds, duration)] += 1
+        self.count += 1
+        self.total += duration
+
+        if duration > self.max:
+            self.max = duration
+
+    def percentile(self, point):
+        # The upper bound of the bucket holding the percentile, or the
+        # longest duration seen for the overflow bucket.
+        if not self.count:
+            return None
+
+        rank = self.count * point / 100
+        seen = 0
+
+        for index, count in enumerate(self.counts):
+            seen += count
+
+            if seen >= rank and count:
+                if index < len(self.bounds):
+                    return min(self.bounds[index], self.max)
+                return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else None,
+            'max': self.max if self.count else None,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'buckets': list(zip(self.bounds + [None], self.counts)),
+        }
+
+
+class Metrics:
+    """
+    Counters and per-request-type latency for one EventMachine.
+
+    Pass an instance as the machine's `metrics` option (the wrappers forward
+    it and expose it as their `metrics` attribute).  Without one the machine
+    skips all bookkeeping.  Latency is measured with `timefunc` from when a
+    request is written until its response; timeouts are counted per request
+    type, and time spent queued per request priority.
+    """
+
+    COUNTERS = (
+        'requests_sent', 'requests_completed', 'requests_timed_out',
+        'requests_coalesced', 'requests_lost', 'events_received',
+        'unmatched_frames',
+        'bytes_in', 'bytes_out')
+
+    def __init__(self, *, timefunc=time.perf_counter, smallest=1e-6,
+                 buckets=28):
+        self.timefunc = timefunc
+        self.smallest = smallest
+        self.buckets = buckets
+        self.pending = 0
+        self.in_flight = 0
+        self._started = {}
+        self.reset()
+
+    def reset(self):
+        # The queue gauges describe the machine now, so only their maxima
+        # start over.
+        for name in self.COUNTERS:
+            setattr(self, name, 0)
+
+        self.max_pending = self.pending
+        self.max_in_flight = self.in_flight
+        self.latency = {}
+        self.timeouts = {}
+        self.queue_wait = {}
+
+    # - Called by EventMachine -
+
+    def request_written(self, request):
+        self.requests_sent += 1
+        self._started[request] = self.timefunc()
+
+    def request_dequeued(self, request, queued=None):
+        # Time spent in the pending queue, per priority; zero for requests
+        # written as soon as they were sent.
+        waited = 0.0 if queued is None else self.timefunc() - queued
+        priority = getattr(request, 'priority', 0)
+
+        try:
+            histogram = self.queue_wait[priority]
+        except KeyError:
+            histogram = self.queue_wait[priority] = LatencyHistogram(
+                self.smallest, self.buckets)
+
+        histogram.add(waited)
+
+    def request_completed(self, request):
+        self.requests_completed += 1
+        started = self._started.pop(request, None)
+
+        if started is None:
+            return
+
+        name = type(request).__name__
+
+        try:
+            histogram = self.latency[name]
+        except KeyError:
+            histogram = self.latency[name] = LatencyHistogram(
+                self.smallest, self.buckets)
+
+        histogram.add(self.timefunc() - started)
+
+    def request_timed_out(self, request):
+        self.requests_timed_out += 1
+        self._started.pop(request, None)
+        name = type(request).__name__
+        self.timeouts[name] = self.timeouts.get(name, 0) + 1
+
+    def requests_abandoned(self, requests):
+        # Requests forgotten when the connection was lost; they will get
+        # neither a response nor a timeout.
+        for request in requests:
+            self.requests_lost += 1
+            self._started.pop(request, None)
+
+    def queues_changed(self, pending, in_flight):
+        self.pending = pending
+        self.in_flight = in_flight
+
+        if pending > self.max_pending:
+            self.max_pending = pending
+
+        if in_flight > self.max_in_flight:
+            self.max_in_flight = in_flight
+
+    # - Export -
+
+    def snapshot(self, reset=False):
+        snapshot = {name: getattr(self, name) for name in self.COUNTERS}
+        snapshot.update(
+            pending=self.pending,
+            in_flight=self.in_flight,
+            max_pending=self.max_pending,
+            max_in_flight=self.max_in_flight,
+            latency={
+                name: histogram.snapshot()
+                for name, histogram in self.latency.items()},
+            timeouts=dict(self.timeouts),
+            queue_wait={
+                priority: histogram.snapshot()
+                for priority, histogram in self.queue_wait.items()})
+
+        if reset:
+            self.reset()
+
+        return snapshot
@@ -13,9 +13,9 @@ class RxTimeoutError(Exception):
 
 class RxEventMinder(EventMinder):
 
-    def __init__(self, scheduler):
+    def __init__(self, scheduler, **options):
         self.scheduler = scheduler
-        super().__init__(timefunc=self._timefunc)
+        super().__init__(timefunc=self._timefunc, **options)
         self.current_disposable = None
     
     def _timefunc(self):
@@ -36,10 +36,14 @@ class RxEventMinder(EventMinder):
 
 class RxSerialProtocol(ProtocolDelegate):
 
-    def __init__(self, event_parser, scheduler, terminator=b'\n'):
+    def __init__(self, event_parser, scheduler, terminator=b'\n', *,
+                 event_minder=None, **options):
+        if event_minder is None:
+            event_minder = RxEventMinder(scheduler)
+
         self.event_parser = event_parser
-        minder = RxEventMinder(scheduler)
-        self.machine = EventMachine(minder, self, terminator)
+        self.machine = EventMachine(event_minder, self, terminator, **options)
+        self.metrics = self.machine.metrics
         self.events = Subject()
         self.requests = {}
     
@@ -63,8 +67,30 @@ class RxSerialProtocol(ProtocolDelegate):
 
     def send_request(self, request, write):
         obs = self.requests.setdefault(request, ReplaySubject())
-        self.machine.send(request, write)
+
+        try:
+            self.machine.send(request, write)
+        except ValueError:
+            # A correlation key already in use.
+            del self.requests[request]
+            raise
+
         return obs
 
+    def send_requests(self, requests, write):
+        requests = list(requests)
+        observables = [
+            self.requests.setdefault(request, ReplaySubject())
+            for request in requests]
+
+        try:
+            self.machine.send_many(requests, write)
+        except ValueError:
+            for request in requests:
+                self.requests.pop(request, None)
+            raise
+
+        return observables
+
     def received_data(self, data):
         self.machine.receive_data(data)
@@ -0,0 +1,257 @@
+import asyncio
+import heapq
+from itertools import count
+import random
+from threading import Condition
+import time
+
+
+class SimulatedDevice:
+    """
+    Timing model of a device on a serial line, wrapping a device `model`
+    with `feed(command) -> bytes` and optionally `broadcast() -> bytes`.
+
+    `latency` is the device's response time in seconds, or a callable
+    taking a `random.Random` for a distribution; `jitter` adds a uniform
+    random delay of up to that many seconds.  `baud` times every byte on the
+    line (10 bits per byte), so long replies arrive gradually and replies
+    queue behind each other.  Replies are split into chunks of random size up
+    to `max_chunk` bytes, and each byte is lost with probability `drop_rate`.
+    Every `broadcast_interval` seconds the model's broadcast is sent
+    unprompted.  Pass `seed` to make a run repeatable.
+
+    Transports call `received(data, now)` and `broadcast(now)`, which return
+    the `(time, chunk)` deliveries to make.
+    """
+
+    def __init__(self, model, *, terminator=b'\r', latency=0.0, jitter=0.0,
+                 baud=None, max_chunk=None, drop_rate=0.0,
+                 broadcast_interval=None, seed=None):
+        self.model = model
+        self.terminator = terminator
+        self.latency = latency
+        self.jitter = jitter
+        self.byte_time = 10 / baud if baud else 0.0
+        self.max_chunk = max_chunk
+        self.drop_rate = drop_rate
+        self.broadcast_interval = broadcast_interval
+        self.random = random.Random(seed)
+        self.dropped_bytes = 0
+        self._buffer = b''
+        self._uplink_free = 0.0
+        self._downlink_free = 0.0
+
+    def received(self, data, now):
+        # The command is complete once its last byte has crossed the line.
+        arrived = max(now, self._uplink_free) + len(data) * self.byte_time
+        self._uplink_free = arrived
+
+        *commands, self._buffer = (self._buffer + data).split(self.terminator)
+        deliveries = []
+
+        for command in commands:
+            response = self.model.feed(command + self.terminator)
+
+            if response:
+                deliveries += self._transmit(
+                    response, arrived + self._response_delay())
+
+        return deliveries
+
+    def broadcast(self, now):
+        return self._transmit(self.model.broadcast(), now)
+
+    def _response_delay(self):
+        latency = self.latency
+
+        if callable(latency):
+            latency = latency(self.random)
+
+        if self.jitter:
+            latency += self.random.uniform(0, self.jitter)
+
+        return latency
+
+    def _transmit(self, data, start):
+        if self.drop_rate:
+            kept = bytes(
+                byte for byte in data
+                if self.random.random() >= self.drop_rate)
+            self.dropped_bytes += len(data) - len(kept)
+            data = kept
+
+        # Replies go out one after another, each byte taking byte_time.
+        t = max(start, self._downlink_free)
+        deliveries = []
+        offset = 0
+
+        while offset < len(data):
+            size = len(data) - offset
+
+            if self.max_chunk:
+                size = min(size, self.random.randint(1, self.max_chunk))
+
+            t += size * self.byte_time
+            deliveries.append((t, data[offset:offset + size]))
+            offset += size
+
+        self._downlink_free = t
+        return deliveries
+
+
+class SimulatedTransport(asyncio.Transport):
+
+    def __init__(self, loop, device, protocol):
+        super().__init__()
+        self._loop = loop
+        self.device = device
+        self._protocol = protocol
+        self._closing = False
+        self._paused = False
+        self._held = []
+        self._broadcast_handle = None
+
+    def start(self):
+        self._protocol.connection_made(self)
+
+        if self.device.broadcast_interval:
+            self._schedule_broadcast()
+
+    def write(self, data):
+        if self._closing:
+            return
+
+        self._deliver(self.device.received(bytes(data), self._loop.time()))
+
+    def close(self):
+        if self._closing:
+            return
+
+        self._closing = True
+
+        if self._broadcast_handle is not None:
+            self._broadcast_handle.cancel()
+
+        self._loop.call_soon(self._protocol.connection_lost, None)
+
+    def is_closing(self):
+        return self._closing
+
+    def pause_reading(self):
+        self._paused = True
+
+    def resume_reading(self):
+        self._paused = False
+        held, self._held = self._held, []
+
+        for chunk in held:
+            self._data_received(chunk)
+
+    def is_reading(self):
+        return not self._paused
+
+    def get_write_buffer_size(self):
+        return 0
+
+    def get_protocol(self):
+        return self._protocol
+
+    def set_protocol(self, protocol):
+        self._protocol = protocol
+
+    def _deliver(self, deliveries):
+        for t, chunk in deliveries:
+            self._loop.call_at(t, self._data_received, chunk)
+
+    def _data_received(self, chunk):
+        if self._closing:
+            return
+
+        if self._paused:
+            self._held.append(chunk)
+        else:
+            self._protocol.data_received(chunk)
+
+    def _schedule_broadcast(self):
+        self._broadcast_handle = self._loop.call_later(
+            self.device.broadcast_interval, self._broadcast)
+
+    def _broadcast(self):
+        self._deliver(self.device.broadcast(self._loop.time()))
+        self._schedule_broadcast()
+
+
+async def create_simulated_connection(protocol_factory, device, *,
+                                      loop=None):
+    """
+    Connects a protocol to a SimulatedDevice, like `loop.create_connection`.
+    """
+    if loop is None:
+        loop = asyncio.get_event_loop()
+
+    protocol = protocol_factory()
+    transport = SimulatedTransport(loop, device, protocol)
+    transport.start()
+    return transport, protocol
+
+
+class SimulatedPort:
+    """
+    Blocking `read` and `write` callables for a ThreadedProtocol, talking to
+    a SimulatedDevice.  `read` raises OSError once the port is closed.
+    """
+
+    def __init__(self, device, *, timefunc=time.monotonic):
+        self.device = device
+        self.timefunc = timefunc
+        self.closed = False
+        self._condition = Condition()
+        self._deliveries = []
+        self._sequence = count()
+        self._next_broadcast = None
+
+        if device.broadcast_interval:
+            self._next_broadcast = timefunc() + device.broadcast_interval
+
+    def write(self, data):
+        with self._condition:
+            if self.closed:
+                raise OSError('port is closed')
+
+            self._queue(self.device.received(bytes(data), self.timefunc()))
+
+    def read(self):
+        with self._condition:
+            while True:
+                if self.closed:
+                    raise OSError('port is closed')
+
+                now = self.timefunc()
+
+                if self._next_broadcast is not None and \
+                        self._next_broadcast <= now:
+                    self._queue(self.device.broadcast(self._next_broadcast))
+                    self._next_broadcast += self.device.broadcast_interval
+
+                if self._deliveries and self._deliveries[0][0] <= now:
+                    return heapq.heappop(self._deliveries)[2]
+
+                deadlines = [
+                    t for t in (
+                        self._deliveries[0][0] if self._deliveries else None,
+                        self._next_broadcast)
+                    if t is not None]
+                self._condition.wait(
+                    min(deadlines) - now if deadlines else None)
+
+    def close(self):
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+    def _queue(self, deliveries):
+        for t, chunk in deliveries:
+            heapq.heappush(
+                self._deliveries, (t, next(self._sequence), chunk))
+
+        self._condition.notify_all()
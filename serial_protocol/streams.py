@@ -0,0 +1,124 @@
+from .framing import DelimiterFramer
+
+
+class EventPipeline:
+    """
+    Transform and filter stages applied in order to each parsed event.
+    Adding a stage returns a new pipeline, so a pipeline can be shared and
+    extended.
+    """
+
+    def __init__(self, stages=()):
+        self.stages = tuple(stages)
+
+    def map(self, func):
+        # `func(event)` returns the event to pass on.
+        return EventPipeline(self.stages + ((True, func),))
+
+    def filter(self, predicate):
+        # Events for which `predicate(event)` is false are dropped.
+        return EventPipeline(self.stages + ((False, predicate),))
+
+    def of_type(self, *event_classes):
+        return self.filter(lambda event: isinstance(event, event_classes))
+
+    def apply(self, event):
+        # The transformed event, or None if a filter dropped it.
+        for transform, func in self.stages:
+            if transform:
+                event = func(event)
+            elif not func(event):
+                return None
+
+        return event
+
+
+class _Parser:
+    # Frames and parses chunks, as an EventMachine would with no requests
+    # of its own.
+
+    def __init__(self, event_parser, terminator, framer, requests, pipeline,
+                 max_frame_size):
+        self.event_parser = event_parser
+        self.framer = framer if framer is not None else \
+            DelimiterFramer(terminator)
+        self.requests = requests
+        self.pipeline = pipeline
+        self.max_frame_size = max_frame_size
+        self._buffer = bytearray()
+
+    def feed(self, chunk):
+        buffer = self._buffer
+        buffer += chunk
+        spans, consumed = self.framer.scan(buffer, len(buffer))
+
+        with memoryview(buffer) as view:
+            frames = [
+                self.framer.decode(bytes(view[start:end]))
+                for start, end in spans]
+
+        del buffer[:consumed]
+
+        for frame in frames:
+            event, request = self.event_parser(frame, self.requests)
+
+            if event is None:
+                continue
+
+            if self.pipeline is not None:
+                event = self.pipeline.apply(event)
+
+                if event is None:
+                    continue
+
+            yield event, request
+
+        # Only after the chunk's complete frames, which are still valid.
+        if self.max_frame_size is not None and \
+                len(buffer) > self.max_frame_size:
+            raise ValueError(
+                f'no frame end within {self.max_frame_size} bytes')
+
+
+def iter_events(chunks, event_parser, terminator=b'\n', *, framer=None,
+                requests=(), pipeline=None, max_frame_size=None):
+    """
+    Lazily yields the `(event, request)` pairs parsed from an iterable of
+    byte chunks.  `event_parser` has the `event_for_data` signature (an
+    EventRegistry works) and is passed `requests`.  Unparsed frames are
+    skipped, and events go through `pipeline` if given.
+
+    Only the current chunk and any incomplete frame are held in memory;
+    `max_frame_size` raises ValueError if an incomplete frame grows past it.
+    """
+    parser = _Parser(
+        event_parser, terminator, framer, requests, pipeline, max_frame_size)
+
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+
+
+async def aiter_events(reader, event_parser, terminator=b'\n', *,
+                       framer=None, requests=(), pipeline=None,
+                       max_frame_size=None, read_size=65536):
+    """
+    `iter_events` for an `asyncio.StreamReader`, or anything else with a
+    coroutine `read(n)` returning b'' at the end, or an async iterable of
+    chunks.
+    """
+    parser = _Parser(
+        event_parser, terminator, framer, requests, pipeline, max_frame_size)
+
+    if hasattr(reader, 'read'):
+        while True:
+            chunk = await reader.read(read_size)
+
+            if not chunk:
+                break
+
+            for pair in parser.feed(chunk):
+                yield pair
+    else:
+        async for chunk in reader:
+            for pair in parser.feed(chunk):
+                yield pair
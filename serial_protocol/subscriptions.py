@@ -0,0 +1,113 @@
+from collections import deque
+
+
+class Subscription:
+    """
+    A bounded buffer of the events of some classes (and their subclasses).
+
+    When full, the oldest buffered event is dropped and counted in
+    `dropped`.  The asyncio and threaded wrappers add ways to wait for
+    events.
+    """
+
+    def __init__(self, router, classes, maxsize=256):
+        self.router = router
+        self.classes = classes or (object,)
+        self.maxsize = maxsize
+        self.dropped = 0
+        self.closed = False
+        self._events = deque()
+
+    def put(self, event):
+        if self.maxsize and len(self._events) >= self.maxsize:
+            self._events.popleft()
+            self.dropped += 1
+
+        self._events.append(event)
+        self._wake()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.router.remove(self)
+            self._wake()
+
+    def _wake(self):
+        pass
+
+
+class SubscriptionRouter:
+    """
+    Routes events to the subscriptions for their class, so the cost of an
+    event is one dictionary lookup plus one `put` per matching subscription.
+
+    Subscribing and unsubscribing replace the tables rather than change
+    them, so a subscription may be closed on another thread than the one
+    routing events.
+    """
+
+    def __init__(self):
+        self._by_class = {}
+        self._dispatch = {}
+
+    def add(self, subscription):
+        by_class = {
+            klass: list(subscriptions)
+            for klass, subscriptions in self._by_class.items()}
+
+        for klass in subscription.classes:
+            by_class.setdefault(klass, []).append(subscription)
+
+        self._replace(by_class)
+        return subscription
+
+    def remove(self, subscription):
+        by_class = {}
+
+        for klass, subscriptions in self._by_class.items():
+            subscriptions = [s for s in subscriptions if s is not subscription]
+
+            if subscriptions:
+                by_class[klass] = subscriptions
+
+        self._replace(by_class)
+
+    def close_all(self):
+        # Ends every subscription, e.g. when the connection is lost.
+        subscriptions = dict.fromkeys(
+            subscription
+            for subscriptions in self._by_class.values()
+            for subscription in subscriptions)
+        self._replace({})
+
+        for subscription in subscriptions:
+            subscription.close()
+
+    def _replace(self, by_class):
+        # The class table first: a router that sees the new dispatch cache
+        # also sees the new class table.
+        self._by_class = by_class
+        self._dispatch = {}
+
+    def route(self, event):
+        # Returns whether any subscription took the event.
+        dispatch = self._dispatch
+        by_class = self._by_class
+
+        if not by_class:
+            return False
+
+        klass = type(event)
+
+        try:
+            subscriptions = dispatch[klass]
+        except KeyError:
+            subscriptions = dispatch[klass] = list(dict.fromkeys(
+                subscription
+                for base in klass.__mro__
+                for subscription in by_class.get(base, ())))
+
+        for subscription in subscriptions:
+            subscription.put(event)
+
+        return bool(subscriptions)
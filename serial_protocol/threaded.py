@@ -1,10 +1,18 @@
-from concurrent.futures import Future, TimeoutError
-from queue import Queue
-from threading import Timer, Thread
+from collections import deque
+from concurrent.futures import Future, InvalidStateError, TimeoutError
+import errno
+import logging
+import os
+from queue import Empty, Queue
+import selectors
+from threading import Condition, Lock, RLock, Thread
 
-from .timing import EventMinder
+from .timing import EventMinder, TimerHeap
 from .protocol import ProtocolDelegate
 from .machine import EventMachine
+from .subscriptions import Subscription, SubscriptionRouter
+
+logger = logging.getLogger(__name__)
 
 
 class RequestTimeout(TimeoutError):
@@ -13,65 +21,461 @@ class RequestTimeout(TimeoutError):
         self.request = request
 
 
+def _resolve(f, setter, value):
+    # The caller may have cancelled the future meanwhile.
+    try:
+        setter(value)
+    except InvalidStateError:
+        pass
+
+
 class ThreadedEventMinder(EventMinder):
+    """
+    Runs timeouts on a single timer thread.
+
+    Timeout callbacks run while holding `lock`; protocols sharing this minder
+    use the same lock to serialize access to their machines.
+    """
 
-    def __init__(self):
-        super().__init__()
-        self._timer = None
+    def __init__(self, *, lock=None, **options):
+        super().__init__(**options)
+        self.lock = lock if lock is not None else RLock()
+        self._condition = Condition(Lock())
+        self._deadline = None
+        self._thread = None
+        self._closed = False
 
     def reset_timer(self):
-        if self._timer is not None:
-            self._timer.cancel()
-            self._timer = None
-        
-        delay = self._next_event_delay()
+        deadline = self._sched.next_time()
 
-        if delay is not None:
-            self._timer = Timer(
-                interval=delay,
-                function=self.run)
+        with self._condition:
+            if deadline == self._deadline:
+                return
 
+            self._deadline = deadline
 
-class ThreadedProtocol(ProtocolDelegate):
+            if self._thread is None and deadline is not None:
+                self._thread = Thread(
+                    target=self._run_timer, name='EventMinder', daemon=True)
+                self._thread.start()
+
+            self._condition.notify()
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+
+    def _run_timer(self):
+        timefunc = self._sched.timefunc
+
+        while True:
+            with self._condition:
+                while not self._closed:
+                    if self._deadline is None:
+                        self._condition.wait()
+                        continue
+
+                    remaining = self._deadline - timefunc()
+
+                    if remaining <= 0:
+                        break
+
+                    self._condition.wait(remaining)
+
+                if self._closed:
+                    return
+
+                self._deadline = None
+
+            with self.lock:
+                try:
+                    self.run()
+                except Exception:
+                    # Later timeouts still have to fire.
+                    logger.exception('Error in a timer callback.')
+                finally:
+                    self.reset_timer()
+
+
+class ThreadedSubscription(Subscription):
+    """An iterator over a subscription's events, blocking for the next."""
+
+    def __init__(self, router, classes, maxsize=256):
+        super().__init__(router, classes, maxsize)
+        self._condition = Condition()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return self.get()
+        except Empty:
+            raise StopIteration
+
+    def get(self, timeout=None):
+        # Raises queue.Empty on timeout, or once closed and drained.
+        with self._condition:
+            if not self._condition.wait_for(
+                    lambda: self._events or self.closed, timeout) or \
+                    not self._events:
+                raise Empty
+
+            return self._events.popleft()
+
+    def put(self, event):
+        with self._condition:
+            super().put(event)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _wake(self):
+        with self._condition:
+            self._condition.notify_all()
+
+
+class BaseThreadedProtocol(ProtocolDelegate):
+
+    def __init__(self, event_parser, terminator, *, event_minder=None,
+                 cache=None, **options):
+        if event_minder is None:
+            event_minder = ThreadedEventMinder()
 
-    def __init__(self, event_parser, terminator, read, write):
-        self.read_thread = Thread(target=self.read_data, args=(read,))
-        self.write = write
         self.event_parser = event_parser
+        self.cache = cache
+        self._subscriptions = SubscriptionRouter()
+        self.lock = event_minder.lock
         self.machine = EventMachine(
-            ThreadedEventMinder(),
+            event_minder,
             self,
-            terminator)
+            terminator,
+            **options)
+        self.metrics = self.machine.metrics
         self.futures = {}
         self.events = Queue()
-        self.read_thread.start()
-    
-    def read_data(self, read):
-        while True:
-            self.machine.receive_data(read())
-    
+
+    def write(self, data):  # pragma: no cover
+        raise NotImplementedError(
+            f'{self.__class__.__name__} must implement write(bytes)')
+
+    def receive_data(self, data):
+        with self.lock:
+            self.machine.receive_data(data)
+
+    def event_for_data(self, data, requests):
+        return self.event_parser(data, requests)
+
     def event_received(self, event):
+        if self.cache is not None:
+            self.cache.event_received(event)
+
+        if self._subscriptions.route(event):
+            return
+
         self.events.put_nowait(event)
-    
+
     def request_completed(self, request, response):
-        try:
-            f = self.futures.pop(request)
-        except KeyError:
-            pass
-        else:
-            f.set_result(response)
+        if self.cache is not None:
+            self.cache.response_received(request, response)
+
+        f = self.futures.pop(request, None)
+
+        if f is not None:
+            _resolve(f, f.set_result, response)
 
     def request_timed_out(self, request):
+        f = self.futures.pop(request, None)
+
+        if f is not None:
+            _resolve(f, f.set_exception, RequestTimeout(request))
+
+    def connection_lost(self, exc):
+        # Fail everything still waiting for a response.
+        if exc is None:
+            exc = ConnectionError('Connection lost')
+
+        with self.lock:
+            self.machine.abandon_requests()
+            futures, self.futures = self.futures, {}
+
+        for f in futures.values():
+            _resolve(f, f.set_exception, exc)
+
+        # Subscribers finish their buffered events, then stop.
+        self._subscriptions.close_all()
+
+    def send_request(self, request):
+        # Register the future first: the response may be read on another
+        # thread as soon as the request is written.
+        with self.lock:
+            f = self._cached_response(request)
+
+            if f is None:
+                f = self.futures.setdefault(request, Future())
+
+                try:
+                    self.machine.send(request, self.write)
+                except ValueError:
+                    # A correlation key already in use.
+                    self.futures.pop(request, None)
+                    raise
+        return f
+
+    def send_requests(self, requests):
+        requests = list(requests)
+        futures = {}
+
+        to_send = []
+
+        with self.lock:
+            for request in requests:
+                f = self._cached_response(request)
+
+                if f is None:
+                    f = self.futures.setdefault(request, Future())
+                    to_send.append(request)
+
+                futures[request] = f
+
+            try:
+                self.machine.send_many(to_send, self.write)
+            except ValueError:
+                for request in to_send:
+                    self.futures.pop(request, None)
+                raise
+        return [futures[request] for request in requests]
+
+    def _cached_response(self, request):
+        # A completed future for a request answered from the cache.
+        if self.cache is None:
+            return None
+
+        response = self.cache.lookup(request)
+
+        if response is None:
+            return None
+
+        f = Future()
+        f.set_result(response)
+        return f
+
+    def subscribe(self, *event_classes, maxsize=256):
+        """
+        Iterate over received events of `event_classes` (all events when
+        none are given).  Events taken by a subscription are not put on
+        `events`.
+        """
+        return self._subscriptions.add(ThreadedSubscription(
+            self._subscriptions, event_classes, maxsize))
+
+    def get_next_event(self, timeout=None):
+        return self.events.get(timeout=timeout)
+
+
+class ThreadedProtocol(BaseThreadedProtocol):
+    """Reads with a blocking `read` callable on a thread of its own."""
+
+    def __init__(self, event_parser, terminator, read, write, **options):
+        super().__init__(event_parser, terminator, **options)
+        self.write = write
+        self.read_thread = Thread(
+            target=self.read_data, args=(read,), daemon=True)
+        self.read_thread.start()
+
+    def read_data(self, read):
+        while True:
+            try:
+                data = read()
+            except OSError as e:
+                # The port was closed.
+                self.connection_lost(e)
+                return
+
+            if data:
+                self.receive_data(data)
+
+
+class SelectorProtocol(BaseThreadedProtocol):
+    """
+    A machine reading and writing a non-blocking file descriptor (a serial
+    port, pty or socket) on a SelectorLoop's I/O thread.
+    """
+
+    def __init__(self, loop, fd, event_parser, terminator, **options):
+        super().__init__(
+            event_parser, terminator, event_minder=loop.event_minder,
+            **options)
+        self.loop = loop
+        self.fd = fd if isinstance(fd, int) else fd.fileno()
+        self.closed = False
+        self._write_buffer = bytearray()
+        os.set_blocking(self.fd, False)
+
+    def write(self, data):
+        # Called with the lock held.  Write what the descriptor takes now and
+        # let the I/O thread write the rest when it becomes writable.
+        if self.closed:
+            raise ConnectionError('protocol is closed')
+
+        if self._write_buffer:
+            self._write_buffer += data
+            return
+
         try:
-            f = self.futures.pop(request)
-        except KeyError:
-            pass
+            written = os.write(self.fd, data)
+        except BlockingIOError:
+            written = 0
+
+        if written < len(data):
+            self._write_buffer += data[written:]
+            self.loop.call_soon(self.loop._want_write, self, True)
+
+    def close(self):
+        self.loop.call_soon(self.loop._unregister, self)
+
+    def _read_ready(self):
+        try:
+            data = os.read(self.fd, self.machine.read_size)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            # A pty whose other end has gone away reports EIO.
+            if e.errno != errno.EIO:
+                raise
+            data = b''
+
+        if data:
+            self.receive_data(data)
         else:
-            f.set_exception(RequestTimeout(request))
+            self.loop._unregister(self)
 
-    def send_request(self, request):
-        self.machine.send(request, self.write)
-        return self.futures.setdefault(request, Future())
-    
-    def get_next_event(self):
-        return self.events.get()
+    def _write_ready(self):
+        with self.lock:
+            try:
+                written = os.write(self.fd, self._write_buffer)
+            except BlockingIOError:
+                return
+
+            del self._write_buffer[:written]
+
+            if not self._write_buffer:
+                self.loop._want_write(self, False)
+
+
+class SelectorLoop:
+    """
+    One I/O thread multiplexing many SelectorProtocols, sharing one
+    ThreadedEventMinder (and its timer thread and lock) between them.
+    """
+
+    def __init__(self, *, event_minder=None):
+        if event_minder is None:
+            event_minder = ThreadedEventMinder(queue_class=TimerHeap)
+
+        self.event_minder = event_minder
+        self.lock = event_minder.lock
+        self._selector = selectors.DefaultSelector()
+        self._calls = deque()
+        self._wakeup_read, self._wakeup_write = os.pipe()
+        os.set_blocking(self._wakeup_read, False)
+        os.set_blocking(self._wakeup_write, False)
+        self._selector.register(
+            self._wakeup_read, selectors.EVENT_READ, None)
+        self._closed = False
+        self._thread = Thread(
+            target=self._run, name='SelectorLoop', daemon=True)
+        self._thread.start()
+
+    def open(self, fd, event_parser, terminator, **options):
+        protocol = SelectorProtocol(
+            self, fd, event_parser, terminator, **options)
+        self.call_soon(self._register, protocol)
+        return protocol
+
+    def call_soon(self, callback, *args):
+        self._calls.append((callback, args))
+
+        try:
+            os.write(self._wakeup_write, b'\0')
+        except BlockingIOError:
+            pass  # Already awake.
+
+    def close(self):
+        self._closed = True
+        self.call_soon(lambda: None)
+        self._thread.join()
+        self.event_minder.close()
+
+    # - I/O thread -
+
+    def _register(self, protocol):
+        self._selector.register(
+            protocol.fd, selectors.EVENT_READ, protocol)
+
+    def _unregister(self, protocol, exc=None):
+        if not protocol.closed:
+            protocol.closed = True
+            self._selector.unregister(protocol.fd)
+            protocol.connection_lost(exc)
+
+    def _want_write(self, protocol, enabled):
+        if protocol.closed:
+            return
+
+        events = selectors.EVENT_READ
+
+        if enabled:
+            events |= selectors.EVENT_WRITE
+
+        self._selector.modify(protocol.fd, events, protocol)
+
+    def _run(self):
+        try:
+            while not self._closed:
+                for key, mask in self._selector.select():
+                    protocol = key.data
+
+                    if protocol is None:
+                        self._drain_wakeup()
+                        continue
+
+                    try:
+                        if mask & selectors.EVENT_READ and \
+                                not protocol.closed:
+                            protocol._read_ready()
+
+                        if mask & selectors.EVENT_WRITE and \
+                                not protocol.closed:
+                            protocol._write_ready()
+                    except Exception as e:
+                        # Close this port only; the thread serves the rest.
+                        logger.exception('Error handling %r.', protocol)
+                        self._unregister(protocol, e)
+
+                while self._calls:
+                    callback, args = self._calls.popleft()
+
+                    try:
+                        callback(*args)
+                    except Exception:
+                        logger.exception('Error in callback %r.', callback)
+        finally:
+            for key in list(self._selector.get_map().values()):
+                if key.data is not None:
+                    self._unregister(key.data)
+
+            self._selector.close()
+            os.close(self._wakeup_read)
+            os.close(self._wakeup_write)
+
+    def _drain_wakeup(self):
+        try:
+            while os.read(self._wakeup_read, 4096):
+                pass
+        except BlockingIOError:
+            pass
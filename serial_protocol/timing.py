@@ -1,11 +1,121 @@
+from heapq import heapify, heappop, heappush
+from itertools import count
 from sched import scheduler
+import threading
 import time
 
+# Shared by timers without keyword arguments; never modified.
+_NO_KWARGS = {}
+
+
+class Scheduler(scheduler):
+    """A `sched.scheduler` that can report its next deadline cheaply."""
+
+    def next_time(self):
+        # The heap head is the earliest event; `queue` would copy and sort.
+        with self._lock:
+            if not self._queue:
+                return None
+            return self._queue[0].time
+
+
+class TimerHeap:
+    """
+    A drop-in for `Scheduler` for many concurrent timeouts.
+
+    Cancelled events are only marked, making `cancel` O(1).  They are skipped
+    when they reach the top of the heap, and the heap is rebuilt once they
+    make up more than half of it.
+    """
+
+    def __init__(self, timefunc=time.monotonic, delayfunc=time.sleep):
+        self.timefunc = timefunc
+        self.delayfunc = delayfunc
+        self._heap = []
+        self._cancelled = 0
+        self._sequence = count()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._heap) - self._cancelled
+
+    def enterabs(self, time, priority, action, argument=(), kwargs={}):
+        event = [time, priority, next(self._sequence), action, argument,
+                 kwargs]
+
+        with self._lock:
+            heappush(self._heap, event)
+
+        return event
+
+    def enter(self, delay, priority, action, argument=(), kwargs={}):
+        return self.enterabs(
+            self.timefunc() + delay, priority, action, argument, kwargs)
+
+    def cancel(self, event):
+        with self._lock:
+            if event[3] is None:
+                return
+
+            event[3] = None
+            self._cancelled += 1
+
+            if self._cancelled > 32 and self._cancelled * 2 > len(self._heap):
+                # In place: `run` may be iterating over this list.
+                self._heap[:] = [e for e in self._heap if e[3] is not None]
+                heapify(self._heap)
+                self._cancelled = 0
+
+    def _pop_cancelled(self):
+        heap = self._heap
+
+        while heap and heap[0][3] is None:
+            heappop(heap)
+            self._cancelled -= 1
+
+    def empty(self):
+        return self.next_time() is None
+
+    def next_time(self):
+        with self._lock:
+            self._pop_cancelled()
+            return self._heap[0][0] if self._heap else None
+
+    def run(self, blocking=True):
+        heap = self._heap
+
+        while True:
+            with self._lock:
+                self._pop_cancelled()
+
+                if not heap:
+                    break
+
+                event = heap[0]
+                now = self.timefunc()
+
+                if event[0] > now:
+                    delay = True
+                else:
+                    delay = False
+                    heappop(heap)
+                    action, argument, kwargs = event[3:]
+                    event[3] = None
+
+            if delay:
+                if not blocking:
+                    return event[0] - now
+                self.delayfunc(event[0] - now)
+            else:
+                action(*argument, **kwargs)
+                self.delayfunc(0)
+
 
 class EventMinder:
     
-    def __init__(self, *, timefunc=time.monotonic):
-        self._sched = scheduler(timefunc=timefunc, delayfunc=self._delayfunc)
+    def __init__(self, *, timefunc=time.monotonic, queue_class=Scheduler):
+        self._sched = queue_class(
+            timefunc=timefunc, delayfunc=self._delayfunc)
     
     def _delayfunc(self, *args):
         delay = self._next_event_delay()
@@ -13,12 +123,16 @@ class EventMinder:
             self.reset_timer()
 
     def _next_event_delay(self):
-        if self._sched.empty():
+        t = self._sched.next_time()
+
+        if t is None:
             return None
         
-        t, *_ = self._sched.queue[0]
         return t - self._sched.timefunc()
 
+    def now(self):
+        return self._sched.timefunc()
+
     def run(self):
         self._sched.run(blocking=False)
 
@@ -32,7 +146,7 @@ class EventMinder:
             priority=0,
             action=callable,
             argument=args,
-            kwargs=kwargs)
+            kwargs=kwargs or _NO_KWARGS)
         
         self.reset_timer()
 
@@ -44,7 +158,7 @@ class EventMinder:
             priority=0,
             action=callable,
             argument=args,
-            kwargs=kwargs)
+            kwargs=kwargs or _NO_KWARGS)
         
         self.reset_timer()
 
@@ -15,6 +15,10 @@ setup(
     version='0.1',
     packages=['serial_protocol'],
     include_package_data=True,
+    extras_require={
+        # Vectorized `framing.frame_ends`.
+        'bulk': ['numpy'],
+    },
     license='MIT License',
     description='A library for building serial control protocol drivers.',
     long_description=README,
@@ -35,7 +35,7 @@ If a request is ever unrecognized, the response is:
 
 import re
 
-from serial_protocol.events import Event
+from serial_protocol.events import Event, EventRegistry
 
 
 class ASCIIKVS:
@@ -95,6 +95,14 @@ class GET(AKVSEvent):
         return b'GET %b\r' % (self.slot)
 
 
+class Poll(GET):
+    # A GET that may share the response of an identical one in flight.
+
+    @property
+    def idempotency_key(self):
+        return self.to_bytes()
+
+
 class SET(AKVSEvent):
 
     def __init__(self, slot, value):
@@ -110,12 +118,7 @@ class NOWResponse(AKVSEvent):
     pattern = re.compile(br'^NOW A ([A-Z]) B ([A-Z])\r$')
 
     @classmethod
-    def from_bytes(cls, data):
-        m = cls.pattern.match(data)
-
-        if m is None:
-            raise ValueError()
-
+    def from_match(cls, m):
         instance = cls()
         instance.A = m.group(1)
         instance.B = m.group(2)
@@ -126,12 +129,7 @@ class OKResponse(AKVSEvent):
     pattern = re.compile(br'^OK (A|B) ([A-Z])\r$')
 
     @classmethod
-    def from_bytes(cls, data):
-        m = cls.pattern.match(data)
-        
-        if m is None:
-            raise ValueError()
-        
+    def from_match(cls, m):
         instance = cls()
         instance.slot = m.group(1)
         instance.value = m.group(2)
@@ -142,12 +140,7 @@ class NOResponse(AKVSEvent):
     pattern = re.compile(br'^NO (A|B) ([A-Z])\r$')
 
     @classmethod
-    def from_bytes(cls, data):
-        m = cls.pattern.match(data)
-        
-        if m is None:
-            raise ValueError()
-        
+    def from_match(cls, m):
         instance = cls()
         instance.slot = m.group(1)
         instance.value = m.group(2)
@@ -157,30 +150,18 @@ class NOResponse(AKVSEvent):
 class BADResponse(AKVSEvent):
     pattern = re.compile(br'^BAD\r$')
 
-    @classmethod
-    def from_bytes(cls, data):
-        m = cls.pattern.match(data)
-        
-        if m is None:
-            raise ValueError()
-        
-        instance = cls()
 
-        return instance
+registry = EventRegistry()
+registry.register(NOWResponse, prefix=b'NOW ', unsolicited=True)
+registry.register(OKResponse, prefix=b'OK ')
+registry.register(NOResponse, prefix=b'NO ')
+registry.register(BADResponse)
 
 
 def event_from_data(data, requests):
-    request = None
+    event, request = registry(data, requests)
 
-    for klass in (NOWResponse, OKResponse, NOResponse, BADResponse):
-        try:
-            instance = klass.from_bytes(data)
-        except ValueError:
-            continue
-            
-        if not isinstance(instance, NOWResponse) and len(requests):
-            request = list(requests)[0]
-        
-        return instance, request
-    else:
+    if event is None:
         raise ValueError()
+
+    return event, request
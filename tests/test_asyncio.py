@@ -1,12 +1,17 @@
 import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import time
 import unittest
 from unittest.mock import MagicMock
 
 from serial_protocol.asyncio import \
-    AsyncIOEventMachineProtocol, AsyncIOEventMinder, RequestTimeout
+    AsyncIOEventMachineProtocol, AsyncIOBufferedEventMachineProtocol, \
+    AsyncIOPooledEventMachineProtocol, AsyncIOEventMinder, RequestTimeout, \
+    DROP_OLDEST, DROP_NEWEST
 
-from .example_machine import ASCIIKVS, event_from_data, \
-    GET, SET, OKResponse, NOResponse, BADResponse, NOWResponse
+from .example_machine import ASCIIKVS, event_from_data, registry, \
+    GET, SET, Poll, OKResponse, NOResponse, BADResponse, NOWResponse
+from .test_sansio import Tagged
 
 
 class TestEventMinder(unittest.TestCase):
@@ -90,6 +95,36 @@ class TestEventMinder(unittest.TestCase):
         self.assertFalse(mock.callable2.called)
         self.assertIsNotNone(self.minder._timer_handle)
 
+    def test_timer_rearmed_only_when_earlier(self):
+        loop = MagicMock()
+        minder = AsyncIOEventMinder(loop=loop)
+        mock = MagicMock()
+
+        for _ in range(100):
+            minder.remove(minder.notify_after(1.0, mock.callable))
+
+        self.assertEqual(minder.timers_created, 1)
+        self.assertEqual(loop.call_later.call_count, 1)
+
+        minder.notify_after(0.5, mock.callable)
+        self.assertEqual(minder.timers_created, 2)
+        self.assertTrue(loop.call_later.return_value.cancel.called)
+
+    def test_stale_timer_rearms(self):
+        mock = MagicMock()
+
+        async def runner():
+            self.minder.remove(
+                self.minder.notify_after(0.001, mock.callable1))
+            self.minder.notify_after(0.003, mock.callable2)
+            await asyncio.sleep(0.005)
+
+        self.loop.run_until_complete(runner())
+        self.assertFalse(mock.callable1.called)
+        self.assertTrue(mock.callable2.called)
+        self.assertEqual(self.minder.timers_created, 2)
+        self.assertIsNone(self.minder._timer_handle)
+
 
 class AsyncIOSimulatorProtocol(asyncio.Protocol):
 
@@ -294,3 +329,283 @@ class TestExampleMachine(unittest.TestCase):
         results = self.loop.run_until_complete(runner())
         self.assertEqual(results[0].value, b'E')
         self.assertEqual(results[1].value, b'J')
+
+    def test_coalesced_polls(self):
+        async def runner():
+            await self._init_connection(delay=0.01)
+            return await asyncio.gather(*(
+                self.client.send_request(Poll(b'A')) for _ in range(3)))
+
+        results = self.loop.run_until_complete(runner())
+        self.assertEqual([result.value for result in results], [b'A'] * 3)
+        self.assertEqual(self.client.machine.coalesced_requests, 2)
+
+
+class TestBufferedExampleMachine(TestExampleMachine):
+
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+        self.protocol = AsyncIOBufferedEventMachineProtocol.factory(
+            event_from_data,
+            terminator=b'\r',
+            loop=self.loop,
+            read_size=16)
+
+    def test_reads_into_machine_buffer(self):
+        async def runner():
+            await self._init_connection()
+            await self.client.send_request(SET(b'A', b'K'))
+            return await self.client.send_request(GET(b'A'))
+
+        result = self.loop.run_until_complete(runner())
+        self.assertEqual(result.value, b'K')
+        machine = self.client.machine
+        self.assertEqual(machine._input_end, 0)
+        self.assertGreater(len(machine._input_buffer), 0)
+
+
+class TestPooledExampleMachine(TestExampleMachine):
+
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+        self.executor = ThreadPoolExecutor(4)
+        self.protocol = AsyncIOPooledEventMachineProtocol.factory(
+            registry.pair,
+            terminator=b'\r',
+            loop=self.loop,
+            decoder=registry.parse,
+            executor=self.executor)
+
+    def tearDown(self):
+        super().tearDown()
+        self.executor.shutdown()
+
+
+def slow_parse(data):
+    # Later frames decode faster, so they finish out of order.
+    time.sleep(0.02 / len(data))
+    return registry.parse(data)
+
+
+class TestPooledDecoding(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+
+    def _protocol(self, executor):
+        protocol = AsyncIOPooledEventMachineProtocol(
+            registry.pair, b'\r', loop=self.loop, decoder=slow_parse,
+            executor=executor)
+        protocol.connection_made(MagicMock())
+        return protocol
+
+    def _exchange(self, protocol):
+        async def runner():
+            futures = protocol.send_requests(
+                [GET(b'A'), SET(b'A', b'B'), GET(b'B')])
+            protocol.data_received(
+                b'OK A A\rNOW A B B A\rjunk\rNO A A\rOK B A\r')
+            return await asyncio.gather(*futures)
+
+        return self.loop.run_until_complete(runner())
+
+    def test_wire_order_delivery(self):
+        with ThreadPoolExecutor(4) as executor:
+            protocol = self._protocol(executor)
+            protocol.machine.max_in_flight = 3
+            responses = self._exchange(protocol)
+
+        self.assertEqual(
+            [type(r) for r in responses],
+            [OKResponse, NOResponse, OKResponse])
+        self.assertEqual(responses[2].slot, b'B')
+        self.assertIsInstance(
+            protocol.event_queue.get_nowait(), NOWResponse)
+        self.assertTrue(protocol.event_queue.empty())
+
+    def test_process_pool(self):
+        with ProcessPoolExecutor(2) as executor:
+            protocol = self._protocol(executor)
+            protocol.machine.max_in_flight = 3
+            responses = self._exchange(protocol)
+
+        self.assertEqual(responses[1].value, b'A')
+
+
+class TestFlowControl(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+        self.transport = MagicMock()
+
+    def _protocol(self, **options):
+        protocol = AsyncIOEventMachineProtocol(
+            event_from_data, b'\r', loop=self.loop, **options)
+        protocol.connection_made(self.transport)
+        return protocol
+
+    def _broadcast(self, protocol, *values):
+        protocol.data_received(b''.join(
+            b'NOW A %b B A\r' % value for value in values))
+
+    def test_requests_held_while_paused(self):
+        protocol = self._protocol(max_in_flight=4)
+        protocol.pause_writing()
+        futures = [
+            protocol.send_request(GET(b'A')),
+            protocol.send_request(SET(b'A', b'B'))]
+
+        self.assertFalse(self.transport.write.called)
+        self.assertEqual(len(futures), 2)
+
+        protocol.resume_writing()
+
+        # Flushed as one batch.
+        self.assertEqual(
+            [call[0][0] for call in self.transport.write.call_args_list],
+            [b'GET A\rSET A B\r'])
+
+    def test_held_requests_coalesce(self):
+        protocol = self._protocol(max_in_flight=4)
+        protocol.pause_writing()
+        futures = [protocol.send_request(Poll(b'A')) for _ in range(3)]
+        protocol.resume_writing()
+
+        self.transport.write.assert_called_once_with(b'GET A\r')
+        protocol.data_received(b'OK A A\r')
+        self.assertTrue(all(f.result().value == b'A' for f in futures))
+
+    def test_held_keys_are_checked(self):
+        protocol = self._protocol(max_in_flight=4)
+        waiting = protocol.send_request(Tagged(3))
+        protocol.pause_writing()
+        first = protocol.send_request(Tagged(1))
+
+        for tag in (1, 3):
+            with self.assertRaises(ValueError):
+                protocol.send_request(Tagged(tag))
+
+        with self.assertRaises(ValueError):
+            protocol.send_requests([Tagged(4), Tagged(4)])
+
+        second = protocol.send_request(Tagged(2))
+        protocol.resume_writing()
+
+        self.assertEqual(
+            [call[0][0] for call in self.transport.write.call_args_list],
+            [b'3?\r', b'1?\r2?\r'])
+        self.assertEqual(len(protocol.machine.waiting_requests), 3)
+        self.assertEqual(
+            {waiting, first, second}, set(protocol.futures.values()))
+
+    def test_coalesce_writes(self):
+        protocol = self._protocol(max_in_flight=4, coalesce_writes=True)
+
+        async def runner():
+            protocol.send_request(GET(b'A'))
+            protocol.send_requests([SET(b'A', b'B'), GET(b'B')])
+            self.assertFalse(self.transport.write.called)
+            await protocol.drain()
+
+        self.loop.run_until_complete(runner())
+
+        self.transport.write.assert_called_once_with(
+            b'GET A\rSET A B\rGET B\r')
+        self.assertEqual(len(protocol.machine.waiting_requests), 3)
+
+    def test_coalesced_writes_dropped_on_connection_lost(self):
+        protocol = self._protocol(coalesce_writes=True)
+        f = protocol.send_request(GET(b'A'))
+        protocol.connection_lost(None)
+        self.loop.run_until_complete(asyncio.sleep(0))
+
+        self.assertIsInstance(f.exception(), ConnectionResetError)
+        self.assertFalse(self.transport.write.called)
+
+    def test_connection_lost_fails_requests(self):
+        protocol = self._protocol()
+        waiting = protocol.send_request(GET(b'A'))
+        pending = protocol.send_request(GET(b'B'))
+        protocol.pause_writing()
+        held = protocol.send_request(GET(b'A'))
+        protocol.connection_lost(None)
+
+        for f in (waiting, pending, held):
+            self.assertIsInstance(f.exception(), ConnectionResetError)
+
+        self.assertEqual(protocol.machine.waiting_requests, {})
+        self.assertEqual(protocol.futures, {})
+
+    def test_drain(self):
+        protocol = self._protocol()
+
+        async def runner():
+            await protocol.drain()
+            protocol.pause_writing()
+            drained = asyncio.ensure_future(protocol.drain())
+            await asyncio.sleep(0)
+            self.assertFalse(drained.done())
+            protocol.resume_writing()
+            await drained
+
+        self.loop.run_until_complete(runner())
+
+    def test_drain_connection_lost(self):
+        protocol = self._protocol()
+
+        async def runner():
+            protocol.pause_writing()
+            drained = asyncio.ensure_future(protocol.drain())
+            await asyncio.sleep(0)
+            protocol.connection_lost(None)
+            with self.assertRaises(ConnectionResetError):
+                await drained
+
+        self.loop.run_until_complete(runner())
+
+    def test_block_pauses_reading(self):
+        protocol = self._protocol(max_events=2)
+        self._broadcast(protocol, b'B', b'C', b'D')
+
+        self.assertEqual(protocol.event_queue.qsize(), 3)
+        self.assertEqual(protocol.dropped_events, 0)
+        self.transport.pause_reading.assert_called_once_with()
+
+        async def runner():
+            return [await protocol.get_latest_event() for _ in range(2)]
+
+        events = self.loop.run_until_complete(runner())
+        self.assertEqual([e.A for e in events], [b'B', b'C'])
+        self.transport.resume_reading.assert_called_once_with()
+
+    def test_low_water_resumes_reading(self):
+        protocol = self._protocol(max_events=4)
+        self._broadcast(protocol, b'B', b'C', b'D', b'E')
+        self.transport.pause_reading.assert_called_once_with()
+
+        # Taken straight from the queue, not through get_latest_event.
+        protocol.event_queue.get_nowait()
+        self.assertFalse(self.transport.resume_reading.called)
+        protocol.event_queue.get_nowait()
+        self.transport.resume_reading.assert_called_once_with()
+
+    def test_drop_oldest(self):
+        protocol = self._protocol(max_events=2, overflow=DROP_OLDEST)
+        self._broadcast(protocol, b'B', b'C', b'D')
+
+        self.assertEqual(protocol.dropped_events, 1)
+        events = [protocol.event_queue.get_nowait() for _ in range(2)]
+        self.assertEqual([e.A for e in events], [b'C', b'D'])
+        self.assertFalse(self.transport.pause_reading.called)
+
+    def test_drop_newest(self):
+        protocol = self._protocol(max_events=2, overflow=DROP_NEWEST)
+        self._broadcast(protocol, b'B', b'C', b'D')
+
+        self.assertEqual(protocol.dropped_events, 1)
+        events = [protocol.event_queue.get_nowait() for _ in range(2)]
+        self.assertEqual([e.A for e in events], [b'B', b'C'])
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            self._protocol(max_events=2, overflow='explode')
@@ -0,0 +1,156 @@
+import asyncio
+import unittest
+
+from serial_protocol.asyncio import AsyncIOEventMachineProtocol
+from serial_protocol.cache import ResponseCache
+from serial_protocol.simulation import SimulatedDevice, SimulatedPort, \
+    create_simulated_connection
+from serial_protocol.threaded import ThreadedProtocol
+
+from .example_machine import ASCIIKVS, event_from_data, \
+    GET, SET, BADResponse, NOWResponse, OKResponse
+from .test_timing import Clock
+
+
+class CachedGET(GET):
+
+    @property
+    def cache_key(self):
+        return self.slot
+
+
+def update_from_broadcast(cache, event):
+    for slot in (b'A', b'B'):
+        response = OKResponse()
+        response.slot = slot
+        response.value = getattr(event, slot.decode())
+        cache.put(slot, response)
+
+
+def invalidate_on_set(cache, event):
+    cache.invalidate(event.slot)
+
+
+class CountingDevice(ASCIIKVS):
+
+    def __init__(self):
+        super().__init__()
+        self.commands = 0
+
+    def feed(self, command):
+        self.commands += 1
+        return super().feed(command)
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.cache = ResponseCache(ttl=1.0, max_size=2, timefunc=self.clock)
+
+    def test_ttl(self):
+        self.cache.put('a', 1)
+        self.clock.now = 0.5
+        self.assertEqual(self.cache.get('a'), 1)
+
+        self.clock.now = 1.0
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_lru(self):
+        self.cache.put('a', 1)
+        self.cache.put('b', 2)
+        self.cache.get('a')
+        self.cache.put('c', 3)
+
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertEqual(self.cache.get('c'), 3)
+
+    def test_rules(self):
+        self.cache.on(NOWResponse, update_from_broadcast)
+        self.cache.on(object, lambda cache, event: cache.put('seen', event))
+        event = NOWResponse()
+        event.A, event.B = b'X', b'Y'
+        self.cache.max_size = 3
+        self.cache.event_received(event)
+
+        self.assertEqual(self.cache.get(b'A').value, b'X')
+        self.assertEqual(self.cache.get(b'B').value, b'Y')
+        self.assertIs(self.cache.get('seen'), event)
+
+    def test_response_received(self):
+        self.cache.on(OKResponse, invalidate_on_set)
+        response = OKResponse()
+        response.slot = b'A'
+        self.cache.response_received(CachedGET(b'A'), response)
+
+        self.assertIs(self.cache.get(b'A'), response)
+
+        self.cache.response_received(SET(b'A', b'B'), response)
+        self.assertIsNone(self.cache.get(b'A'))
+
+    def test_lookup(self):
+        self.cache.put(b'A', 1)
+
+        self.assertEqual(self.cache.lookup(CachedGET(b'A')), 1)
+        self.assertIsNone(self.cache.lookup(CachedGET(b'B')))
+        self.assertIsNone(self.cache.lookup(GET(b'A')))
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_cacheable(self):
+        self.cache.cacheable = lambda response: isinstance(
+            response, OKResponse)
+        self.cache.response_received(CachedGET(b'A'), BADResponse())
+        self.assertIsNone(self.cache.get(b'A'))
+
+        response = OKResponse()
+        self.cache.response_received(CachedGET(b'A'), response)
+        self.assertIs(self.cache.get(b'A'), response)
+
+
+class TestCachedProtocols(unittest.TestCase):
+
+    def setUp(self):
+        self.model = CountingDevice()
+        self.device = SimulatedDevice(self.model, latency=0.001)
+        self.cache = ResponseCache(ttl=10.0)
+        self.cache.on(NOWResponse, update_from_broadcast)
+
+    def test_asyncio(self):
+        loop = asyncio.get_event_loop()
+
+        async def runner():
+            transport, protocol = await create_simulated_connection(
+                AsyncIOEventMachineProtocol.factory(
+                    event_from_data, b'\r', loop=loop, cache=self.cache),
+                self.device, loop=loop)
+            first = await protocol.send_request(CachedGET(b'A'))
+            second, other = await asyncio.gather(*protocol.send_requests(
+                [CachedGET(b'A'), CachedGET(b'B')]))
+            protocol.data_received(b'NOW A Q B R\r')
+            third = await protocol.send_request(CachedGET(b'A'))
+            transport.close()
+            return first, second, other, third
+
+        first, second, other, third = loop.run_until_complete(runner())
+
+        self.assertIs(first, second)
+        self.assertEqual(other.value, b'A')
+        self.assertEqual(third.value, b'Q')
+        self.assertEqual(self.model.commands, 2)
+        self.assertEqual(self.cache.hits, 2)
+
+    def test_threaded(self):
+        port = SimulatedPort(self.device)
+        protocol = ThreadedProtocol(
+            event_from_data, b'\r', port.read, port.write, cache=self.cache)
+
+        first = protocol.send_request(CachedGET(b'B')).result(1.0)
+        second, = protocol.send_requests([CachedGET(b'B')])
+
+        self.assertTrue(second.done())
+        self.assertIs(second.result(), first)
+        self.assertEqual(self.model.commands, 1)
+        port.close()
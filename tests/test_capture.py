@@ -0,0 +1,180 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+from serial_protocol.capture import CaptureRecorder, CaptureReplay, RX, TX
+from serial_protocol.machine import EventMachine
+
+from .example_machine import ASCIIKVS, GET, OKResponse, NOWResponse
+from . import test_sansio
+from .test_timing import Clock
+
+
+class TestCapture(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'device.cap')
+        self.clock = Clock()
+
+    def capture_session(self):
+        machine = EventMachine(MagicMock(), test_sansio.TestDelegate(), b'\r')
+        medium = test_sansio.TestMedium(machine)
+
+        with CaptureRecorder(self.path, timefunc=self.clock) as recorder:
+            recorder.attach(machine)
+
+            machine.send(GET(b'A'), medium.write)
+            self.clock.now += 0.5
+            medium.get_broadcast()
+            self.clock.now += 0.25
+
+            # A transport reading into the machine's buffer.
+            view = machine.get_buffer()
+            view[:7] = b'OK B A\r'
+            machine.buffer_updated(7)
+
+    def test_records(self):
+        self.capture_session()
+
+        with CaptureReplay(self.path) as replay:
+            records = [
+                (t, direction, bytes(data))
+                for t, direction, data in replay.records()]
+
+        self.assertEqual(records, [
+            (0.0, TX, b'GET A\r'),
+            (0.0, RX, b'OK A A\r'),
+            (0.5, RX, b'NOW A A B A\r'),
+            (0.75, RX, b'OK B A\r'),
+        ])
+
+    def test_attach_covers_batches_and_split_frames(self):
+        machine = EventMachine(
+            MagicMock(), test_sansio.TestDelegate(), b'\r', max_in_flight=2)
+        written = []
+
+        with CaptureRecorder(self.path, timefunc=self.clock) as recorder:
+            recorder.attach(machine)
+            machine.send_many([GET(b'A'), GET(b'B')], written.append)
+            frames = machine.split_frames(b'OK A A\rOK B')
+
+        with CaptureReplay(self.path) as replay:
+            records = [
+                (direction, bytes(data))
+                for _, direction, data in replay.records()]
+
+        self.assertEqual(written, [b'GET A\rGET B\r'])
+        self.assertEqual(frames, [b'OK A A\r'])
+        self.assertEqual(records, [
+            (TX, b'GET A\rGET B\r'), (RX, b'OK A A\rOK B')])
+
+    def test_replay_passes_views(self):
+        self.capture_session()
+        machine = EventMachine(MagicMock(), test_sansio.TestDelegate(), b'\r')
+        received = []
+        receive_data = machine.receive_data
+
+        def spy(data):
+            received.append(type(data))
+            return receive_data(data)
+
+        machine.receive_data = spy
+
+        with CaptureReplay(self.path) as replay:
+            replay.replay(machine)
+
+        self.assertEqual(received, [memoryview] * 3)
+
+    def test_close_with_views_held(self):
+        self.capture_session()
+
+        with CaptureReplay(self.path) as replay:
+            records = list(replay.records())
+
+        # Still readable after close; the map goes with the last view.
+        self.assertEqual(records[0][2], b'GET A\r')
+
+    def test_replay(self):
+        self.capture_session()
+        delegate = test_sansio.TestDelegate()
+        machine = EventMachine(MagicMock(), delegate, b'\r')
+        transmitted = []
+
+        with CaptureReplay(self.path) as replay:
+            result = replay.replay(machine, transmitted=transmitted.append)
+
+        self.assertEqual(result['chunks'], 3)
+        self.assertEqual(result['frames'], 3)
+        self.assertEqual(result['bytes'], 26)
+        self.assertEqual(transmitted, [b'GET A\r'])
+        self.assertIsInstance(delegate.events[0], OKResponse)
+        self.assertIsInstance(delegate.events[1], NOWResponse)
+
+    def test_replay_with_a_request(self):
+        self.capture_session()
+        delegate = test_sansio.TestDelegate()
+        machine = EventMachine(MagicMock(), delegate, b'\r')
+        request = GET(b'A')
+
+        with CaptureReplay(self.path) as replay:
+            replay.replay(
+                machine,
+                transmitted=lambda data: machine.send(request, lambda d: None))
+
+        self.assertEqual(delegate.responses[0][0], request)
+
+    def test_realtime(self):
+        self.capture_session()
+        clock = Clock()
+        sleeps = []
+
+        def sleep(delay):
+            sleeps.append(delay)
+            clock.now += delay
+
+        machine = EventMachine(MagicMock(), test_sansio.TestDelegate(), b'\r')
+
+        with CaptureReplay(self.path) as replay:
+            result = replay.replay(
+                machine, realtime=True, speed=2.0, timefunc=clock,
+                sleep=sleep)
+
+        self.assertEqual(sleeps, [0.25, 0.125])
+        self.assertEqual(result['elapsed'], 0.375)
+
+    def test_append(self):
+        self.capture_session()
+        size = os.path.getsize(self.path)
+
+        with CaptureRecorder(self.path, timefunc=self.clock) as recorder:
+            recorder.record(RX, b'BAD\r')
+
+        with CaptureReplay(self.path) as replay:
+            records = list(replay.records())
+            self.assertEqual(len(records), 5)
+            self.assertEqual(records[-1][2], b'BAD\r')
+            del records
+
+        self.assertEqual(os.path.getsize(self.path), size + 13 + 4)
+
+    def test_truncated(self):
+        self.capture_session()
+
+        with open(self.path, 'r+b') as f:
+            f.truncate(os.path.getsize(self.path) - 3)
+
+        with CaptureReplay(self.path) as replay:
+            self.assertEqual(len(list(replay.records())), 3)
+
+    def test_not_a_capture(self):
+        with open(self.path, 'wb') as f:
+            f.write(ASCIIKVS().broadcast())
+
+        with self.assertRaises(ValueError):
+            CaptureReplay(self.path)
+
+        with self.assertRaises(ValueError):
+            CaptureRecorder(self.path)
@@ -0,0 +1,272 @@
+import re
+import unittest
+from unittest import mock
+
+from serial_protocol.events import Event, EventRegistry, SlottedEvent
+
+from .example_machine import \
+    registry, GET, NOWResponse, OKResponse, NOResponse, BADResponse
+
+
+class Tagged(Event):
+    pattern = re.compile(br'^#(\d+) (\w+)\r$')
+
+    @classmethod
+    def from_match(cls, m):
+        instance = cls()
+        instance.correlation_key = int(m.group(1))
+        instance.value = m.group(2)
+        return instance
+
+
+class Reading(SlottedEvent):
+    pattern = re.compile(br'^R (\w+) (\d+)\r$')
+    fields = ('channel', 'value')
+
+
+class TimedReading(Reading):
+    fields = ('time',)
+
+
+class TestSlottedEvent(unittest.TestCase):
+
+    def test_fields(self):
+        reading = Reading(b'x', value=b'5')
+
+        self.assertEqual((reading.channel, reading.value), (b'x', b'5'))
+        self.assertIsNone(reading.timeout)
+        self.assertFalse(hasattr(reading, '__dict__'))
+
+        with self.assertRaises(AttributeError):
+            reading.other = 1
+
+    def test_inherited_fields(self):
+        reading = TimedReading(b'x', b'5', 1.5)
+
+        self.assertEqual(
+            TimedReading._all_fields, ('channel', 'value', 'time'))
+        self.assertEqual(reading.time, 1.5)
+        self.assertFalse(hasattr(reading, '__dict__'))
+        self.assertIsNone(Reading(b'y').value)
+
+    def test_flat_init(self):
+        # The subclass's __init__ sets every field without calling Reading's.
+        with mock.patch.object(
+                Reading, '__init__', side_effect=AssertionError):
+            reading = TimedReading(b'x', b'5', time=1.5)
+
+        self.assertEqual(
+            (reading.channel, reading.value, reading.time), (b'x', b'5', 1.5))
+
+    def test_request_attributes(self):
+        reading = Reading(b'x')
+
+        self.assertEqual(
+            (reading.correlation_key, reading.idempotency_key,
+             reading.cache_key, reading.priority, reading.deadline),
+            (None, None, None, 0, None))
+
+        reading.correlation_key = 7
+        reading.priority = -1
+        reading.deadline = 2.0
+        self.assertEqual(
+            (reading.correlation_key, reading.priority, reading.deadline),
+            (7, -1, 2.0))
+        self.assertFalse(hasattr(reading, '__dict__'))
+
+    def test_overridden_request_attributes(self):
+        class Urgent(SlottedEvent):
+            fields = ('slot',)
+            priority = -1
+
+            @property
+            def idempotency_key(self):
+                return self.slot
+
+        urgent = Urgent(b'A')
+
+        self.assertEqual((urgent.priority, urgent.idempotency_key), (-1, b'A'))
+        self.assertIsNone(urgent.correlation_key)
+
+    def test_from_match(self):
+        reading = Reading.from_bytes(b'R t 42\r')
+
+        self.assertEqual((reading.channel, reading.value), (b't', b'42'))
+
+        local = EventRegistry()
+        local.register(Reading, prefix=b'R ')
+        self.assertEqual(local.parse(b'R u 7\r').value, b'7')
+
+    def test_event_keeps_dict(self):
+        event = Event()
+        event.anything = 1
+
+        self.assertNotIsInstance(event, SlottedEvent)
+        self.assertEqual(event.anything, 1)
+        self.assertEqual((event.timeout, event.priority), (None, 0))
+        # The request attributes stay class defaults until set.
+        self.assertEqual(vars(event), {'timeout': None, 'anything': 1})
+
+
+class TestEventRegistry(unittest.TestCase):
+
+    def test_prefix_dispatch(self):
+        self.assertIsInstance(registry.parse(b'OK A Z\r'), OKResponse)
+        self.assertIsInstance(registry.parse(b'NO B A\r'), NOResponse)
+        self.assertIsInstance(registry.parse(b'NOW A B B C\r'), NOWResponse)
+        self.assertIsInstance(registry.parse(b'BAD\r'), BADResponse)
+        self.assertIsNone(registry.parse(b'OK C Z\r'))
+        self.assertIsNone(registry.parse(b'WHAT\r'))
+
+    def test_parser_pairs_requests(self):
+        request = GET(b'A')
+
+        event, matched = registry(b'OK A A\r', [request])
+        self.assertIsInstance(event, OKResponse)
+        self.assertIs(matched, request)
+
+        event, matched = registry(b'NOW A A B A\r', [request])
+        self.assertIsInstance(event, NOWResponse)
+        self.assertIsNone(matched)
+
+        self.assertEqual(registry(b'junk\r', [request]), (None, None))
+
+    def test_correlation_key(self):
+        local = EventRegistry()
+        local.register(Tagged)
+
+        event, key = local(b'#12 done\r', [GET(b'A')])
+        self.assertEqual(key, 12)
+        self.assertEqual(event.value, b'done')
+
+    def test_longest_prefix_wins(self):
+        class Short(Event):
+            pattern = re.compile(b'^OK')
+
+        class Long(Event):
+            pattern = re.compile(b'^OKAY')
+
+        local = EventRegistry()
+        local.register(Short, prefix=b'OK')
+        local.register(Long, prefix=b'OKAY')
+
+        self.assertIsInstance(local.parse(b'OKAY\r'), Long)
+        self.assertIsInstance(local.parse(b'OK\r'), Short)
+
+    def test_combined_pattern(self):
+        local = EventRegistry()
+
+        @local.register(pattern=br'^(?:ON|OFF)\r$', unsolicited=True)
+        class Power(Event):
+            pass
+
+        @local.register(pattern=re.compile(br'^err (\d+)\r$', re.I))
+        class Error(Event):
+
+            @classmethod
+            def from_match(cls, m):
+                instance = cls()
+                instance.code = int(m.group(1))
+                return instance
+
+        event, request = local(b'ON\r', ['r'])
+        self.assertIsInstance(event, Power)
+        self.assertIsNone(request)
+        self.assertIsInstance(local.parse(b'OFF\r'), Power)
+        event, request = local(b'ERR 42\r', ['r'])
+        self.assertEqual(event.code, 42)
+        self.assertEqual(request, 'r')
+
+    def test_group_references(self):
+        local = EventRegistry()
+
+        @local.register(pattern=br'^(?P<slot>\w) (?P<value>\w)\r$')
+        class Pair(Event):
+            pass
+
+        @local.register(pattern=br'^(?P<slot>\w)=(?P=slot)\r$')
+        class Same(Event):
+            pass
+
+        @local.register(pattern=br'^(\w)\1+\r$')
+        class Repeat(Event):
+            pass
+
+        @local.register(pattern=br'^(\w+)\r$')
+        class Word(Event):
+
+            @classmethod
+            def from_match(cls, m):
+                instance = cls()
+                instance.word = m.group(1)
+                return instance
+
+        self.assertIsInstance(local.parse(b'A B\r'), Pair)
+        self.assertIsInstance(local.parse(b'A=A\r'), Same)
+        self.assertIsNone(local.parse(b'A=B\r'))
+        # Registered first, so it wins over Word.
+        self.assertIsInstance(local.parse(b'AAA\r'), Repeat)
+        self.assertEqual(local.parse(b'ABA\r').word, b'ABA')
+
+    def test_global_inline_flags(self):
+        local = EventRegistry()
+
+        @local.register(pattern=re.compile(rb'(?i)^ok (\w)\r$'))
+        class Ok(Event):
+            pass
+
+        @local.register(pattern=rb'(?x) ^ no \s (\w) \r $')
+        class No(Event):
+            pass
+
+        @local.register(pattern=rb'^ok\r$')
+        class Exact(Event):
+            pass
+
+        self.assertIsInstance(local.parse(b'OK A\r'), Ok)
+        self.assertIsInstance(local.parse(b'no B\r'), No)
+        # The flags stay scoped to their own pattern.
+        self.assertIsNone(local.parse(b'NO B\r'))
+        self.assertIsInstance(local.parse(b'ok\r'), Exact)
+
+    def test_register_fails_early(self):
+        local = EventRegistry()
+
+        with self.assertRaises(TypeError):
+            local.register(Event, pattern='^text$')
+
+        local.register(OKResponse, prefix=b'OK ')
+        self.assertIsInstance(local.parse(b'OK A Q\r'), OKResponse)
+
+    def test_register_after_use(self):
+        local = EventRegistry()
+        local.register(OKResponse, prefix=b'OK ')
+        self.assertIsNone(local.parse(b'BAD\r'))
+
+        local.register(BADResponse, prefix=b'BAD')
+        self.assertIsInstance(local.parse(b'BAD\r'), BADResponse)
+
+    def test_register_requires_pattern(self):
+        with self.assertRaises(ValueError):
+            EventRegistry().register(GET)
+
+    def test_frame_views(self):
+        view = memoryview(bytearray(b'OK A Q\r')).toreadonly()
+        event = registry.parse(view)
+
+        self.assertEqual(event.value, b'Q')
+
+    def test_from_bytes(self):
+        self.assertEqual(OKResponse.from_bytes(b'OK B C\r').value, b'C')
+
+        with self.assertRaises(ValueError):
+            OKResponse.from_bytes(b'NO B C\r')
+
+    def test_pair(self):
+        request = GET(b'A')
+
+        self.assertIs(
+            registry.pair(registry.parse(b'OK A A\r'), [request])[1], request)
+        self.assertIsNone(
+            registry.pair(registry.parse(b'NOW A A B A\r'), [request])[1])
+        self.assertEqual(registry.pair(None, [request]), (None, None))
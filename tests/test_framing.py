@@ -0,0 +1,253 @@
+import mmap
+import random
+import struct
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+from serial_protocol import framing
+from serial_protocol.framing import \
+    DelimiterFramer, MultiDelimiterFramer, LengthPrefixedFramer, \
+    SLIPFramer, COBSFramer, FramingError, frame_ends, iter_frames
+from serial_protocol.machine import EventMachine
+
+
+class FramerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.frames = []
+        self.delegate = MagicMock()
+        self.delegate.event_for_data.side_effect = self._event_for_data
+
+    def _event_for_data(self, data, requests):
+        # Frame views are only valid during the call.
+        self.frames.append(bytes(data))
+        return None, None
+
+    def _machine(self, framer, **options):
+        return EventMachine(
+            MagicMock(), self.delegate, framer=framer, **options)
+
+    def _feed(self, machine, data, chunk_size=1):
+        for i in range(0, len(data), chunk_size):
+            machine.receive_data(data[i:i + chunk_size])
+
+
+class TestDelimiterFramer(FramerTestCase):
+
+    def test_default_framer(self):
+        machine = EventMachine(MagicMock(), self.delegate, b'\r')
+        self.assertIsInstance(machine.framer, DelimiterFramer)
+        self.assertEqual(machine.framer.terminator, b'\r')
+
+    def test_chunks(self):
+        machine = self._machine(DelimiterFramer(b'\r\n'))
+        self._feed(machine, b'ONE\r\nTWO\r\n\r\n', chunk_size=3)
+
+        self.assertEqual(self.frames, [b'ONE\r\n', b'TWO\r\n', b'\r\n'])
+
+    def test_empty_terminator(self):
+        with self.assertRaises(ValueError):
+            DelimiterFramer(b'')
+
+
+class TestMultiDelimiterFramer(FramerTestCase):
+
+    def test_either_terminator(self):
+        machine = self._machine(MultiDelimiterFramer(b'\r', b'\n'))
+        self._feed(machine, b'ONE\rTWO\nTHREE\r', chunk_size=4)
+
+        self.assertEqual(self.frames, [b'ONE\r', b'TWO\n', b'THREE\r'])
+
+    def test_longest_terminator_wins(self):
+        machine = self._machine(MultiDelimiterFramer(b'\r', b'\r\n'))
+        machine.receive_data(b'ONE\r\nTWO\r')
+
+        self.assertEqual(self.frames, [b'ONE\r\n', b'TWO\r'])
+
+
+class TestLengthPrefixedFramer(FramerTestCase):
+
+    def test_frames(self):
+        machine = self._machine(LengthPrefixedFramer('>H'))
+        data = b'\x00\x03abc\x00\x00\x00\x01z'
+        self._feed(machine, data)
+
+        self.assertEqual(self.frames, [
+            b'\x00\x03abc', b'\x00\x00', b'\x00\x01z'])
+
+    def test_offset_and_trailer(self):
+        framer = LengthPrefixedFramer(
+            '<B', length_offset=1, length_adjustment=1)
+        machine = self._machine(framer, frame_views=True)
+        frame = b'\xaa' + struct.pack('<B', 2) + b'hi' + b'\x55'
+        machine.receive_data(frame + frame[:3])
+        machine.receive_data(frame[3:])
+
+        self.assertEqual(self.frames, [frame, frame])
+
+    def test_length_must_advance(self):
+        machine = self._machine(LengthPrefixedFramer(
+            '>b', length_adjustment=-1))
+
+        with self.assertRaises(ValueError):
+            machine.receive_data(b'\x00')
+
+        with self.assertRaises(ValueError):
+            self._machine(LengthPrefixedFramer('>b')).receive_data(b'\xfe')
+
+    def test_recovers_from_bad_length(self):
+        for frame_views in (False, True):
+            self.frames.clear()
+            machine = self._machine(
+                LengthPrefixedFramer('>b'), frame_views=frame_views)
+
+            with self.assertRaises(FramingError):
+                machine.receive_data(b'\x01a\xff\x01b\x00')
+
+            self.assertEqual(self.frames, [b'\x01a'])
+
+            machine.receive_data(b'')
+            self.assertEqual(self.frames, [b'\x01a', b'\x01b', b'\x00'])
+
+            machine.receive_data(b'\x01c')
+            self.assertEqual(self.frames[-1], b'\x01c')
+
+    def test_bad_length_raises_once(self):
+        machine = self._machine(LengthPrefixedFramer('>b'))
+
+        with self.assertRaises(FramingError):
+            machine.receive_data(b'\xff\x01a\x01b')
+
+        machine.receive_data(b'')
+
+        self.assertEqual(self.frames, [b'\x01a', b'\x01b'])
+        self.assertEqual(machine._input_end, 0)
+
+
+class TestSLIPFramer(FramerTestCase):
+
+    def test_round_trip(self):
+        payloads = [b'plain', b'a\xc0b', b'\xdb\xdc\xdd', b'\xc0\xc0']
+        machine = self._machine(SLIPFramer())
+        self._feed(machine, b''.join(map(SLIPFramer.encode, payloads)))
+
+        self.assertEqual(self.frames, payloads)
+
+    def test_views(self):
+        machine = self._machine(SLIPFramer(), frame_views=True)
+        machine.receive_data(b'\xc0one\xc0\xc0tw')
+        machine.receive_data(b'o\xdb\xdc\xc0')
+
+        self.assertEqual(self.frames, [b'one', b'two\xc0'])
+
+    def test_views_skip_delimiters(self):
+        machine = self._machine(SLIPFramer(), frame_views=True)
+        machine.receive_data(b'\xc0\xc0')
+        machine.receive_data(b'\xc0one')
+        machine.receive_data(b'\xc0')
+
+        self.assertEqual(self.frames, [b'one'])
+        self.assertEqual(machine._input_end, 0)
+
+
+class TestCOBSFramer(FramerTestCase):
+
+    def test_encode(self):
+        self.assertEqual(COBSFramer.encode(b'\x00'), b'\x01\x01\x00')
+        self.assertEqual(
+            COBSFramer.encode(b'\x11\x22\x00\x33'),
+            b'\x03\x11\x22\x02\x33\x00')
+        self.assertEqual(
+            COBSFramer.encode(b'\x01' * 254),
+            b'\xff' + b'\x01' * 254 + b'\x00')
+
+    def test_round_trip(self):
+        payloads = [
+            b'', b'\x00', b'abc\x00def',
+            b'\x01' * 254, b'\x02' * 300 + b'\x00']
+        machine = self._machine(COBSFramer())
+        self._feed(
+            machine, b''.join(map(COBSFramer.encode, payloads)), chunk_size=7)
+
+        # An empty payload encodes to a lone code byte, so it is still a frame.
+        self.assertEqual(self.frames, payloads)
+
+    def test_invalid_frame(self):
+        machine = self._machine(COBSFramer())
+
+        with self.assertRaises(ValueError):
+            machine.receive_data(b'\x05ab\x00')
+
+
+class TestBulkFraming(unittest.TestCase):
+
+    def _expected_ends(self, data, terminator):
+        spans, _ = DelimiterFramer(terminator).scan(data, len(data))
+        return [stop for _, stop in spans]
+
+    def _data(self, terminator, count=2000, seed=0):
+        rand = random.Random(seed)
+        alphabet = b'ab' + terminator
+        return bytes(rand.choice(alphabet) for _ in range(count))
+
+    def test_frame_ends(self):
+        for terminator in (b'\r', b'\r\n', b'\r\r', b'END'):
+            data = self._data(terminator)
+
+            self.assertEqual(
+                list(frame_ends(data, terminator)),
+                self._expected_ends(data, terminator))
+
+    def test_search_fallback(self):
+        for terminator in (b'\r', b'\r\n', b'\r\r'):
+            data = self._data(terminator)
+
+            self.assertEqual(
+                list(frame_ends(data, terminator, vectorized=False)),
+                self._expected_ends(data, terminator))
+
+    @unittest.skipIf(framing.numpy is None, 'requires numpy')
+    def test_vectorized_blocks(self):
+        for terminator in (b'\r', b'\r\n', b'END'):
+            data = self._data(terminator)
+            ends = frame_ends(
+                data, terminator, block_size=7, vectorized=True)
+
+            self.assertEqual(str(ends.dtype), 'int64')
+            self.assertEqual(
+                list(ends), self._expected_ends(data, terminator))
+
+        with self.assertRaises(ValueError):
+            frame_ends(b'a\r\r\r', b'\r\r', vectorized=True)
+
+    @unittest.skipIf(framing.numpy is not None, 'numpy is installed')
+    def test_vectorized_requires_numpy(self):
+        with self.assertRaises(ImportError):
+            frame_ends(b'a\r', b'\r', vectorized=True)
+
+    def test_empty(self):
+        self.assertEqual(list(frame_ends(b'', b'\r')), [])
+        self.assertEqual(list(frame_ends(b'partial', b'\r\n')), [])
+
+        with self.assertRaises(ValueError):
+            frame_ends(b'a\r', b'')
+
+    def test_iter_frames_mmap(self):
+        with tempfile.TemporaryFile() as f:
+            f.write(b'OK A Q\rNOW A B B C\rOK B')
+            f.flush()
+
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                frames = [bytes(frame) for frame in iter_frames(m, b'\r')]
+
+        self.assertEqual(frames, [b'OK A Q\r', b'NOW A B B C\r'])
+
+    def test_iter_frames_views(self):
+        data = bytearray(b'a\nbb\n')
+        first, second = iter_frames(data)
+
+        self.assertIsInstance(first, memoryview)
+        data[0:1] = b'z'
+        self.assertEqual(bytes(first), b'z\n')
+        self.assertEqual(bytes(second), b'bb\n')
@@ -0,0 +1,197 @@
+import asyncio
+import functools
+import unittest
+
+from serial_protocol.asyncio import DROP_NEWEST
+from serial_protocol.cache import ResponseCache
+from serial_protocol.manager import DeviceManager, DeviceNotConnected
+
+from .example_machine import event_from_data, GET, SET, NOWResponse
+from .test_asyncio import AsyncIOSimulatorProtocol
+
+
+class TestDeviceManager(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+        self.servers = []
+        self.connections = []
+        self.manager = DeviceManager(
+            event_from_data, b'\r', loop=self.loop, reconnect_delay=0.001)
+
+    def tearDown(self):
+        async def closer():
+            self.manager.close()
+            for server in self.servers:
+                server.close()
+                await server.wait_closed()
+
+        self.loop.run_until_complete(closer())
+
+    def _simulator(self):
+        protocol = AsyncIOSimulatorProtocol()
+        self.connections.append(protocol)
+        return protocol
+
+    async def _add_device(self, device_id):
+        server = await self.loop.create_server(
+            self._simulator, 'localhost', 0)
+        self.servers.append(server)
+        port = server.sockets[0].getsockname()[1]
+        self.manager.add_device(device_id, functools.partial(
+            self.loop.create_connection, host='localhost', port=port))
+
+    def test_send(self):
+        async def runner():
+            for device_id in range(5):
+                await self._add_device(device_id)
+            await self.manager.wait_connected()
+
+            await self.manager.send(3, SET(b'A', b'D'))
+            return await asyncio.gather(*(
+                self.manager.send(device_id, GET(b'A'))
+                for device_id in range(5)))
+
+        results = self.loop.run_until_complete(runner())
+        self.assertEqual(
+            [result.value for result in results],
+            [b'A', b'A', b'A', b'D', b'A'])
+
+    def test_shared_minder(self):
+        async def runner():
+            await self._add_device('a')
+            await self._add_device('b')
+            await self.manager.wait_connected()
+
+        self.loop.run_until_complete(runner())
+        minders = {
+            endpoint.protocol.machine.event_minder
+            for endpoint in self.manager.devices.values()}
+        self.assertEqual(minders, {self.manager.event_minder})
+
+    def test_merged_events(self):
+        async def runner():
+            await self._add_device('a')
+            await self._add_device('b')
+            await self.manager.wait_connected()
+
+            self.manager.devices['b'].transport.write(b'b\n')
+            self.manager.devices['a'].transport.write(b'b\n')
+            return [await self.manager.get_event() for _ in range(2)]
+
+        events = self.loop.run_until_complete(runner())
+        self.assertEqual(
+            sorted(device_id for device_id, _ in events), ['a', 'b'])
+        for _, event in events:
+            self.assertIsInstance(event, NOWResponse)
+
+    def test_cache_and_subscriptions(self):
+        cache = ResponseCache()
+        rule_calls = []
+        cache.on(NOWResponse, lambda cache, event: rule_calls.append(event))
+        self.manager.options['cache'] = cache
+
+        async def runner():
+            await self._add_device('a')
+            await self._add_device('b')
+            await self.manager.wait_connected()
+            subscription = self.manager.devices['a'].protocol.subscribe(
+                NOWResponse)
+
+            self.manager.devices['a'].transport.write(b'b\n')
+            self.manager.devices['b'].transport.write(b'b\n')
+            event = await subscription.__anext__()
+            device_id, _ = await self.manager.get_event()
+            return event, device_id
+
+        event, device_id = self.loop.run_until_complete(runner())
+        self.assertIsInstance(event, NOWResponse)
+        # Device a's broadcast went to its subscription only.
+        self.assertEqual(device_id, 'b')
+        self.assertEqual(len(rule_calls), 2)
+
+    def test_bounded_events(self):
+        self.manager.options.update(max_events=2, overflow=DROP_NEWEST)
+
+        async def runner():
+            await self._add_device('a')
+            await self.manager.wait_connected()
+            protocol = self.manager.devices['a'].protocol
+            protocol.data_received(b'NOW A B B A\r' * 5)
+            return protocol
+
+        protocol = self.loop.run_until_complete(runner())
+        self.assertEqual(self.manager.events.qsize(), 2)
+        self.assertEqual(protocol.dropped_events, 3)
+
+    def test_full_queue_pauses_reading(self):
+        self.manager.options['max_events'] = 2
+
+        async def runner():
+            await self._add_device('a')
+            await self.manager.wait_connected()
+            protocol = self.manager.devices['a'].protocol
+            protocol.data_received(b'NOW A B B A\r' * 3)
+            paused = protocol._reading_paused
+
+            for _ in range(2):
+                await self.manager.get_event()
+
+            return paused, protocol._reading_paused
+
+        self.assertEqual(self.loop.run_until_complete(runner()), (True, False))
+
+    def test_connection_lost_fails_requests(self):
+        async def runner():
+            await self._add_device('a')
+            await self.manager.wait_connected('a')
+            request = GET(b'A')
+            request.timeout = None
+            f = self.manager.send('a', request)
+            self.manager.devices['a'].transport.close()
+
+            with self.assertRaises(ConnectionError):
+                await f
+
+        self.loop.run_until_complete(runner())
+
+    def test_reconnect(self):
+        async def runner():
+            await self._add_device('a')
+            await self.manager.wait_connected('a')
+            endpoint = self.manager.devices['a']
+
+            self.connections[0].transport.close()
+            while endpoint.connections < 2 or not endpoint.connected.is_set():
+                await asyncio.sleep(0.001)
+
+            return await self.manager.send('a', GET(b'B'))
+
+        result = self.loop.run_until_complete(runner())
+        self.assertEqual(result.value, b'A')
+        self.assertEqual(self.manager.devices['a'].connections, 2)
+
+    def test_retry_until_listening(self):
+        attempts = []
+
+        async def connect(protocol_factory):
+            attempts.append(protocol_factory)
+            if len(attempts) < 3:
+                raise ConnectionRefusedError()
+            server = await self.loop.create_server(
+                self._simulator, 'localhost', 0)
+            self.servers.append(server)
+            port = server.sockets[0].getsockname()[1]
+            return await self.loop.create_connection(
+                protocol_factory, 'localhost', port)
+
+        async def runner():
+            self.manager.add_device('a', connect)
+            with self.assertRaises(DeviceNotConnected):
+                self.manager.send('a', GET(b'A'))
+            await self.manager.wait_connected('a')
+            return await self.manager.send('a', GET(b'A'))
+
+        result = self.loop.run_until_complete(runner())
+        self.assertEqual(result.value, b'A')
+        self.assertEqual(len(attempts), 3)
@@ -0,0 +1,102 @@
+import unittest
+from unittest.mock import MagicMock
+
+from serial_protocol.machine import EventMachine
+from serial_protocol.metrics import LatencyHistogram, Metrics
+
+from .example_machine import GET, SET, registry
+from .test_sansio import DelayedMedium, TestDelegate
+from .test_timing import Clock
+
+
+class TestLatencyHistogram(unittest.TestCase):
+
+    def test_buckets(self):
+        histogram = LatencyHistogram(smallest=1.0, buckets=4)
+
+        for duration in (0.5, 1.5, 1.5, 3.0, 100.0):
+            histogram.add(duration)
+
+        self.assertEqual(histogram.bounds, [1.0, 2.0, 4.0])
+        self.assertEqual(histogram.counts, [1, 2, 1, 1])
+        self.assertEqual(histogram.percentile(50), 2.0)
+        self.assertEqual(histogram.percentile(99), 100.0)
+        self.assertEqual(histogram.snapshot()['max'], 100.0)
+
+    def test_empty(self):
+        snapshot = LatencyHistogram().snapshot()
+
+        self.assertEqual(snapshot['count'], 0)
+        self.assertIsNone(snapshot['p50'])
+
+
+class TestMachineMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.metrics = Metrics(timefunc=self.clock)
+        self.delegate = TestDelegate()
+        self.machine = EventMachine(
+            MagicMock(), self.delegate, terminator=b'\r', max_in_flight=2,
+            metrics=self.metrics)
+        self.medium = DelayedMedium(self.machine)
+
+    def test_requests(self):
+        commands = [GET(b'A'), SET(b'A', b'B'), GET(b'B')]
+
+        for command in commands:
+            self.machine.send(command, self.medium.write)
+
+        self.assertEqual(self.metrics.requests_sent, 2)
+        self.assertEqual(self.metrics.pending, 1)
+        self.assertEqual(self.metrics.in_flight, 2)
+        self.assertEqual(self.metrics.bytes_out, len(b'GET A\rSET A B\r'))
+
+        self.clock.now = 0.002
+        self.medium.respond()
+        self.machine._timed_out(commands[1])
+
+        snapshot = self.metrics.snapshot()
+        self.assertEqual(snapshot['requests_sent'], 3)
+        self.assertEqual(snapshot['requests_completed'], 1)
+        self.assertEqual(snapshot['requests_timed_out'], 1)
+        self.assertEqual(snapshot['bytes_in'], len(b'OK A A\r'))
+        self.assertEqual(snapshot['max_pending'], 1)
+        self.assertEqual(snapshot['in_flight'], 1)
+        self.assertEqual(snapshot['timeouts'], {'SET': 1})
+        self.assertEqual(snapshot['latency']['GET']['count'], 1)
+        self.assertAlmostEqual(
+            snapshot['latency']['GET']['max'], 0.002)
+
+    def test_abandoned_requests(self):
+        for command in (GET(b'A'), SET(b'A', b'B'), GET(b'B')):
+            self.machine.send(command, self.medium.write)
+
+        self.machine.abandon_requests()
+
+        self.assertEqual(self.metrics.requests_lost, 3)
+        self.assertEqual(self.metrics._started, {})
+        self.assertEqual(self.metrics.in_flight, 0)
+
+    def test_events_and_unmatched_frames(self):
+        # The registry returns (None, None) for frames it does not know.
+        self.delegate.event_for_data = registry
+        self.machine.receive_data(b'NOW A B B C\rjunk\r')
+
+        self.assertEqual(self.metrics.events_received, 1)
+        self.assertEqual(self.metrics.unmatched_frames, 1)
+
+    def test_reset(self):
+        self.machine.send(GET(b'A'), self.medium.write)
+        snapshot = self.metrics.snapshot(reset=True)
+
+        self.assertEqual(snapshot['requests_sent'], 1)
+        self.assertEqual(self.metrics.requests_sent, 0)
+        self.assertEqual(self.metrics.in_flight, 1)
+        self.assertEqual(self.metrics.max_in_flight, 1)
+
+    def test_disabled(self):
+        machine = EventMachine(MagicMock(), self.delegate, terminator=b'\r')
+        machine.send(GET(b'A'), DelayedMedium(machine).write)
+
+        self.assertIsNone(machine.metrics)
@@ -1,12 +1,15 @@
 import unittest
 from unittest.mock import MagicMock
 
+from serial_protocol.events import Event
 from serial_protocol.machine import EventMachine
+from serial_protocol.metrics import Metrics
 from serial_protocol.protocol import ProtocolDelegate
 
 from .example_machine import \
-    ASCIIKVS, GET, SET, NOWResponse, NOResponse, BADResponse, \
+    ASCIIKVS, GET, SET, Poll, NOWResponse, NOResponse, BADResponse, \
     event_from_data
+from .test_timing import Clock, ManualEventMinder
 
 
 class TestMedium:
@@ -107,3 +110,519 @@ class TestTimingFreeExampleMachineProtocol(unittest.TestCase):
         self.assertIsInstance(e, NOWResponse)
         self.assertEqual(e.A, b'A')
         self.assertEqual(e.B, b'A')
+
+
+class TestFrameViewsExampleMachineProtocol(
+        TestTimingFreeExampleMachineProtocol):
+
+    def setUp(self):
+        self.delegate = TestDelegate()
+        self.minder = MagicMock()
+        self.machine = EventMachine(
+            self.minder, self.delegate, terminator=b'\r', frame_views=True)
+        self.medium = TestMedium(self.machine)
+
+    def test_queued_requests(self):
+        commands = [SET(b'A', b'Q'), GET(b'A'), SET(b'B', b'R'), GET(b'B')]
+
+        for command in commands:
+            self.machine.send(command, self.medium.write)
+
+        self.assertEqual(
+            [request for request, _ in self.delegate.responses], commands)
+        self.assertEqual(
+            [response.value for _, response in self.delegate.responses],
+            [b'Q', b'Q', b'R', b'R'])
+
+
+class DelayedMedium(TestMedium):
+
+    def __init__(self, machine):
+        super().__init__(machine)
+        self.written = []
+
+    def write(self, data):
+        self.written.append(data)
+
+    def respond(self):
+        r = self.simulator.feed(self.written.pop(0))
+        self.machine.receive_data(r)
+
+
+class TestPipelining(unittest.TestCase):
+
+    def setUp(self):
+        self.delegate = TestDelegate()
+        self.minder = MagicMock()
+        self.machine = EventMachine(
+            self.minder, self.delegate, terminator=b'\r', max_in_flight=3)
+        self.medium = DelayedMedium(self.machine)
+
+    def test_window(self):
+        commands = [SET(b'A', value) for value in (b'B', b'C', b'D', b'E')]
+
+        for command in commands:
+            self.machine.send(command, self.medium.write)
+
+        self.assertEqual(len(self.medium.written), 3)
+        self.assertEqual(len(self.machine.waiting_requests), 3)
+        self.assertEqual(len(self.machine.pending_requests), 1)
+        self.assertEqual(self.minder.notify_after.call_count, 3)
+
+        self.medium.respond()
+
+        self.assertEqual(len(self.medium.written), 3)
+        self.assertEqual(len(self.machine.pending_requests), 0)
+
+        for _ in range(3):
+            self.medium.respond()
+
+        self.assertEqual(
+            [request for request, _ in self.delegate.responses], commands)
+        self.assertEqual(
+            [response.value for _, response in self.delegate.responses],
+            [b'B', b'C', b'D', b'E'])
+        self.assertEqual(self.minder.remove.call_count, 4)
+
+    def test_timeout_opens_window(self):
+        commands = [GET(b'A') for _ in range(4)]
+
+        for command in commands:
+            self.machine.send(command, self.medium.write)
+
+        self.machine._timed_out(commands[1])
+
+        self.assertEqual(self.delegate.timeouts, [commands[1]])
+        self.assertEqual(len(self.medium.written), 4)
+        self.assertEqual(
+            list(self.machine.waiting_requests),
+            [commands[0], commands[2], commands[3]])
+
+
+class TestWriteCoalescing(unittest.TestCase):
+
+    def setUp(self):
+        self.delegate = TestDelegate()
+        self.minder = MagicMock()
+        self.machine = EventMachine(
+            self.minder, self.delegate, terminator=b'\r', max_in_flight=4)
+        self.medium = DelayedMedium(self.machine)
+
+    def test_send_many(self):
+        commands = [SET(b'A', value) for value in (b'B', b'C', b'D')]
+        self.machine.send_many(commands, self.medium.write)
+
+        self.assertEqual(self.medium.written, [
+            b'SET A B\rSET A C\rSET A D\r'])
+        self.assertEqual(list(self.machine.waiting_requests), commands)
+        self.assertEqual(self.minder.notify_after.call_count, 3)
+
+    def test_send_many_fills_window(self):
+        commands = [GET(b'A') for _ in range(6)]
+        self.machine.send_many(commands, self.medium.write)
+
+        self.assertEqual(self.medium.written, [b'GET A\r' * 4])
+        self.assertEqual(list(self.machine.pending_requests), commands[4:])
+
+        self.machine._completed(commands[0])
+
+        self.assertEqual(self.medium.written, [b'GET A\r' * 4, b'GET A\r'])
+
+    def test_separate_writers(self):
+        other = []
+        self.machine.send_many([GET(b'A'), GET(b'B')], self.medium.write)
+        self.machine.send_many([GET(b'A')], other.append)
+
+        self.assertEqual(self.medium.written, [b'GET A\rGET B\r'])
+        self.assertEqual(other, [b'GET A\r'])
+
+    def test_coalesce_refill(self):
+        self.machine.max_in_flight = 1
+        self.machine.coalesce_writes = True
+        commands = [GET(b'A') for _ in range(4)]
+
+        for command in commands:
+            self.machine.send(command, self.medium.write)
+
+        self.machine.max_in_flight = 3
+        self.machine._completed(commands[0])
+
+        self.assertEqual(self.medium.written, [b'GET A\r', b'GET A\r' * 3])
+
+
+class Tagged(Event):
+
+    def __init__(self, tag):
+        super().__init__()
+        self.correlation_key = tag
+
+    def to_bytes(self):
+        return b'%d?\r' % self.correlation_key
+
+
+def tagged_event_from_data(data, requests):
+    tag, value = bytes(data).rstrip().split(b'=')
+    event = Event()
+    event.value = value
+    return event, int(tag)
+
+
+class TestCorrelation(unittest.TestCase):
+
+    def setUp(self):
+        self.delegate = TestDelegate()
+        self.delegate.event_for_data = tagged_event_from_data
+        self.minder = MagicMock()
+        self.machine = EventMachine(
+            self.minder, self.delegate, terminator=b'\r', max_in_flight=8)
+        self.written = []
+
+    def test_out_of_order_responses(self):
+        requests = [Tagged(tag) for tag in range(5)]
+
+        for request in requests:
+            self.machine.send(request, self.written.append)
+
+        self.machine.receive_data(b'3=C\r0=Z\r4=D\r')
+        self.machine.receive_data(b'1=A\r2=B\r')
+
+        self.assertEqual(
+            [(request.correlation_key, response.value)
+             for request, response in self.delegate.responses],
+            [(3, b'C'), (0, b'Z'), (4, b'D'), (1, b'A'), (2, b'B')])
+        self.assertEqual(len(self.machine.waiting_requests), 0)
+        self.assertEqual(self.machine._keyed_requests, {})
+
+    def test_timed_out_key_is_forgotten(self):
+        request = Tagged(7)
+        self.machine.send(request, self.written.append)
+        self.machine._timed_out(request)
+
+        self.assertEqual(self.delegate.timeouts, [request])
+        self.assertEqual(self.machine._keyed_requests, {})
+
+    def test_unknown_keys_are_events(self):
+        request = Tagged(0)
+        self.machine.send(request, self.written.append)
+        self.machine._timed_out(request)
+
+        # Late replies, and replies for keys never sent, key 0 included.
+        self.machine.receive_data(b'0=Z\r5=Y\r')
+
+        self.assertEqual(self.delegate.responses, [])
+        self.assertEqual(
+            [event.value for event in self.delegate.events], [b'Z', b'Y'])
+
+    def test_key_zero(self):
+        request = Tagged(0)
+        self.machine.send(request, self.written.append)
+        self.machine.receive_data(b'0=Z\r')
+
+        self.assertEqual(self.delegate.responses[0][0], request)
+
+    def test_pending_key_is_not_completed(self):
+        self.machine.max_in_flight = 1
+        first, queued = Tagged(1), Tagged(2)
+        self.machine.send_many([first, queued], self.written.append)
+        self.machine.receive_data(b'2=B\r')
+
+        self.assertEqual(self.delegate.responses, [])
+        self.assertEqual(list(self.machine.pending_requests), [queued])
+
+    def test_duplicate_key(self):
+        self.machine.max_in_flight = 1
+        self.machine.send(Tagged(1), self.written.append)
+        self.machine.send(Tagged(2), self.written.append)
+
+        for tag in (1, 2):
+            with self.assertRaises(ValueError):
+                self.machine.send(Tagged(tag), self.written.append)
+
+        with self.assertRaises(ValueError):
+            self.machine.send_many(
+                [Tagged(3), Tagged(4), Tagged(3)], self.written.append)
+
+        self.assertEqual(len(self.machine.pending_requests), 1)
+        self.assertEqual(sorted(self.machine._keyed_requests), [1, 2])
+
+
+class TestIdempotentCoalescing(unittest.TestCase):
+
+    def setUp(self):
+        self.delegate = TestDelegate()
+        self.minder = MagicMock()
+        self.machine = EventMachine(
+            self.minder, self.delegate, terminator=b'\r')
+        self.medium = DelayedMedium(self.machine)
+
+    def test_waiting_and_pending_are_merged(self):
+        polls = [Poll(b'A') for _ in range(3)]
+        other = Poll(b'B')
+        self.machine.send(polls[0], self.medium.write)
+        self.machine.send(other, self.medium.write)
+        self.machine.send_many(polls[1:], self.medium.write)
+
+        self.assertEqual(self.medium.written, [b'GET A\r'])
+        self.assertEqual(list(self.machine.pending_requests), [other])
+        self.assertEqual(self.machine.coalesced_requests, 2)
+        self.assertEqual(self.machine.coalesced_bytes, 12)
+
+        self.medium.respond()
+
+        self.assertEqual(
+            [request for request, _ in self.delegate.responses], polls)
+        responses = {id(response) for _, response in self.delegate.responses}
+        self.assertEqual(len(responses), 1)
+        self.assertEqual(self.medium.written, [b'GET B\r'])
+
+    def test_new_transaction_after_completion(self):
+        first, second = Poll(b'A'), Poll(b'A')
+        self.machine.send(first, self.medium.write)
+        self.medium.respond()
+        self.machine.send(second, self.medium.write)
+
+        self.assertEqual(self.medium.written, [b'GET A\r'])
+        self.assertEqual(self.machine.coalesced_requests, 0)
+
+    def test_followers_time_out(self):
+        polls = [Poll(b'A'), Poll(b'A')]
+
+        for poll in polls:
+            self.machine.send(poll, self.medium.write)
+
+        self.machine._timed_out(polls[0])
+
+        self.assertEqual(self.delegate.timeouts, polls)
+        self.assertEqual(self.machine._idempotent_requests, {})
+        self.assertEqual(self.machine._followers, {})
+
+    def test_abandon_requests(self):
+        waiting, follower, pending = Poll(b'A'), Poll(b'A'), GET(b'B')
+
+        for request in (waiting, follower, pending):
+            self.machine.send(request, self.medium.write)
+
+        self.assertEqual(
+            self.machine.abandon_requests(), [waiting, pending, follower])
+        self.assertTrue(self.minder.remove.called)
+        self.assertEqual(self.machine.waiting_requests, {})
+        self.assertEqual(len(self.machine.pending_requests), 0)
+        self.assertEqual(self.machine._followers, {})
+
+        # The next request is written straight away.
+        self.machine.send(GET(b'A'), self.medium.write)
+        self.assertEqual(self.medium.written, [b'GET A\r'] * 2)
+
+    def test_not_merged_across_a_write(self):
+        # A poll sent after a SET must not share a response from before it.
+        first = Poll(b'A')
+        self.machine.send(first, self.medium.write)
+        self.machine.send(SET(b'A', b'Z'), self.medium.write)
+        second = Poll(b'A')
+        self.machine.send(second, self.medium.write)
+        third = Poll(b'A')
+        self.machine.send(third, self.medium.write)
+
+        self.assertEqual(self.machine.coalesced_requests, 1)
+
+        for _ in range(3):
+            self.medium.respond()
+
+        responses = {
+            id(request): response.value
+            for request, response in self.delegate.responses}
+        self.assertEqual(responses[id(first)], b'A')
+        self.assertEqual(responses[id(second)], b'Z')
+        self.assertEqual(responses[id(third)], b'Z')
+
+    def test_urgent_follower_is_not_held_back(self):
+        blocker, poll = GET(b'B'), Poll(b'A')
+        urgent = Poll(b'A')
+        urgent.priority = -1
+
+        for request in (blocker, poll, urgent):
+            self.machine.send(request, self.medium.write)
+
+        self.assertEqual(
+            list(self.machine.pending_requests), [urgent, poll])
+        self.assertEqual(self.machine.coalesced_requests, 0)
+
+        # A waiting leader can always be followed.
+        self.medium.respond()
+        late = Poll(b'A')
+        late.priority = -5
+        self.machine.send(late, self.medium.write)
+        self.assertEqual(self.machine.coalesced_requests, 1)
+
+    def test_plain_requests_are_not_merged(self):
+        for _ in range(2):
+            self.machine.send(GET(b'A'), self.medium.write)
+
+        self.assertEqual(len(self.machine.pending_requests), 1)
+        self.assertEqual(self.machine.coalesced_requests, 0)
+
+
+class Urgent(SET):
+    priority = -1
+
+
+class TestPriority(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.metrics = Metrics(timefunc=self.clock)
+        self.delegate = TestDelegate()
+        self.machine = EventMachine(
+            ManualEventMinder(self.clock), self.delegate, terminator=b'\r',
+            metrics=self.metrics)
+        self.medium = DelayedMedium(self.machine)
+
+    def test_priority_then_arrival(self):
+        polls = [GET(b'A') for _ in range(3)]
+        urgent = [Urgent(b'A', b'S'), Urgent(b'A', b'T')]
+
+        for request in polls[:2] + urgent[:1] + polls[2:] + urgent[1:]:
+            self.machine.send(request, self.medium.write)
+
+        self.assertEqual(
+            list(self.machine.pending_requests),
+            urgent + polls[1:])
+
+        for _ in range(5):
+            self.clock.now += 1.0
+            self.medium.respond()
+
+        self.assertEqual(
+            [request for request, _ in self.delegate.responses],
+            polls[:1] + urgent + polls[1:])
+
+        queue_wait = self.metrics.snapshot()['queue_wait']
+        self.assertEqual(queue_wait[-1]['count'], 2)
+        self.assertEqual(queue_wait[-1]['max'], 2.0)
+        self.assertEqual(queue_wait[0]['max'], 4.0)
+
+    def test_deadline_order(self):
+        first = GET(b'A')
+        late, early = GET(b'A'), GET(b'B')
+        late.deadline, early.deadline = 10.0, 5.0
+        plain = GET(b'A')
+
+        for request in (first, plain, late, early):
+            self.machine.send(request, self.medium.write)
+
+        self.assertEqual(
+            list(self.machine.pending_requests), [early, late, plain])
+
+    def test_expired_deadline_times_out(self):
+        first, expiring, last = GET(b'A'), GET(b'B'), GET(b'A')
+        expiring.deadline = 1.0
+
+        for request in (first, expiring, last):
+            self.machine.send(request, self.medium.write)
+
+        self.clock.now = 2.0
+        self.medium.respond()
+
+        self.assertEqual(self.delegate.timeouts, [expiring])
+        self.assertEqual(self.medium.written, [b'GET A\r'])
+        self.assertEqual(list(self.machine.waiting_requests), [last])
+
+    def test_deadline_passes_while_line_is_busy(self):
+        blocker, queued, later = GET(b'A'), GET(b'B'), GET(b'A')
+        blocker.timeout = None
+        queued.deadline = 0.5
+
+        for request in (blocker, queued, later):
+            self.machine.send(request, self.medium.write)
+
+        self.clock.now = 10.0
+        self.machine.event_minder.run()
+
+        self.assertEqual(self.delegate.timeouts, [queued])
+        self.assertEqual(list(self.machine.pending_requests), [later])
+
+        self.medium.respond()
+        self.assertEqual(list(self.machine.waiting_requests), [later])
+
+    def test_deadline_timer_cancelled_when_written(self):
+        first, queued = GET(b'A'), GET(b'B')
+        first.timeout = queued.timeout = None
+        queued.deadline = 5.0
+
+        for request in (first, queued):
+            self.machine.send(request, self.medium.write)
+
+        self.medium.respond()
+        self.assertEqual(self.machine._deadline_timers, {})
+
+        self.clock.now = 10.0
+        self.machine.event_minder.run()
+        self.assertEqual(self.delegate.timeouts, [])
+        self.assertEqual(list(self.machine.waiting_requests), [queued])
+
+
+class TestFraming(unittest.TestCase):
+
+    def setUp(self):
+        self.delegate = MagicMock()
+        self.delegate.event_for_data.return_value = (None, None)
+        self.machine = EventMachine(
+            MagicMock(), self.delegate, terminator=b'\r\n')
+
+    def _frames(self):
+        return [
+            call[0][0]
+            for call in self.delegate.event_for_data.call_args_list]
+
+    def test_frame_in_small_chunks(self):
+        frame = b'NOW A B B C\r\n'
+
+        for i in range(len(frame)):
+            self.machine.receive_data(frame[i:i + 1])
+
+        self.assertEqual(self._frames(), [frame])
+
+    def test_split_terminator(self):
+        events = self.machine.receive_data(b'ONE\r')
+        self.assertEqual(events, [])
+        self.assertFalse(self.delegate.event_for_data.called)
+
+        events = self.machine.receive_data(b'\nTWO\r\nTHR')
+        self.assertEqual(len(events), 2)
+        self.assertEqual(self._frames(), [b'ONE\r\n', b'TWO\r\n'])
+
+        self.machine.receive_data(b'EE\r\n')
+        self.assertEqual(self._frames()[-1], b'THREE\r\n')
+
+    def test_frame_views(self):
+        self.machine.frame_views = True
+        seen = []
+
+        def event_for_data(data, requests):
+            seen.append((type(data), data.readonly, bytes(data)))
+            return None, None
+
+        self.delegate.event_for_data.side_effect = event_for_data
+        self.machine.receive_data(b'ONE\r\nTWO\r\nTH')
+        self.machine.receive_data(b'REE\r\n')
+
+        self.assertEqual(seen, [
+            (memoryview, True, b'ONE\r\n'),
+            (memoryview, True, b'TWO\r\n'),
+            (memoryview, True, b'THREE\r\n')])
+        self.assertEqual(len(self.machine._input_buffer), 0)
+
+    def test_retained_frame_view(self):
+        self.machine.frame_views = True
+        kept = []
+
+        def event_for_data(data, requests):
+            kept.append(memoryview(data))
+            return None, None
+
+        self.delegate.event_for_data.side_effect = event_for_data
+        self.machine.receive_data(b'ONE\r\nTW')
+        self.machine.receive_data(b'O\r\n')
+
+        self.assertEqual([bytes(view) for view in kept], [
+            b'ONE\r\n', b'TWO\r\n'])
@@ -0,0 +1,129 @@
+import asyncio
+import unittest
+
+from serial_protocol.asyncio import AsyncIOEventMachineProtocol, \
+    RequestTimeout
+from serial_protocol.simulation import SimulatedDevice, SimulatedPort, \
+    create_simulated_connection
+from serial_protocol.threaded import ThreadedProtocol
+
+from .example_machine import ASCIIKVS, event_from_data, \
+    GET, SET, OKResponse, NOWResponse
+
+
+class TestSimulatedDevice(unittest.TestCase):
+
+    def test_latency(self):
+        device = SimulatedDevice(ASCIIKVS(), latency=0.5)
+
+        self.assertEqual(
+            device.received(b'GET A\rGET', 1.0), [(1.5, b'OK A A\r')])
+        self.assertEqual(
+            device.received(b' B\r', 2.0), [(2.5, b'OK B A\r')])
+
+    def test_latency_distribution(self):
+        device = SimulatedDevice(
+            ASCIIKVS(), latency=lambda random: random.choice([1.0, 2.0]),
+            jitter=0.1, seed=1)
+        times = [device.received(b'GET A\r', 0.0)[0][0] for _ in range(20)]
+
+        self.assertTrue(all(1.0 <= t <= 2.1 for t in times))
+        self.assertEqual(times, sorted(times))
+
+    def test_baud(self):
+        # 10 bits a byte at 1000 baud: 10ms per byte.
+        device = SimulatedDevice(ASCIIKVS(), baud=1000)
+        (first_time, first), = device.received(b'GET A\r', 0.0)
+        (second_time, _), = device.received(b'GET B\r', 0.0)
+
+        self.assertAlmostEqual(first_time, 0.06 + 0.07)
+        # Queued behind the first reply.
+        self.assertAlmostEqual(second_time, first_time + 0.07)
+
+    def test_fragmentation(self):
+        device = SimulatedDevice(ASCIIKVS(), max_chunk=3, seed=2)
+        deliveries = device.received(b'SET A Q\rGET A\r', 0.0)
+
+        self.assertTrue(all(len(chunk) <= 3 for _, chunk in deliveries))
+        self.assertEqual(
+            b''.join(chunk for _, chunk in deliveries),
+            b'OK A Q\rOK A Q\r')
+
+    def test_drop(self):
+        device = SimulatedDevice(ASCIIKVS(), drop_rate=0.5, seed=3)
+        deliveries = device.received(b'GET A\r' * 100, 0.0)
+        received = sum(len(chunk) for _, chunk in deliveries)
+
+        self.assertEqual(received + device.dropped_bytes, 700)
+        self.assertTrue(200 < device.dropped_bytes < 500)
+
+    def test_seed_repeats(self):
+        def run():
+            device = SimulatedDevice(
+                ASCIIKVS(), jitter=1.0, max_chunk=4, drop_rate=0.1, seed=7)
+            return device.received(b'GET A\r' * 10, 0.0)
+
+        self.assertEqual(run(), run())
+
+
+class TestSimulatedTransport(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+
+    def _connect(self, device):
+        return self.loop.run_until_complete(create_simulated_connection(
+            AsyncIOEventMachineProtocol.factory(
+                event_from_data, b'\r', loop=self.loop),
+            device, loop=self.loop))
+
+    def test_requests(self):
+        device = SimulatedDevice(
+            ASCIIKVS(), latency=0.005, baud=115200, max_chunk=2, seed=1)
+        transport, protocol = self._connect(device)
+
+        async def runner():
+            await protocol.send_request(SET(b'A', b'C'))
+            return await protocol.send_request(GET(b'A'))
+
+        response = self.loop.run_until_complete(runner())
+        self.assertIsInstance(response, OKResponse)
+        self.assertEqual(response.value, b'C')
+        transport.close()
+
+    def test_timeout(self):
+        device = SimulatedDevice(ASCIIKVS(), latency=0.5)
+        transport, protocol = self._connect(device)
+
+        with self.assertRaises(RequestTimeout):
+            self.loop.run_until_complete(protocol.send_request(GET(b'A')))
+
+        transport.close()
+
+    def test_broadcasts(self):
+        device = SimulatedDevice(ASCIIKVS(), broadcast_interval=0.01)
+        transport, protocol = self._connect(device)
+
+        event = self.loop.run_until_complete(protocol.get_latest_event())
+        self.assertIsInstance(event, NOWResponse)
+        transport.close()
+
+
+class TestSimulatedPort(unittest.TestCase):
+
+    def test_threaded_protocol(self):
+        device = SimulatedDevice(
+            ASCIIKVS(), latency=0.002, max_chunk=3, broadcast_interval=0.01,
+            seed=4)
+        port = SimulatedPort(device)
+        protocol = ThreadedProtocol(
+            event_from_data, b'\r', port.read, port.write)
+
+        response = protocol.send_request(SET(b'B', b'Z')).result(1.0)
+        self.assertEqual(response.value, b'Z')
+        self.assertIsInstance(
+            protocol.get_next_event(timeout=1.0), NOWResponse)
+
+        port.close()
+        protocol.read_thread.join(1.0)
+        self.assertFalse(protocol.read_thread.is_alive())
@@ -0,0 +1,131 @@
+import asyncio
+import unittest
+
+from serial_protocol.framing import SLIPFramer
+from serial_protocol.streams import EventPipeline, aiter_events, iter_events
+
+from .example_machine import ASCIIKVS, GET, OKResponse, NOWResponse, \
+    NOResponse, registry
+
+
+TRAFFIC = b'OK A Q\rNOW A Q B A\rjunk\rNO B A\rOK B C\rNOW A Q B C\r'
+
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class TestIterEvents(unittest.TestCase):
+
+    def test_events(self):
+        pairs = list(iter_events(chunked(TRAFFIC, 3), registry, b'\r'))
+
+        self.assertEqual(
+            [type(event) for event, _ in pairs],
+            [OKResponse, NOWResponse, NOResponse, OKResponse, NOWResponse])
+        self.assertTrue(all(request is None for _, request in pairs))
+
+    def test_lazy(self):
+        fed = []
+
+        def chunks():
+            for chunk in chunked(TRAFFIC, 7):
+                fed.append(chunk)
+                yield chunk
+
+        events = iter_events(chunks(), registry, b'\r')
+        event, _ = next(events)
+
+        self.assertIsInstance(event, OKResponse)
+        self.assertEqual(len(fed), 1)
+
+    def test_requests(self):
+        request = GET(b'A')
+        (event, paired), = iter_events(
+            [ASCIIKVS().feed(request.to_bytes())], registry, b'\r',
+            requests=[request])
+
+        self.assertIs(paired, request)
+
+    def test_pipeline(self):
+        pipeline = EventPipeline() \
+            .of_type(OKResponse, NOWResponse) \
+            .filter(lambda event: not isinstance(event, NOWResponse) or
+                    event.B == b'C') \
+            .map(lambda event: getattr(event, 'value', None) or event.B)
+
+        self.assertEqual(
+            [event for event, _ in iter_events(
+                [TRAFFIC], registry, b'\r', pipeline=pipeline)],
+            [b'Q', b'C', b'C'])
+        # Adding a stage left the first pipeline unchanged.
+        self.assertEqual(len(EventPipeline().map(str).stages), 1)
+        self.assertEqual(len(pipeline.stages), 3)
+
+    def test_framer(self):
+        data = b''.join(
+            SLIPFramer.encode(frame) for frame in (b'OK A \xc0\r', b'BAD\r'))
+        frames = list(iter_events(
+            chunked(data, 2), lambda data, requests: (data, None),
+            framer=SLIPFramer()))
+
+        self.assertEqual(
+            [event for event, _ in frames], [b'OK A \xc0\r', b'BAD\r'])
+
+    def test_max_frame_size(self):
+        events = iter_events(
+            [b'OK A Q\r', b'x' * 10, b'x' * 10], registry, b'\r',
+            max_frame_size=16)
+
+        self.assertIsInstance(next(events)[0], OKResponse)
+
+        with self.assertRaises(ValueError):
+            next(events)
+
+    def test_max_frame_size_after_frames(self):
+        events = iter_events(
+            [b'OK A Q\r' + b'x' * 20], registry, b'\r', max_frame_size=16)
+
+        self.assertIsInstance(next(events)[0], OKResponse)
+
+        with self.assertRaises(ValueError):
+            next(events)
+
+
+class TestAsyncIterEvents(unittest.TestCase):
+
+    def run_async(self, coroutine):
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        return loop.run_until_complete(coroutine)
+
+    def test_stream_reader(self):
+        async def collect():
+            reader = asyncio.StreamReader()
+
+            for chunk in chunked(TRAFFIC, 5):
+                reader.feed_data(chunk)
+
+            reader.feed_eof()
+            pipeline = EventPipeline().of_type(NOWResponse)
+
+            return [
+                event async for event, _ in aiter_events(
+                    reader, registry, b'\r', pipeline=pipeline,
+                    read_size=4)]
+
+        events = self.run_async(collect())
+
+        self.assertEqual([event.B for event in events], [b'A', b'C'])
+
+    def test_async_iterable(self):
+        async def chunks():
+            for chunk in chunked(TRAFFIC, 4):
+                yield chunk
+
+        async def collect():
+            return [
+                type(event) async for event, _ in aiter_events(
+                    chunks(), registry, b'\r')]
+
+        self.assertEqual(len(self.run_async(collect())), 5)
@@ -0,0 +1,181 @@
+import asyncio
+from queue import Empty
+import threading
+import unittest
+from unittest.mock import MagicMock
+
+from serial_protocol.asyncio import AsyncIOEventMachineProtocol
+from serial_protocol.subscriptions import Subscription, SubscriptionRouter
+from serial_protocol.threaded import ThreadedProtocol
+
+from .example_machine import event_from_data, \
+    AKVSEvent, NOWResponse, OKResponse
+
+
+class TestSubscriptionRouter(unittest.TestCase):
+
+    def setUp(self):
+        self.router = SubscriptionRouter()
+
+    def _subscribe(self, *classes, maxsize=256):
+        return self.router.add(
+            Subscription(self.router, classes, maxsize))
+
+    def test_routes_by_class(self):
+        now = self._subscribe(NOWResponse)
+        ok = self._subscribe(OKResponse)
+        everything = self._subscribe()
+        event = NOWResponse()
+
+        self.assertTrue(self.router.route(event))
+        self.assertEqual(list(now._events), [event])
+        self.assertEqual(list(ok._events), [])
+        self.assertEqual(list(everything._events), [event])
+
+    def test_subclasses_once(self):
+        subscription = self._subscribe(AKVSEvent, NOWResponse)
+        self.router.route(NOWResponse())
+
+        self.assertEqual(len(subscription._events), 1)
+
+    def test_unmatched(self):
+        self._subscribe(NOWResponse)
+
+        self.assertFalse(self.router.route(OKResponse()))
+        self.assertFalse(SubscriptionRouter().route(OKResponse()))
+
+    def test_close(self):
+        subscription = self._subscribe(NOWResponse)
+        self.router.route(NOWResponse())
+        subscription.close()
+
+        self.assertFalse(self.router.route(NOWResponse()))
+        self.assertEqual(len(subscription._events), 1)
+
+    def test_bounded(self):
+        subscription = self._subscribe(maxsize=2)
+        events = [NOWResponse() for _ in range(3)]
+
+        for event in events:
+            self.router.route(event)
+
+        self.assertEqual(list(subscription._events), events[1:])
+        self.assertEqual(subscription.dropped, 1)
+
+    def test_close_all(self):
+        subscriptions = [self._subscribe(NOWResponse), self._subscribe()]
+        self.router.close_all()
+
+        self.assertTrue(all(s.closed for s in subscriptions))
+        self.assertFalse(self.router.route(NOWResponse()))
+
+
+class TestAsyncIOSubscriptions(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+        self.protocol = AsyncIOEventMachineProtocol(
+            event_from_data, b'\r', loop=self.loop)
+        self.protocol.connection_made(MagicMock())
+
+    def test_fan_out(self):
+        received = {'a': [], 'b': []}
+
+        async def consume(name, subscription):
+            async for event in subscription:
+                received[name].append(event.A)
+
+        async def runner():
+            a = self.protocol.subscribe(NOWResponse)
+            b = self.protocol.subscribe(NOWResponse)
+            consumers = [
+                asyncio.ensure_future(consume('a', a)),
+                asyncio.ensure_future(consume('b', b))]
+            self.protocol.data_received(b'NOW A B B C\rNOW A D B C\r')
+            await asyncio.sleep(0)
+            a.close()
+            b.close()
+            await asyncio.gather(*consumers)
+
+        self.loop.run_until_complete(runner())
+        self.assertEqual(received, {'a': [b'B', b'D'], 'b': [b'B', b'D']})
+        self.assertTrue(self.protocol.event_queue.empty())
+
+    def test_unsubscribed_events_are_queued(self):
+        async def runner():
+            async with self.protocol.subscribe(OKResponse) as subscription:
+                self.protocol.data_received(b'NOW A B B C\r')
+            return subscription
+
+        subscription = self.loop.run_until_complete(runner())
+        self.assertTrue(subscription.closed)
+        self.assertIsInstance(
+            self.protocol.event_queue.get_nowait(), NOWResponse)
+
+    def test_connection_lost_ends_iteration(self):
+        received = []
+
+        async def consume(subscription):
+            async for event in subscription:
+                received.append(event.A)
+
+        async def runner():
+            consumer = asyncio.ensure_future(
+                consume(self.protocol.subscribe(NOWResponse)))
+            self.protocol.data_received(b'NOW A B B C\r')
+            await asyncio.sleep(0)
+            self.protocol.connection_lost(None)
+            await asyncio.wait_for(consumer, 1.0)
+
+        self.loop.run_until_complete(runner())
+        self.assertEqual(received, [b'B'])
+
+
+class TestThreadedSubscriptions(unittest.TestCase):
+
+    def setUp(self):
+        self.stop = threading.Event()
+        self.protocol = ThreadedProtocol(
+            event_from_data, b'\r', self._read, lambda data: None)
+
+    def tearDown(self):
+        self.stop.set()
+
+    def _read(self):
+        self.stop.wait()
+        raise OSError('closed')
+
+    def test_iterate(self):
+        subscription = self.protocol.subscribe(NOWResponse)
+        received = []
+        consumer = threading.Thread(
+            target=lambda: received.extend(event.B for event in subscription))
+        consumer.start()
+
+        self.protocol.receive_data(b'NOW A B B C\rNOW A B B D\r')
+        subscription.close()
+        consumer.join(1.0)
+
+        self.assertEqual(received, [b'C', b'D'])
+
+    def test_get_timeout(self):
+        with self.protocol.subscribe(NOWResponse) as subscription:
+            with self.assertRaises(Empty):
+                subscription.get(timeout=0.01)
+
+            self.protocol.receive_data(b'NOW A B B C\r')
+            self.assertIsInstance(subscription.get(timeout=1.0), NOWResponse)
+
+    def test_connection_lost_ends_iteration(self):
+        subscription = self.protocol.subscribe(NOWResponse)
+        received = []
+        consumer = threading.Thread(
+            target=lambda: received.extend(event.B for event in subscription))
+        consumer.start()
+
+        self.protocol.receive_data(b'NOW A B B C\r')
+        self.protocol.connection_lost(None)
+        consumer.join(1.0)
+
+        self.assertFalse(consumer.is_alive())
+        self.assertEqual(received, [b'C'])
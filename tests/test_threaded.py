@@ -0,0 +1,261 @@
+import logging
+import socket
+import threading
+import unittest
+
+from serial_protocol.metrics import Metrics
+from serial_protocol.threaded import \
+    ThreadedEventMinder, ThreadedProtocol, SelectorLoop, RequestTimeout
+
+from .example_machine import ASCIIKVS, event_from_data, \
+    GET, SET, OKResponse, NOResponse, NOWResponse
+
+
+class SimulatedDevice:
+    # Answers commands on one end of a socket pair from a thread of its own.
+
+    def __init__(self, sock, respond=True):
+        self.sock = sock
+        self.simulator = ASCIIKVS()
+        self.respond = respond
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        buffer = b''
+
+        while True:
+            try:
+                data = self.sock.recv(4096)
+            except OSError:
+                return
+
+            if not data:
+                return
+
+            *commands, buffer = (buffer + data).split(b'\r')
+
+            if self.respond:
+                self.sock.sendall(b''.join(
+                    self.simulator.feed(command + b'\r')
+                    for command in commands))
+
+    def broadcast(self):
+        self.sock.sendall(self.simulator.broadcast())
+
+
+class TestThreadedEventMinder(unittest.TestCase):
+
+    def test_notify_after(self):
+        minder = ThreadedEventMinder()
+        fired = threading.Event()
+        minder.notify_after(0.01, fired.set)
+
+        self.assertTrue(fired.wait(1.0))
+        minder.close()
+
+    def test_earlier_deadline_wakes_timer(self):
+        minder = ThreadedEventMinder()
+        late, early = threading.Event(), threading.Event()
+        minder.notify_after(10.0, late.set)
+        minder.notify_after(0.01, early.set)
+
+        self.assertTrue(early.wait(1.0))
+        self.assertFalse(late.is_set())
+        minder.close()
+
+    def test_remove(self):
+        minder = ThreadedEventMinder()
+        fired = threading.Event()
+        event = minder.notify_after(0.01, fired.set)
+        minder.remove(event)
+
+        self.assertFalse(fired.wait(0.05))
+        minder.close()
+
+    def test_failing_callback(self):
+        minder = ThreadedEventMinder()
+        fired = threading.Event()
+
+        def fail():
+            raise RuntimeError('callback failed')
+
+        minder.notify_after(0.01, fail)
+        minder.notify_after(0.02, fired.set)
+
+        with self.assertLogs('serial_protocol.threaded', logging.ERROR):
+            self.assertTrue(fired.wait(1.0))
+
+        minder.close()
+
+
+class TestThreadedProtocol(unittest.TestCase):
+
+    def setUp(self):
+        self.client, server = socket.socketpair()
+        self.device = SimulatedDevice(server)
+        self.protocol = ThreadedProtocol(
+            event_from_data, b'\r',
+            lambda: self.client.recv(4096), self.client.sendall)
+
+    def tearDown(self):
+        self.client.close()
+        self.device.sock.close()
+
+    def test_request(self):
+        response = self.protocol.send_request(SET(b'A', b'Q')).result(1.0)
+
+        self.assertIsInstance(response, OKResponse)
+        self.assertEqual(response.value, b'Q')
+
+    def test_requests(self):
+        futures = self.protocol.send_requests(
+            [SET(b'B', b'X'), GET(b'B'), SET(b'B', b'1')])
+        responses = [f.result(1.0) for f in futures]
+
+        self.assertEqual(
+            [type(r) for r in responses],
+            [OKResponse, OKResponse, NOResponse])
+        self.assertEqual(responses[1].value, b'X')
+
+    def test_broadcast(self):
+        self.device.broadcast()
+
+        self.assertIsInstance(
+            self.protocol.get_next_event(timeout=1.0), NOWResponse)
+
+    def test_closed_port_fails_requests(self):
+        self.device.respond = False
+        request = GET(b'A')
+        request.timeout = None
+        f = self.protocol.send_request(request)
+        self.client.shutdown(socket.SHUT_RDWR)
+
+        with self.assertRaises(OSError):
+            f.result(1.0)
+
+
+class TestSelectorLoop(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = SelectorLoop()
+        self.pairs = []
+
+    def tearDown(self):
+        self.loop.close()
+
+        for client, server in self.pairs:
+            client.close()
+            server.close()
+
+    def open(self, respond=True, event_parser=event_from_data, **options):
+        client, server = socket.socketpair()
+        self.pairs.append((client, server))
+        device = SimulatedDevice(server, respond)
+        protocol = self.loop.open(client, event_parser, b'\r', **options)
+        return protocol, device
+
+    def test_many_ports(self):
+        ports = [self.open() for _ in range(10)]
+        futures = [
+            protocol.send_request(SET(b'A', bytes([0x41 + i])))
+            for i, (protocol, _) in enumerate(ports)]
+
+        for i, f in enumerate(futures):
+            self.assertEqual(f.result(1.0).value, bytes([0x41 + i]))
+
+    def test_timeout(self):
+        protocol, _ = self.open(respond=False)
+        request = GET(b'A')
+        f = protocol.send_request(request)
+
+        with self.assertRaises(RequestTimeout) as cm:
+            f.result(1.0)
+
+        self.assertIs(cm.exception.request, request)
+
+    def test_broadcast(self):
+        protocol, device = self.open()
+        device.broadcast()
+
+        self.assertIsInstance(
+            protocol.get_next_event(timeout=1.0), NOWResponse)
+
+    def test_large_write(self):
+        requests = [GET(b'A') for _ in range(5000)]
+
+        for request in requests:
+            request.timeout = None
+
+        # One write of every request, more than the socket buffer takes.
+        protocol, device = self.open(max_in_flight=len(requests))
+        client = self.pairs[-1][0]
+        client.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        self.assertGreater(
+            len(requests) * len(b'GET A\r'),
+            client.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF))
+
+        deferred = []
+        want_write = self.loop._want_write
+        self.loop._want_write = lambda protocol, enabled: (
+            deferred.append(enabled), want_write(protocol, enabled))
+        futures = protocol.send_requests(requests)
+
+        self.assertIsInstance(futures[-1].result(5.0), OKResponse)
+        # The rest was written by the I/O thread once writable.
+        self.assertEqual(deferred[0], True)
+        self.assertEqual(deferred[-1], False)
+
+    def test_cancelled_future(self):
+        protocol, _ = self.open()
+        protocol.send_request(GET(b'A')).cancel()
+
+        self.assertIsInstance(
+            protocol.send_request(GET(b'B')).result(1.0), OKResponse)
+        self.assertFalse(protocol.closed)
+
+    def test_parser_error_closes_one_port(self):
+        def broken(data, requests):
+            raise ValueError('bad frame')
+
+        broken_protocol, _ = self.open(event_parser=broken)
+        protocol, _ = self.open()
+
+        with self.assertLogs('serial_protocol.threaded', logging.ERROR):
+            f = broken_protocol.send_request(GET(b'A'))
+
+            with self.assertRaises(ValueError):
+                f.result(1.0)
+
+        self.assertTrue(broken_protocol.closed)
+        self.assertIsInstance(
+            protocol.send_request(GET(b'A')).result(1.0), OKResponse)
+
+    def test_eof_fails_requests(self):
+        protocol, device = self.open(respond=False)
+        request = GET(b'A')
+        request.timeout = None
+        f = protocol.send_request(request)
+        device.sock.shutdown(socket.SHUT_WR)
+
+        with self.assertRaises(ConnectionError):
+            f.result(1.0)
+
+    def test_eof_unregisters(self):
+        protocol, device = self.open()
+        lost = threading.Event()
+        protocol.connection_lost = lambda exc: lost.set()
+        device.sock.shutdown(socket.SHUT_WR)
+
+        self.assertTrue(lost.wait(1.0))
+        self.assertTrue(protocol.closed)
+
+    def test_metrics(self):
+        protocol, _ = self.open(metrics=Metrics())
+        protocol.send_request(GET(b'A')).result(1.0)
+
+        with protocol.lock:
+            snapshot = protocol.metrics.snapshot()
+
+        self.assertEqual(snapshot['requests_completed'], 1)
+        self.assertEqual(snapshot['bytes_in'], len(b'OK A A\r'))
@@ -1,7 +1,131 @@
 import unittest
+from unittest.mock import MagicMock
 
-from serial_protocol.timing import EventMinder
+from serial_protocol.timing import EventMinder, Scheduler, TimerHeap
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class ManualEventMinder(EventMinder):
+
+    def __init__(self, clock, **options):
+        super().__init__(timefunc=clock, **options)
+        self.delays = []
+
+    def reset_timer(self):
+        self.delays.append(self._next_event_delay())
 
 
 class EventMinderTests(unittest.TestCase):
-    pass
+    queue_class = Scheduler
+
+    def setUp(self):
+        self.clock = Clock()
+        self.minder = ManualEventMinder(
+            self.clock, queue_class=self.queue_class)
+
+    def test_notify_after(self):
+        mock = MagicMock()
+        self.minder.notify_after(1.0, mock.callable, 1, key='a')
+
+        self.assertEqual(self.minder.delays, [1.0])
+        self.minder.run()
+        self.assertFalse(mock.callable.called)
+
+        self.clock.now = 1.0
+        self.minder.run()
+        mock.callable.assert_called_once_with(1, key='a')
+        self.assertIsNone(self.minder.delays[-1])
+
+    def test_notify_at(self):
+        mock = MagicMock()
+        self.clock.now = 5.0
+        self.minder.notify_at(7.5, mock.callable)
+
+        self.assertEqual(self.minder.delays, [2.5])
+
+    def test_order(self):
+        calls = []
+        self.minder.notify_after(3.0, calls.append, 3)
+        self.minder.notify_after(1.0, calls.append, 1)
+        self.minder.notify_after(2.0, calls.append, 2)
+
+        self.assertEqual(self.minder._next_event_delay(), 1.0)
+        self.clock.now = 2.0
+        self.minder.run()
+        self.assertEqual(calls, [1, 2])
+        self.assertEqual(self.minder._next_event_delay(), 1.0)
+
+    def test_remove(self):
+        mock = MagicMock()
+        first = self.minder.notify_after(1.0, mock.first)
+        self.minder.notify_after(2.0, mock.second)
+        self.minder.remove(first)
+
+        self.assertEqual(self.minder.delays[-1], 2.0)
+        self.clock.now = 3.0
+        self.minder.run()
+        self.assertFalse(mock.first.called)
+        self.assertTrue(mock.second.called)
+        self.assertIsNone(self.minder._next_event_delay())
+
+
+class TimerHeapEventMinderTests(EventMinderTests):
+    queue_class = TimerHeap
+
+    def test_cancel_is_lazy(self):
+        mock = MagicMock()
+        events = [
+            self.minder.notify_after(float(i), mock.callable, i)
+            for i in range(100)]
+
+        for event in events[:70]:
+            self.minder.remove(event)
+
+        # Rebuilt once cancelled entries made up more than half of the heap.
+        self.assertLess(len(self.minder._sched._heap), 100)
+        self.assertEqual(len(self.minder._sched), 30)
+
+        self.clock.now = 100.0
+        self.minder.run()
+        self.assertEqual(
+            [call[0][0] for call in mock.callable.call_args_list],
+            list(range(70, 100)))
+        self.assertEqual(len(self.minder._sched._heap), 0)
+
+    def test_callback_cancels_many(self):
+        # Enough later timers are cancelled for the heap to be rebuilt while
+        # `run` is going through it.
+        calls = []
+        events = [
+            self.minder.notify_after(2.0 + i, calls.append, i)
+            for i in range(40)]
+
+        def cancel_later():
+            calls.append('cancel')
+            for event in events[6:]:
+                self.minder.remove(event)
+
+        self.minder.notify_after(1.0, cancel_later)
+        self.clock.now = 100.0
+        self.minder.run()
+
+        self.assertEqual(calls, ['cancel'] + list(range(6)))
+        self.assertEqual(len(self.minder._sched), 0)
+        self.assertEqual(self.minder._sched._cancelled, 0)
+
+    def test_remove_after_run(self):
+        mock = MagicMock()
+        event = self.minder.notify_after(1.0, mock.callable)
+        self.clock.now = 1.0
+        self.minder.run()
+        self.minder.remove(event)
+
+        self.assertEqual(len(self.minder._sched), 0)